@@ -0,0 +1,104 @@
+"""
+GUI-free EZVIZ Open API tooling shared by gui.py and headless scripts
+"""
+
+from .alarms import AlarmEvent, AlarmPoller, attach_streams
+from .batch import BatchResult, fetch_url, generate_urls, read_stream_requests
+from .bench import BenchResult, run_benchmarks
+from .broker import StreamBroker
+from .cache import AddressCache
+from .client import (
+    DEFAULT_BASE_URL,
+    EzvizClient,
+    StreamRequest,
+    create_session,
+    parse_protocol,
+    parse_quality,
+)
+from .discovery import ChannelRecord, DeviceIndex, DeviceRecord, discover
+from .errorcodes import FATAL, RETRYABLE, THROTTLED, classify_code
+from .exceptions import (
+    EzvizApiError,
+    EzvizAuthError,
+    EzvizError,
+    EzvizPoolError,
+    EzvizRateLimitError,
+)
+from .export import ExportResult, PlaybackExport, export_playback, plan_chunks
+from .metrics import CallRecord, Instrumentation, Metrics
+from .mockserver import MockEzvizServer
+from .pool import ClientPool
+from .probe import ProbeResult, StreamProber, probe_streams
+from .ptz import PtzCommand, PtzResult, dispatch_ptz
+from .recorder import HlsRecorder, RecordingResult, record
+from .retry import RateLimiter, RetryPolicy, TokenBucket
+from .settings import ConfigSync, SettingResult, apply_settings
+from .singleflight import AsyncSingleFlight, SingleFlight
+from .store import SnapshotStore, StoredAddressCache, SyncResult, sync
+from .tokens import Token, TokenCache, TokenManager
+
+__all__ = [
+    "AddressCache",
+    "AlarmEvent",
+    "AlarmPoller",
+    "AsyncSingleFlight",
+    "BatchResult",
+    "BenchResult",
+    "CallRecord",
+    "ConfigSync",
+    "ChannelRecord",
+    "ClientPool",
+    "DEFAULT_BASE_URL",
+    "DeviceIndex",
+    "DeviceRecord",
+    "EzvizApiError",
+    "EzvizAuthError",
+    "EzvizClient",
+    "EzvizError",
+    "EzvizPoolError",
+    "EzvizRateLimitError",
+    "ExportResult",
+    "FATAL",
+    "HlsRecorder",
+    "Instrumentation",
+    "Metrics",
+    "MockEzvizServer",
+    "PlaybackExport",
+    "ProbeResult",
+    "PtzCommand",
+    "PtzResult",
+    "RETRYABLE",
+    "RateLimiter",
+    "RecordingResult",
+    "RetryPolicy",
+    "SettingResult",
+    "SingleFlight",
+    "SnapshotStore",
+    "StoredAddressCache",
+    "StreamBroker",
+    "StreamProber",
+    "StreamRequest",
+    "SyncResult",
+    "THROTTLED",
+    "Token",
+    "TokenBucket",
+    "TokenCache",
+    "TokenManager",
+    "apply_settings",
+    "attach_streams",
+    "classify_code",
+    "create_session",
+    "discover",
+    "dispatch_ptz",
+    "export_playback",
+    "fetch_url",
+    "generate_urls",
+    "parse_protocol",
+    "plan_chunks",
+    "parse_quality",
+    "probe_streams",
+    "read_stream_requests",
+    "record",
+    "run_benchmarks",
+    "sync",
+]
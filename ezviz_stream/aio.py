@@ -0,0 +1,294 @@
+"""
+asyncio EZVIZ Open API client
+Mirrors EzvizClient on top of one shared aiohttp connection pool
+"""
+
+import asyncio
+import logging
+import time
+
+import aiohttp
+
+from .client import (
+    CAMERA_LIST_PATH,
+    DEFAULT_BASE_URL,
+    DEFAULT_POOL_MAXSIZE,
+    DEFAULT_TIMEOUT,
+    DEVICE_CAMERA_LIST_PATH,
+    DEVICE_CAPACITY_PATH,
+    DEVICE_INFO_PATH,
+    DEVICE_LIST_PATH,
+    FORM_HEADERS,
+    LIVE_ADDRESS_PATH,
+    SUCCESS_CODE,
+    TOKEN_EXPIRED_CODE,
+    TOKEN_PATH,
+    check_response,
+)
+from .errorcodes import THROTTLED
+from .exceptions import EzvizApiError, EzvizAuthError, EzvizError
+from .metrics import NO_INSTRUMENTATION
+from .retry import RetryPolicy
+from .singleflight import AsyncSingleFlight
+from .tokens import DEFAULT_REFRESH_MARGIN, RefreshSchedule, Token, TokenCache
+
+logger = logging.getLogger(__name__)
+
+# Total connections across all hosts
+DEFAULT_CONNECTION_LIMIT = 100
+KEEPALIVE_TIMEOUT = 60
+
+
+def create_connector(limit=DEFAULT_CONNECTION_LIMIT, limit_per_host=DEFAULT_POOL_MAXSIZE):
+    """Create a keep-alive connector; must be called with a running event loop"""
+    return aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host,
+                                keepalive_timeout=KEEPALIVE_TIMEOUT, ttl_dns_cache=300)
+
+
+class AsyncEzvizClient:
+    """asyncio counterpart of EzvizClient
+
+    The aiohttp session is created lazily on first use, so the client can be
+    constructed outside a running event loop. Pass session to share one pool
+    between several clients, token_cache to share tokens with other clients
+    (sync or async) using the same appKey, and address_cache to serve
+    still-valid stream URLs locally. Tokens are renewed on the same
+    RefreshSchedule as TokenManager uses. Identical concurrent address lookups
+    always share one in-flight call. retry_policy, rate_limiter and
+    instrumentation behave as on EzvizClient, sleeping with asyncio instead
+    of blocking.
+    """
+
+    def __init__(self, app_key=None, app_secret=None, access_token=None, area_domain=None,
+                 base_url=DEFAULT_BASE_URL, timeout=DEFAULT_TIMEOUT,
+                 limit=DEFAULT_CONNECTION_LIMIT, limit_per_host=DEFAULT_POOL_MAXSIZE,
+                 session=None, token_cache=None, refresh_margin=DEFAULT_REFRESH_MARGIN,
+                 address_cache=None, retry_policy=None, rate_limiter=None,
+                 instrumentation=None):
+        self.app_key = app_key
+        self.app_secret = app_secret
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.session = session
+        self._owns_session = session is None
+        self._auth_lock = None
+        self._refresh_task = None
+        self.token_cache = token_cache if token_cache is not None else TokenCache()
+        self.token_schedule = RefreshSchedule(refresh_margin)
+        self.address_cache = address_cache
+        self._address_flight = AsyncSingleFlight()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limiter = rate_limiter
+        self.instrumentation = instrumentation or NO_INSTRUMENTATION
+
+        self.access_token = access_token
+        self.area_domain = area_domain.rstrip("/") if area_domain else None
+        self.token_expire_time = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Release pooled connections"""
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    @property
+    def refresh_margin(self):
+        return self.token_schedule.refresh_margin
+
+    @property
+    def can_authenticate(self):
+        return bool(self.app_key and self.app_secret)
+
+    def _get_session(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=create_connector(self.limit, self.limit_per_host),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers=FORM_HEADERS,
+            )
+        return self.session
+
+    async def _post(self, url, data):
+        form = {key: str(value) for key, value in data.items()}
+        try:
+            async with self._get_session().post(url, data=form) as response:
+                try:
+                    result = await response.json(content_type=None)
+                except ValueError:
+                    result = None
+                status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise EzvizApiError(f"Request to {url} failed: {e!r}") from e
+        return check_response(url, status, result)
+
+    async def fetch_token(self):
+        """Request a new Token from /api/lapp/token/get"""
+        url = self.base_url + TOKEN_PATH
+        record = self.instrumentation.start(TOKEN_PATH)
+        sent = time.perf_counter()
+        try:
+            result = await self._post(url, {"appKey": self.app_key, "appSecret": self.app_secret})
+        except EzvizApiError as e:
+            record.attempt(self.base_url, time.perf_counter() - sent, e.code)
+            self.instrumentation.on_call(record.finish(e))
+            raise EzvizAuthError(f"Authentication failed: {e.message}",
+                                 code=e.code, response=e.response) from e
+        record.attempt(self.base_url, time.perf_counter() - sent, SUCCESS_CODE)
+        self.instrumentation.on_call(record.finish())
+        return Token.from_response(result["data"], self.base_url)
+
+    def _apply_token(self, token):
+        self.access_token = token.access_token
+        self.area_domain = token.area_domain
+        self.token_expire_time = token.expire_time
+
+    async def _refresh(self, stale=None):
+        """Fetch a token unless another task replaced the stale one while we waited"""
+        if self._auth_lock is None:
+            self._auth_lock = asyncio.Lock()
+        async with self._auth_lock:
+            token = self.token_cache.get(self.app_key)
+            if token is not None and token != stale and \
+                    self.token_schedule.due_in(self.app_key, token) > 0:
+                self._apply_token(token)
+                return token
+            token = await self.fetch_token()
+            self.token_cache.put(self.app_key, token)
+            self.token_schedule.renewed(self.app_key, token)
+            self._apply_token(token)
+            return token
+
+    async def _background_refresh(self, stale):
+        try:
+            await self._refresh(stale)
+        except (EzvizError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # The current token is still valid; the next caller will retry
+            logger.warning("Background token refresh for %s failed: %s", self.app_key, e)
+        finally:
+            self._refresh_task = None
+
+    async def authenticate(self):
+        """Fetch a new access token and area domain using the app credentials"""
+        if not self.can_authenticate:
+            raise EzvizAuthError("Cannot authenticate: no app_key/app_secret provided")
+        return await self._refresh(self.token_cache.get(self.app_key))
+
+    def token_expired(self):
+        """Whether the current token is missing or past its expireTime (milliseconds)"""
+        if not self.access_token:
+            return True
+        if self.token_expire_time is None:
+            return False
+        return time.time() * 1000 >= self.token_expire_time
+
+    async def ensure_token(self):
+        """Make sure a usable token is loaded, sharing one renewal between waiters
+
+        A token that is due for renewal keeps being used while a single
+        background task renews it.
+        """
+        if not self.can_authenticate:
+            if self.token_expired():
+                if self.access_token:
+                    raise EzvizAuthError("Access token expired and no app credentials to renew it")
+                raise EzvizAuthError("Cannot authenticate: no app_key/app_secret provided")
+            return
+        token = self.token_cache.get(self.app_key)
+        if token is None or token.expires_in() <= 0:
+            await self._refresh(token)
+            return
+        self._apply_token(token)
+        if self._refresh_task is None and self.token_schedule.due_in(self.app_key, token) <= 0:
+            self._refresh_task = asyncio.ensure_future(self._background_refresh(token))
+
+    async def post(self, path, data=None):
+        """POST to an authenticated endpoint on the area domain and return the full response"""
+        record = self.instrumentation.start(path)
+        attempt = 0
+        renewed = False
+        while True:
+            await self.ensure_token()
+            access_token, area_domain = self.access_token, self.area_domain
+            limiter_key = (self.app_key or access_token, area_domain)
+            if self.rate_limiter is not None:
+                waited = time.perf_counter()
+                await self.rate_limiter.acquire_async(limiter_key)
+                record.waited(time.perf_counter() - waited)
+            sent = time.perf_counter()
+            try:
+                result = await self._post_with_token(path, data, access_token, area_domain)
+            except EzvizApiError as e:
+                record.attempt(area_domain, time.perf_counter() - sent, e.code)
+                if e.code == TOKEN_EXPIRED_CODE and self.can_authenticate and not renewed:
+                    # Another task may already have replaced the rejected token
+                    self.token_cache.remove(self.app_key, access_token)
+                    renewed = True
+                    continue
+                attempt += 1
+                kind = self.retry_policy.classify(e)
+                if kind == THROTTLED and self.rate_limiter is not None:
+                    self.rate_limiter.on_throttled(limiter_key)
+                if not self.retry_policy.should_retry(kind, attempt):
+                    self.instrumentation.on_call(record.finish(e))
+                    raise
+                delay = self.retry_policy.delay(kind, attempt)
+                record.retry(delay)
+                await asyncio.sleep(delay)
+                continue
+            record.attempt(area_domain, time.perf_counter() - sent, SUCCESS_CODE)
+            self.instrumentation.on_call(record.finish())
+            if self.rate_limiter is not None:
+                self.rate_limiter.on_success(limiter_key)
+            return result
+
+    async def _post_with_token(self, path, data, access_token, area_domain):
+        payload = {"accessToken": access_token}
+        if data:
+            payload.update(data)
+        return await self._post((area_domain or self.base_url) + path, payload)
+
+    async def get_live_address(self, request, use_cache=True):
+        """Get a live or playback address for a StreamRequest"""
+        cache = self.address_cache if use_cache else None
+        if cache is not None:
+            cached = cache.get(request)
+            self.instrumentation.on_cache(LIVE_ADDRESS_PATH, cached is not None)
+            if cached is not None:
+                return cached
+        key = (self.app_key or self.access_token, request)
+        return await self._address_flight.do(key, self._fetch_live_address, request)
+
+    async def _fetch_live_address(self, request):
+        fetched_at = time.time()
+        result = await self.post(LIVE_ADDRESS_PATH, request.to_params())
+        if self.address_cache is not None:
+            self.address_cache.put(request, result, fetched_at)
+        return result
+
+    async def get_device_list(self, page_start=0, page_size=10):
+        """List devices on the account, one page at a time"""
+        return await self.post(DEVICE_LIST_PATH, {"pageStart": page_start, "pageSize": page_size})
+
+    async def get_camera_list(self, page_start=0, page_size=10):
+        """List cameras (channels) on the account, one page at a time"""
+        return await self.post(CAMERA_LIST_PATH, {"pageStart": page_start, "pageSize": page_size})
+
+    async def get_device_info(self, device_serial):
+        """Get details of a single device"""
+        return await self.post(DEVICE_INFO_PATH, {"deviceSerial": device_serial})
+
+    async def get_device_camera_list(self, device_serial):
+        """List the channels of a single device"""
+        return await self.post(DEVICE_CAMERA_LIST_PATH, {"deviceSerial": device_serial})
+
+    async def get_device_capacity(self, device_serial):
+        """Get the capability set of a single device"""
+        return await self.post(DEVICE_CAPACITY_PATH, {"deviceSerial": device_serial})
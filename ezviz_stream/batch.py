@@ -0,0 +1,150 @@
+"""
+Bulk stream URL generation for a fleet of devices
+Requests run on a bounded worker pool and results are yielded as they complete
+"""
+
+import csv
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Optional
+
+from .client import StreamRequest, parse_protocol, parse_quality
+from .exceptions import EzvizError
+
+DEFAULT_MAX_IN_FLIGHT = 8
+
+CSV_COLUMNS = ("device_serial", "channel_no", "protocol", "quality", "expire_time")
+
+
+@dataclass
+class BatchResult:
+    """Outcome of one live/address/get call in a batch"""
+
+    request: StreamRequest
+    response: Optional[dict] = None
+    error: Optional[str] = None
+    code: Optional[str] = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def to_json(self):
+        """Flat record for JSONL output"""
+        record = {
+            "deviceSerial": self.request.device_serial,
+            "channelNo": self.request.channel_no,
+            "protocol": self.request.protocol,
+            "quality": self.request.quality,
+            "ok": self.ok,
+            "elapsedMs": round(self.elapsed * 1000, 1),
+        }
+        if self.ok:
+            data = self.response.get("data") or {}
+            record["url"] = data.get("url")
+            record["id"] = data.get("id")
+            record["expireTime"] = data.get("expireTime")
+        else:
+            record["code"] = self.code
+            record["error"] = self.error
+        return record
+
+
+def parse_target(value, protocol=2, quality=1, expire_time=None):
+    """Parse a SERIAL[:CHANNEL] command line target into a StreamRequest"""
+    serial, _, channel = value.strip().partition(":")
+    return StreamRequest(serial, int(channel or 1), protocol, quality, expire_time)
+
+
+def read_stream_requests(lines, protocol=2, quality=1, expire_time=None):
+    """Read StreamRequests from CSV lines
+
+    Columns are device_serial, channel_no, protocol, quality, expire_time; all but
+    the serial are optional and fall back to the given defaults. A header row,
+    blank lines and lines starting with # are skipped.
+    """
+    for row in csv.reader(lines):
+        if not row or not row[0].strip() or row[0].lstrip().startswith("#"):
+            continue
+        if row[0].strip() in ("device_serial", "deviceSerial"):
+            continue
+        row = [cell.strip() for cell in row] + [""] * (len(CSV_COLUMNS) - len(row))
+        serial, channel, row_protocol, row_quality, row_expire = row[:len(CSV_COLUMNS)]
+        yield StreamRequest(
+            serial,
+            int(channel or 1),
+            parse_protocol(row_protocol) if row_protocol else protocol,
+            parse_quality(row_quality) if row_quality else quality,
+            int(row_expire) if row_expire else expire_time,
+        )
+
+
+def fetch_url(client, request):
+    """Fetch one stream URL, returning a BatchResult instead of raising EzvizError"""
+    start = time.perf_counter()
+    try:
+        response = client.get_live_address(request)
+        return BatchResult(request, response=response, elapsed=time.perf_counter() - start)
+    except EzvizError as e:
+        return BatchResult(request, response=e.response, error=e.message, code=e.code,
+                           elapsed=time.perf_counter() - start)
+
+
+def bounded_map(fn, items, max_in_flight=DEFAULT_MAX_IN_FLIGHT, executor=None,
+                thread_name_prefix="ezviz-batch"):
+    """Yield fn(item) for every item in completion order, with at most max_in_flight running
+
+    items is consumed lazily, so arbitrarily long iterables can be streamed
+    through. Without an executor a pool of max_in_flight threads is created
+    for the duration of the iteration.
+    """
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1")
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=max_in_flight,
+                                      thread_name_prefix=thread_name_prefix)
+    pending = set()
+    try:
+        for item in items:
+            pending.add(executor.submit(fn, item))
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def generate_urls(client, requests, max_in_flight=DEFAULT_MAX_IN_FLIGHT, executor=None):
+    """Fetch stream URLs for many requests, yielding BatchResults in completion order
+
+    At most max_in_flight calls are outstanding at any time and the input is
+    consumed lazily, so arbitrarily long iterables can be streamed through.
+    """
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1")
+    # Authenticate once up front rather than from every worker at the same time
+    client.ensure_token()
+    yield from bounded_map(lambda request: fetch_url(client, request), requests,
+                           max_in_flight, executor)
+
+
+def write_jsonl(results, fp):
+    """Write results as JSON lines, flushing after each so consumers see them immediately"""
+    count = 0
+    for result in results:
+        fp.write(json.dumps(result.to_json()) + "\n")
+        fp.flush()
+        count += 1
+    return count
@@ -0,0 +1,204 @@
+"""
+Benchmark harness for the client stack
+Drives the sync and async clients against a MockEzvizServer (or any
+compatible endpoint) and reports throughput, latency percentiles and
+allocation statistics per mode
+"""
+
+import asyncio
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from .batch import generate_urls
+from .cache import AddressCache
+from .client import EzvizClient, StreamRequest
+from .exceptions import EzvizError
+from .metrics import percentile
+from .retry import RateLimiter, RetryPolicy
+
+MODES = ("single", "batch", "concurrent", "async")
+DEFAULT_REQUESTS = 200
+DEFAULT_CONCURRENCY = 16
+# Cameras shared by every thread in concurrent mode, to exercise coalescing and caching
+HOT_CAMERAS = 4
+# expireTime of the first lap of bench requests over the devices
+BENCH_EXPIRE_TIME = 3600
+
+
+@dataclass
+class BenchResult:
+    """Outcome of one benchmark mode"""
+
+    mode: str
+    requests: int = 0
+    errors: int = 0
+    duration: float = 0.0
+    latencies: list = field(default_factory=list, repr=False)
+    peak_memory: int = 0
+    net_memory: int = 0
+    server_calls: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def record(self, elapsed, ok=True):
+        with self._lock:
+            self.latencies.append(elapsed)
+            self.errors += not ok
+
+    @property
+    def throughput(self):
+        return self.requests / self.duration if self.duration else 0.0
+
+    def to_json(self):
+        latencies = sorted(self.latencies)
+        return {
+            "mode": self.mode,
+            "requests": self.requests,
+            "errors": self.errors,
+            "durationS": round(self.duration, 3),
+            "throughput": round(self.throughput, 1),
+            "p50Ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95Ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99Ms": round(percentile(latencies, 99) * 1000, 2),
+            "peakKiB": round(self.peak_memory / 1024, 1),
+            "netKiB": round(self.net_memory / 1024, 1),
+            "serverCalls": self.server_calls,
+        }
+
+
+def bench_requests(count, devices):
+    """count distinct live HLS requests spread round-robin over devices serials
+
+    Each lap over devices asks for a one second longer expireTime, so no two
+    requests are equal: batch and async modes make one server call per
+    request instead of sharing in-flight lookups through single-flight.
+    """
+    return [StreamRequest(devices[i % len(devices)], protocol=2,
+                          expire_time=BENCH_EXPIRE_TIME + i // len(devices))
+            for i in range(count)]
+
+
+def _timed(call, result):
+    start = time.perf_counter()
+    try:
+        call()
+    except EzvizError:
+        result.record(time.perf_counter() - start, ok=False)
+    else:
+        result.record(time.perf_counter() - start)
+
+
+def run_single(client, requests):
+    result = BenchResult("single")
+    for request in requests:
+        _timed(lambda: client.get_live_address(request, use_cache=False), result)
+    return result
+
+
+def run_batch(client, requests, concurrency):
+    result = BenchResult("batch")
+    for item in generate_urls(client, requests, max_in_flight=concurrency):
+        result.record(item.elapsed, item.ok)
+    return result
+
+
+def run_concurrent(client, requests, concurrency):
+    """Many threads asking for a handful of hot cameras through the cache and single-flight"""
+    result = BenchResult("concurrent")
+    hot = requests[:HOT_CAMERAS]
+
+    def worker(i):
+        _timed(lambda: client.get_live_address(hot[i % len(hot)]), result)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ezviz-bench") as executor:
+        list(executor.map(worker, range(len(requests))))
+    return result
+
+
+def run_async(make_client, requests, concurrency):
+    # Imported here so the sync modes work without aiohttp installed
+    from .aio import AsyncEzvizClient
+
+    result = BenchResult("async")
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+        async with AsyncEzvizClient(**make_client(limit_per_host=concurrency)) as client:
+            await client.ensure_token()
+
+            async def one(request):
+                async with semaphore:
+                    start = time.perf_counter()
+                    try:
+                        await client.get_live_address(request, use_cache=False)
+                    except EzvizError:
+                        result.record(time.perf_counter() - start, ok=False)
+                    else:
+                        result.record(time.perf_counter() - start)
+
+            await asyncio.gather(*(one(request) for request in requests))
+
+    asyncio.run(main())
+    return result
+
+
+def run_benchmarks(base_url, modes=MODES, count=DEFAULT_REQUESTS, concurrency=DEFAULT_CONCURRENCY,
+                   devices=None, app_key="bench-key", app_secret="bench-secret", rate=None,
+                   retries=RetryPolicy.max_attempts - 1, trace_memory=True, server=None):
+    """Run each mode against base_url and return a list of BenchResults
+
+    devices defaults to the serials of server when a MockEzvizServer is
+    given. With trace_memory, tracemalloc records the peak and net
+    allocations of each mode; this covers the whole process, including an
+    in-process mock server, and slows every mode down noticeably.
+    """
+    if devices is None:
+        devices = [serial for serial, d in server.devices.items() if d["status"] == 1]
+    requests = bench_requests(count, devices)
+
+    def client_options(**extra):
+        return dict(app_key=app_key, app_secret=app_secret, base_url=base_url,
+                    retry_policy=RetryPolicy(max_attempts=retries + 1),
+                    rate_limiter=RateLimiter(rate) if rate else None, **extra)
+
+    results = []
+    for mode in modes:
+        calls_before = sum(server.calls.values()) if server else 0
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        if mode == "async":
+            result = run_async(client_options, requests, concurrency)
+        else:
+            cache = AddressCache() if mode == "concurrent" else None
+            with EzvizClient(**client_options(pool_maxsize=concurrency, address_cache=cache)) as client:
+                client.ensure_token()
+                if mode == "single":
+                    result = run_single(client, requests)
+                elif mode == "batch":
+                    result = run_batch(client, requests, concurrency)
+                elif mode == "concurrent":
+                    result = run_concurrent(client, requests, concurrency)
+                else:
+                    raise ValueError(f"Unknown benchmark mode: {mode}")
+        result.duration = time.perf_counter() - start
+        result.requests = len(result.latencies)
+        if trace_memory:
+            result.net_memory, result.peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        if server:
+            result.server_calls = sum(server.calls.values()) - calls_before
+        results.append(result)
+    return results
+
+
+def format_table(results):
+    rows = [r.to_json() for r in results]
+    columns = list(rows[0]) if rows else []
+    widths = {c: max(len(c), *(len(str(row[c])) for row in rows)) for c in columns}
+    lines = ["  ".join(c.rjust(widths[c]) for c in columns)]
+    for row in rows:
+        lines.append("  ".join(str(row[c]).rjust(widths[c]) for c in columns))
+    return "\n".join(lines)
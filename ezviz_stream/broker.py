@@ -0,0 +1,266 @@
+"""
+Stream URL broker
+Serves stream URLs over a local HTTP API from the address cache and renews
+the URLs players keep asking for shortly before they expire, so a lookup
+never has to wait for a token + live/address/get round trip
+"""
+
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .cache import AddressCache, address_key
+from .client import StreamRequest, parse_protocol, parse_quality
+from .errorcodes import OFFLINE_CODES, THROTTLED, classify_code, normalize_code
+from .exceptions import EzvizError
+from .metrics import PROMETHEUS_CONTENT_TYPE
+
+logger = logging.getLogger(__name__)
+
+# Renew URLs this many seconds before they expire
+DEFAULT_RENEW_BEFORE = 120
+# Stop renewing URLs nobody asked for in this long
+DEFAULT_IDLE_TTL = 900
+DEFAULT_RENEW_WORKERS = 4
+RETRY_INTERVAL = 30
+# Missing devices/channels are the caller's mistake rather than an upstream failure
+NOT_FOUND_CODES = {20001, 20002}
+STREAM_PATH_USAGE = "Expected /stream/{serial}/{channel}"
+
+
+class StreamBroker:
+    """Keeps a working set of recently requested stream URLs valid
+
+    get() answers from client.address_cache (one is attached if the client
+    has none) and adds the request to the working set. A scheduler thread
+    renews every URL in the working set renew_before seconds ahead of its
+    expiry until it has gone idle_ttl seconds without being requested.
+    """
+
+    def __init__(self, client, renew_before=DEFAULT_RENEW_BEFORE, idle_ttl=DEFAULT_IDLE_TTL,
+                 max_workers=DEFAULT_RENEW_WORKERS, clock=time.time):
+        if client.address_cache is None:
+            client.address_cache = AddressCache()
+        self.client = client
+        self.cache = client.address_cache
+        self.renew_before = max(renew_before, self.cache.safety_margin)
+        self.idle_ttl = idle_ttl
+        self.clock = clock
+        self.renewals = 0
+        self.renew_failures = 0
+        self._working = {}
+        self._due = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="ezviz-broker-renew")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """Start the renewal scheduler from a daemon thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name="ezviz-broker-scheduler",
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def get(self, request):
+        """Return a live/address/get response for request and keep it renewed"""
+        key = address_key(request)
+        with self._cond:
+            self._working[key] = [request, self.clock()]
+        try:
+            response = self.client.get_live_address(request)
+        except EzvizError:
+            with self._cond:
+                if key not in self._due:
+                    self._working.pop(key, None)
+            raise
+        self._schedule(key, request)
+        return response
+
+    def _schedule(self, key, request, due=None):
+        if due is None:
+            expires_at = self.cache.expires_at(request)
+            if expires_at is None:
+                # Not cacheable, so nothing to keep warm
+                with self._cond:
+                    self._working.pop(key, None)
+                return
+            now = self.clock()
+            # Short-lived URLs are renewed half way through their remaining life instead
+            due = max(expires_at - self.renew_before, now + (expires_at - now) / 2)
+        with self._cond:
+            if key not in self._working or self._due.get(key) == due:
+                return
+            self._due[key] = due
+            heapq.heappush(self._heap, (due, next(self._seq), key))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    wait = self._heap[0][0] - self.clock() if self._heap else None
+                    if wait is not None and wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                if self._stopped:
+                    return
+                due, _, key = heapq.heappop(self._heap)
+                if self._due.get(key) != due:
+                    continue
+                del self._due[key]
+                request, last_access = self._working[key]
+                if self.clock() - last_access > self.idle_ttl:
+                    del self._working[key]
+                    continue
+            try:
+                self._executor.submit(self._renew, key, request)
+            except RuntimeError:
+                return
+
+    def _renew(self, key, request):
+        try:
+            self.client.get_live_address(request, use_cache=False)
+        except EzvizError as e:
+            with self._cond:
+                self.renew_failures += 1
+            logger.warning("Could not renew stream URL for %s/%s: %s",
+                           request.device_serial, request.channel_no, e)
+            self._schedule(key, request, due=self.clock() + RETRY_INTERVAL)
+            return
+        with self._cond:
+            self.renewals += 1
+        self._schedule(key, request)
+
+    def stats(self):
+        with self._cond:
+            stats = {
+                "working": len(self._working),
+                "renewals": self.renewals,
+                "renewFailures": self.renew_failures,
+            }
+        stats["cache"] = self.cache.stats()
+        return stats
+
+
+def parse_stream_path(path, query):
+    """Build a StreamRequest from /stream/{serial}/{channel} and its query string
+
+    Raises ValueError for anything malformed.
+    """
+    parts = [p for p in path.split("/") if p]
+    if len(parts) not in (2, 3) or parts[0] != "stream":
+        raise ValueError(STREAM_PATH_USAGE)
+    channel_no = int(parts[2]) if len(parts) == 3 else 1
+    params = {k: v[-1] for k, v in parse_qs(query).items()}
+    expire_time = params.get("expire_time") or params.get("expireTime")
+    request = StreamRequest(
+        parts[1],
+        channel_no,
+        parse_protocol(params.get("protocol", 2)),
+        parse_quality(params.get("quality", 1)),
+        int(expire_time) if expire_time else None,
+    )
+    start_time, stop_time = params.get("start_time"), params.get("stop_time")
+    if start_time or stop_time:
+        request = replace(request, type="2", start_time=start_time, stop_time=stop_time)
+    return request, params.get("redirect", "0").lower() in ("1", "true", "yes")
+
+
+def error_status(error):
+    """HTTP status the broker answers with for an EzvizError"""
+    code = normalize_code(error.code)
+    if code in NOT_FOUND_CODES:
+        return 404
+    if code in OFFLINE_CODES:
+        return 503
+    if classify_code(error.code) == THROTTLED:
+        return 429
+    return 502
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def create_server(broker, host="127.0.0.1", port=8090):
+    """HTTP server for a StreamBroker; call serve_forever() on the result
+
+    GET /stream/{serial}/{channel}?protocol=hls&quality=hd answers with the
+    live/address/get data as JSON, or a 302 to the URL with redirect=1.
+    expire_time, start_time and stop_time are passed through. GET /stats
+    reports the working set and cache counters, GET /metrics the client's
+    Prometheus metrics (an empty exposition unless its instrumentation is a
+    Metrics), GET /healthz answers "ok". Malformed stream paths and
+    parameters get a 400 with a fixed usage message.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logger.debug("%s - %s", self.address_string(), format % args)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == "/healthz":
+                return self._send(200, b"ok", "text/plain")
+            if url.path == "/stats":
+                return self._send_json(200, broker.stats())
+            if url.path == "/metrics":
+                render = getattr(broker.client.instrumentation, "render", None)
+                body = render().encode() if render is not None else b""
+                return self._send(200, body, PROMETHEUS_CONTENT_TYPE)
+            try:
+                request, redirect = parse_stream_path(url.path, url.query)
+            except ValueError:
+                return self._send_json(400, {"msg": STREAM_PATH_USAGE})
+            try:
+                data = broker.get(request).get("data") or {}
+            except EzvizError as e:
+                return self._send_json(error_status(e), {"code": e.code, "msg": e.message})
+            if redirect and data.get("url"):
+                self.send_response(302)
+                self.send_header("Location", data["url"])
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self._send_json(200, data)
+
+        def _send_json(self, status, payload):
+            self._send(status, json.dumps(payload).encode(), "application/json")
+
+        def _send(self, status, body, content_type):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(body)
+
+    return _Server((host, port), Handler)
@@ -0,0 +1,132 @@
+"""
+TTL + LRU cache for generated live/playback addresses
+Serves a previous live/address/get response while its URL is still valid
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+DEFAULT_MAX_ENTRIES = 1024
+# Treat URLs as expired this many seconds before their expireTime
+DEFAULT_SAFETY_MARGIN = 60
+# Lifetime assumed for URLs requested without expire_time; their expireTime
+# string is in the server's local time and cannot be trusted on its own
+DEFAULT_URL_LIFETIME = 3600
+
+EXPIRE_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def address_key(request):
+    """Cache key for a StreamRequest; the requested URL lifetime does not change the URL"""
+    return (request.device_serial, request.channel_no, request.protocol, request.quality,
+            request.type, request.start_time, request.stop_time)
+
+
+def parse_expire_time(value):
+    """Parse an expireTime value (epoch milliseconds or "YYYY-MM-DD HH:MM:SS") into epoch seconds"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)) or str(value).isdigit():
+        return int(value) / 1000
+    try:
+        return datetime.strptime(str(value), EXPIRE_TIME_FORMAT).timestamp()
+    except ValueError:
+        return None
+
+
+def response_expires_at(request, response, fetched_at, default_lifetime=DEFAULT_URL_LIFETIME):
+    """Work out when a live/address/get response stops being usable, or None if unknown
+
+    The response's expireTime is rendered in the server's local time, so it
+    is capped by the lifetime the request asked for, or by default_lifetime
+    when it asked for none.
+    """
+    data = (response or {}).get("data") or {}
+    candidates = [parse_expire_time(data.get("expireTime"))]
+    lifetime = int(request.expire_time) if request.expire_time else default_lifetime
+    if lifetime:
+        candidates.append(fetched_at + lifetime)
+    candidates = [c for c in candidates if c is not None]
+    return min(candidates) if candidates else None
+
+
+class AddressCache:
+    """Thread-safe LRU cache of live/address/get responses with per-entry expiry"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, safety_margin=DEFAULT_SAFETY_MARGIN,
+                 clock=time.time, default_lifetime=DEFAULT_URL_LIFETIME):
+        self.max_entries = max_entries
+        self.safety_margin = safety_margin
+        self.default_lifetime = default_lifetime
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, request):
+        """Return a still-valid cached response for request, or None"""
+        key = address_key(request)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                response, expires_at = entry
+                if expires_at - self.safety_margin > self.clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return response
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def expires_at(self, request):
+        """Expiry (epoch seconds) of the cached entry for request, or None"""
+        with self._lock:
+            entry = self._entries.get(address_key(request))
+            return entry[1] if entry else None
+
+    def response_expires_at(self, request, response, fetched_at=None):
+        """When a response fetched at fetched_at (default now) expires, or None if unknown"""
+        return response_expires_at(request, response,
+                                   self.clock() if fetched_at is None else fetched_at,
+                                   self.default_lifetime)
+
+    def put(self, request, response, fetched_at=None, expires_at=None):
+        """Cache a successful response; returns False if its lifetime is unknown or too short"""
+        if expires_at is None:
+            expires_at = self.response_expires_at(request, response, fetched_at)
+        if expires_at is None or expires_at - self.safety_margin <= self.clock():
+            return False
+        key = address_key(request)
+        with self._lock:
+            self._entries[key] = (response, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def invalidate(self, request):
+        with self._lock:
+            self._entries.pop(address_key(request), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss/eviction counters and current size"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+            }
@@ -0,0 +1,638 @@
+"""
+Command line entry point for headless EZVIZ tooling
+
+Usage: python -m ezviz_stream <command> [options]
+Credentials come from --app-key/--app-secret, --access-token/--area-domain,
+a config file saved by gui.py (--config) or EZVIZ_APP_KEY/EZVIZ_APP_SECRET.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from contextlib import ExitStack
+from dataclasses import replace
+from itertools import chain
+
+from . import bench
+from .alarms import DEFAULT_LOOKBACK, DEFAULT_POLL_INTERVAL, AlarmPoller, attach_streams
+from .batch import DEFAULT_MAX_IN_FLIGHT, generate_urls, parse_target, read_stream_requests, write_jsonl
+from .broker import (
+    DEFAULT_IDLE_TTL,
+    DEFAULT_RENEW_BEFORE,
+    DEFAULT_RENEW_WORKERS,
+    StreamBroker,
+    create_server,
+)
+from .cache import AddressCache
+from .client import DEFAULT_BASE_URL, EzvizClient, parse_protocol, parse_quality
+from .discovery import DEFAULT_MAX_WORKERS, discover
+from .exceptions import EzvizError
+from .export import DEFAULT_CHUNK_PREFETCH, DEFAULT_MAX_CHUNK, DEFAULT_MERGE_GAP, export_playback
+from .metrics import NO_INSTRUMENTATION, Metrics
+from .mockserver import DEFAULT_SEGMENT_SIZE, MockEzvizServer
+from .pool import ClientPool
+from .probe import DEFAULT_PROBE_TIMEOUT, StreamProber, probe_streams
+from .ptz import PRESET, PtzCommand, dispatch_ptz, move, read_commands, summarize
+from .recorder import DEFAULT_PREFETCH, RecordingError, record
+from .retry import RateLimiter, RetryPolicy
+from .settings import SETTINGS, apply_settings, read_desired_state, resolve_desired_state
+from .store import DEFAULT_MAX_AGE, SnapshotStore, StoredAddressCache, sync
+from .tokens import TokenCache
+
+
+def add_client_arguments(parser):
+    group = parser.add_argument_group("authentication")
+    group.add_argument("--config", help="JSON config saved by the GUI (app_key, app_secret, ...)")
+    group.add_argument("--app-key", default=os.environ.get("EZVIZ_APP_KEY"))
+    group.add_argument("--app-secret", default=os.environ.get("EZVIZ_APP_SECRET"))
+    group.add_argument("--access-token", default=os.environ.get("EZVIZ_ACCESS_TOKEN"))
+    group.add_argument("--area-domain", default=os.environ.get("EZVIZ_AREA_DOMAIN"))
+    group.add_argument("--base-url", default=DEFAULT_BASE_URL)
+    group.add_argument("--token-cache", default=os.environ.get("EZVIZ_TOKEN_CACHE"),
+                       help="File to persist access tokens in between runs")
+    group.add_argument("--accounts", default=os.environ.get("EZVIZ_ACCOUNTS"),
+                       help="JSON list of accounts (app_key, app_secret, base_url, rate, devices) "
+                            "to pool instead of a single appKey")
+
+    group = parser.add_argument_group("throttling")
+    group.add_argument("--rate", type=float,
+                       help="Client-side limit in requests per second per appKey")
+    group.add_argument("--retries", type=int, default=RetryPolicy.max_attempts - 1,
+                       help="Retries for retryable or throttled errors")
+
+    group = parser.add_argument_group("instrumentation")
+    group.add_argument("--metrics", metavar="FILE",
+                       help="Write Prometheus metrics of all API calls here on exit ('-' for stderr)")
+    group.add_argument("--call-log", metavar="FILE",
+                       help="Append one JSON line per API call to this file")
+
+
+def load_config(args):
+    """Merge a GUI config file into args without overriding explicit options"""
+    if not args.config:
+        return {}
+    with open(args.config, "r") as f:
+        config = json.load(f)
+    args.app_key = args.app_key or config.get("app_key")
+    args.app_secret = args.app_secret or config.get("app_secret")
+    args.account_list = config.get("accounts")
+    return config
+
+
+def load_accounts(args):
+    """Account dicts from --accounts or the config file's "accounts" list, or None"""
+    if getattr(args, "accounts", None):
+        with open(args.accounts, "r") as f:
+            accounts = json.load(f)
+        return accounts["accounts"] if isinstance(accounts, dict) else accounts
+    return getattr(args, "account_list", None)
+
+
+def instrumentation_from_args(args):
+    """Metrics shared by every client of this run, or None when not asked for"""
+    metrics = getattr(args, "_metrics", None)
+    if metrics is None and (getattr(args, "metrics", None) or getattr(args, "call_log", None)):
+        call_log = open(args.call_log, "a") if args.call_log else None
+        metrics = args._metrics = Metrics(json_log=call_log)
+    return metrics
+
+
+def write_metrics(args):
+    """Write --metrics and close --call-log, if the run collected metrics"""
+    metrics = getattr(args, "_metrics", None)
+    if metrics is None:
+        return
+    if metrics.json_log is not None:
+        metrics.json_log.close()
+    if args.metrics == "-":
+        sys.stderr.write(metrics.render())
+    elif args.metrics:
+        with open(args.metrics, "w") as f:
+            f.write(metrics.render())
+
+
+def client_from_args(args, pool_maxsize=None):
+    accounts = load_accounts(args)
+    if accounts:
+        return ClientPool.from_accounts(accounts, token_cache=TokenCache(args.token_cache),
+                                        retry_policy=RetryPolicy(max_attempts=args.retries + 1),
+                                        rate=args.rate, pool_maxsize=pool_maxsize,
+                                        instrumentation=instrumentation_from_args(args))
+    kwargs = {}
+    if pool_maxsize:
+        kwargs["pool_maxsize"] = pool_maxsize
+    return EzvizClient(args.app_key, args.app_secret, access_token=args.access_token,
+                       area_domain=args.area_domain, base_url=args.base_url,
+                       token_cache=TokenCache(args.token_cache),
+                       retry_policy=RetryPolicy(max_attempts=args.retries + 1),
+                       rate_limiter=RateLimiter(args.rate) if args.rate else None,
+                       instrumentation=instrumentation_from_args(args), **kwargs)
+
+
+def _open_output(stack, path):
+    if not path or path == "-":
+        return sys.stdout
+    return stack.enter_context(open(path, "w"))
+
+
+def _open_input(stack, path):
+    if path == "-":
+        return sys.stdin
+    return stack.enter_context(open(path, "r", newline=""))
+
+
+def cmd_batch(args):
+    failures = 0
+    with ExitStack() as stack:
+        client, requests = _batch_requests(args, stack)
+        out = _open_output(stack, args.output)
+        for result in generate_urls(client, requests, max_in_flight=args.workers):
+            write_jsonl([result], out)
+            failures += not result.ok
+    return 1 if failures else 0
+
+
+def _batch_requests(args, stack):
+    """Client and lazily built StreamRequests for the batch-style commands"""
+    config = load_config(args)
+    protocol = parse_protocol(args.protocol or config.get("protocol", 2))
+    quality = parse_quality(args.quality or config.get("quality", 1))
+    expire_time = args.expire_time or config.get("expire_time")
+
+    requests = [parse_target(t, protocol, quality, expire_time) for t in args.serial]
+    if args.input:
+        lines = _open_input(stack, args.input)
+        requests = chain(requests, read_stream_requests(lines, protocol, quality, expire_time))
+    client = stack.enter_context(client_from_args(args, pool_maxsize=args.workers))
+    if args.store:
+        client.address_cache = StoredAddressCache(stack.enter_context(SnapshotStore(args.store)))
+    if args.discover:
+        index = _discover(args, client)
+        requests = chain(requests, index.stream_requests(protocol, quality, expire_time))
+    return client, requests
+
+
+def add_batch_arguments(parser, protocol_help="Default protocol: 1-4 or ezopen/hls/rtmp/flv"):
+    parser.add_argument("input", nargs="?",
+                        help="CSV of device_serial,channel_no,protocol,quality,expire_time ('-' for stdin)")
+    parser.add_argument("--serial", action="append", default=[], metavar="SERIAL[:CHANNEL]",
+                        help="Add a single target (repeatable)")
+    parser.add_argument("-o", "--output", help="JSONL output file (default stdout)")
+    parser.add_argument("-w", "--workers", type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                        help="Maximum requests in flight")
+    parser.add_argument("--protocol", help=protocol_help)
+    parser.add_argument("--quality", help="Default quality: 1 (HD) or 2 (fluent)")
+    parser.add_argument("--expire-time", type=int, help="Default URL lifetime in seconds")
+    parser.add_argument("--discover", action="store_true",
+                        help="Add every online channel found by walking the device and camera lists")
+    add_store_arguments(parser)
+
+
+def cmd_probe(args):
+    failures = 0
+    with ExitStack() as stack:
+        out = _open_output(stack, args.output)
+        prober = stack.enter_context(StreamProber(timeout=args.timeout,
+                                                  pool_maxsize=args.workers))
+        if args.url:
+            results = prober.probe_many(((url, None) for url in args.url), args.workers)
+        else:
+            client, requests = _batch_requests(args, stack)
+            results = probe_streams(client, requests, prober, max_in_flight=args.workers)
+        for result in results:
+            write_jsonl([result], out)
+            failures += not result.ok
+    return 1 if failures else 0
+
+
+def _discover(args, client):
+    if isinstance(client, ClientPool):
+        if args.store:
+            # sync() follows one account's device list and would drop the others' devices
+            raise SystemExit("--store cannot be used to discover a multi-account pool")
+        index = client.discover(max_workers=args.workers,
+                                with_capabilities=getattr(args, "capabilities", False))
+        print(f"pool: {len(index)} devices across {len(client.accounts)} accounts",
+              file=sys.stderr)
+        return index
+    if not args.store:
+        return discover(client, max_workers=args.workers,
+                        with_capabilities=getattr(args, "capabilities", False))
+    with SnapshotStore(args.store) as store:
+        result = sync(client, store, max_age=args.max_age, max_workers=args.workers)
+    print(f"sync: {result.added} added, {result.refreshed} refreshed, "
+          f"{result.unchanged} unchanged, {result.removed} removed", file=sys.stderr)
+    return result.index
+
+
+def add_store_arguments(parser):
+    parser.add_argument("--store", default=os.environ.get("EZVIZ_STORE"),
+                        help="SQLite snapshot to warm-start from and sync incrementally")
+    parser.add_argument("--max-age", type=float, default=DEFAULT_MAX_AGE,
+                        help="Refetch channels of unchanged devices older than this (seconds)")
+
+
+def cmd_discover(args):
+    load_config(args)
+    with ExitStack() as stack:
+        out = _open_output(stack, args.output)
+        client = stack.enter_context(client_from_args(args, pool_maxsize=args.workers))
+        index = _discover(args, client)
+        json.dump(index.to_json(), out, indent=2)
+        out.write("\n")
+    print(f"{len(index)} devices, {len(index.online())} online", file=sys.stderr)
+    return 0
+
+
+def cmd_serve(args):
+    load_config(args)
+    with ExitStack() as stack:
+        client = stack.enter_context(client_from_args(args, pool_maxsize=args.workers))
+        if client.instrumentation is NO_INSTRUMENTATION:
+            # Always collect metrics for the broker's /metrics endpoint
+            client.instrumentation = Metrics()
+        if args.store:
+            client.address_cache = StoredAddressCache(stack.enter_context(SnapshotStore(args.store)))
+        else:
+            client.address_cache = AddressCache()
+        client.ensure_token()
+        if client.can_authenticate:
+            client.token_manager.start()
+            stack.callback(client.token_manager.stop)
+        broker = stack.enter_context(StreamBroker(client, renew_before=args.renew_before,
+                                                  idle_ttl=args.idle_ttl, max_workers=args.workers))
+        server = create_server(broker, args.host, args.port)
+        stack.callback(server.server_close)
+        host, port = server.server_address[:2]
+        print(f"Stream broker listening on http://{host}:{port}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+def cmd_record(args):
+    config = load_config(args)
+    request = parse_target(args.target, 2, parse_quality(args.quality or config.get("quality", 1)),
+                           args.expire_time or config.get("expire_time"))
+    if args.start or args.stop:
+        if not (args.start and args.stop):
+            raise SystemExit("--start and --stop must be given together")
+        request = replace(request, type="2", start_time=args.start, stop_time=args.stop)
+    with ExitStack() as stack:
+        if not args.output or args.output == "-":
+            out = sys.stdout.buffer
+        else:
+            out = stack.enter_context(open(args.output, "ab" if args.resume_after else "wb"))
+        client = stack.enter_context(client_from_args(args))
+        client.address_cache = AddressCache()
+        try:
+            result = record(client, request, out, max_duration=args.duration,
+                            prefetch=args.prefetch, resume_after=args.resume_after)
+        except RecordingError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+    print(json.dumps(result.to_json()), file=sys.stderr)
+    return 0
+
+
+def cmd_export(args):
+    load_config(args)
+    failures = 0
+    with ExitStack() as stack:
+        targets = [parse_target(t) for t in args.serial]
+        if args.input:
+            targets += read_stream_requests(_open_input(stack, args.input))
+        client = stack.enter_context(client_from_args(args, pool_maxsize=args.workers))
+        client.address_cache = AddressCache()
+        results = export_playback(
+            client, dict.fromkeys((r.device_serial, r.channel_no) for r in targets),
+            args.start, args.stop, args.out_dir, max_workers=args.workers,
+            max_chunk=args.max_chunk, prefetch=args.prefetch,
+            use_recordings=not args.no_recordings, merge_gap=args.merge_gap)
+        for result in results:
+            write_jsonl([result], sys.stdout)
+            failures += not result.ok
+    return 1 if failures else 0
+
+
+def cmd_alarms(args):
+    config = load_config(args)
+    with ExitStack() as stack:
+        out = _open_output(stack, args.output)
+        client = stack.enter_context(client_from_args(args, pool_maxsize=args.workers))
+        store = stack.enter_context(SnapshotStore(args.store)) if args.store else None
+        poller = AlarmPoller(client, args.serial or None, store=store, lookback=args.lookback,
+                             max_workers=args.workers, alarm_type=args.alarm_type)
+        protocol = parse_protocol(args.urls) if args.urls else None
+        playback = (args.before, args.after) if args.playback else None
+        if protocol:
+            client.address_cache = AddressCache()
+        while True:
+            started = time.monotonic()
+            events = poller.poll()
+            if protocol:
+                attach_streams(client, events, protocol,
+                               parse_quality(config.get("quality", 1)), playback, args.workers)
+            write_jsonl(events, out)
+            if not args.follow:
+                break
+            time.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+    return 0
+
+
+def cmd_ptz(args):
+    load_config(args)
+    commands = []
+    for target in args.serial:
+        request = parse_target(target)
+        if args.preset is not None:
+            commands.append(PtzCommand(request.device_serial, request.channel_no, PRESET,
+                                       index=args.preset))
+        if args.move:
+            commands += move(request.device_serial, request.channel_no, args.move,
+                             args.duration, args.speed)
+    with ExitStack() as stack:
+        if args.input:
+            commands += read_commands(_open_input(stack, args.input))
+        if not commands:
+            raise SystemExit("Nothing to do: give --serial with --preset/--move, or a command file")
+        out = _open_output(stack, args.output)
+        client = stack.enter_context(client_from_args(args, pool_maxsize=args.workers))
+        results = []
+        for result in dispatch_ptz(client, commands, args.workers,
+                               coalesce_commands=not args.no_coalesce):
+            write_jsonl([result], out)
+            results.append(result)
+    summary = summarize(results)
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+
+def cmd_settings(args):
+    load_config(args)
+    counts = {}
+    with ExitStack() as stack:
+        entries = read_desired_state(_open_input(stack, args.input))
+        out = _open_output(stack, args.output)
+        client = stack.enter_context(client_from_args(args, pool_maxsize=args.workers))
+        index = _discover(args, client) if args.discover else None
+        try:
+            desired = resolve_desired_state(entries, index)
+        except ValueError as e:
+            raise SystemExit(f"{args.input}: {e}")
+        for result in apply_settings(client, desired, args.workers, index, args.dry_run):
+            write_jsonl([result], out)
+            counts[result.status] = counts.get(result.status, 0) + 1
+    print(json.dumps(counts), file=sys.stderr)
+    return 1 if counts.get("failed") else 0
+
+
+def add_mock_arguments(parser):
+    group = parser.add_argument_group("mock server")
+    group.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    group.add_argument("--jitter", type=float, default=0.0, help="Extra random latency up to this")
+    group.add_argument("--error-rate", type=float, default=0.0,
+                       help="Fraction of calls answered with --error-code")
+    group.add_argument("--error-code", default="49999")
+    group.add_argument("--rate-limit", type=float,
+                       help="Requests per second per appKey before answering 10029")
+    group.add_argument("--devices", type=int, default=100)
+    group.add_argument("--channels", type=int, default=1, help="Channels per device")
+    group.add_argument("--offline-every", type=int, default=0,
+                       help="Make every Nth device offline")
+    group.add_argument("--segment-size", type=int, default=DEFAULT_SEGMENT_SIZE,
+                       help="Bytes per served HLS segment")
+    group.add_argument("--serial-prefix", default="MOCK",
+                       help="Device serials are this prefix plus a 5-digit index")
+
+
+def mock_from_args(args, host="127.0.0.1", port=0):
+    return MockEzvizServer(host, port, latency=args.latency, jitter=args.jitter,
+                           error_rate=args.error_rate, error_code=args.error_code,
+                           rate_limit=args.rate_limit, devices=args.devices,
+                           channels=args.channels, offline_every=args.offline_every,
+                           segment_size=args.segment_size, serial_prefix=args.serial_prefix)
+
+
+def cmd_bench(args):
+    modes = args.modes.split(",")
+    for mode in modes:
+        if mode not in bench.MODES:
+            raise SystemExit(f"Unknown mode {mode!r}; choose from {', '.join(bench.MODES)}")
+    options = dict(modes=modes, count=args.requests, concurrency=args.concurrency,
+                   rate=args.rate, retries=args.retries, trace_memory=not args.no_memory)
+    if args.target:
+        if not args.serial:
+            raise SystemExit("--serial is required with --target")
+        load_config(args)
+        results = bench.run_benchmarks(args.target, devices=args.serial, app_key=args.app_key,
+                                       app_secret=args.app_secret, **options)
+    else:
+        with mock_from_args(args) as server:
+            results = bench.run_benchmarks(server.url, server=server, **options)
+    if args.json:
+        write_jsonl(results, sys.stdout)
+    else:
+        print(bench.format_table(results))
+    return 0
+
+
+def cmd_mock_server(args):
+    server = mock_from_args(args, args.host, args.port)
+    print(f"Mock EZVIZ Open API listening on {server.url}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="ezviz_stream",
+                                     description="Headless EZVIZ Open API tooling")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batch = subparsers.add_parser("batch", help="Generate stream URLs for many devices")
+    add_client_arguments(batch)
+    add_batch_arguments(batch)
+    batch.set_defaults(func=cmd_batch)
+
+    probe = subparsers.add_parser("probe", help="Generate stream URLs and check that they play")
+    add_client_arguments(probe)
+    add_batch_arguments(probe, "Default protocol: hls, rtmp or flv (ezopen cannot be probed)")
+    probe.add_argument("--url", action="append", default=[],
+                       help="Probe this stream URL directly instead of generating one (repeatable)")
+    probe.add_argument("--timeout", type=float, default=DEFAULT_PROBE_TIMEOUT,
+                       help="Per-connection timeout in seconds")
+    probe.set_defaults(func=cmd_probe)
+
+    discover_parser = subparsers.add_parser("discover", help="List the fleet with channels and status")
+    add_client_arguments(discover_parser)
+    discover_parser.add_argument("-o", "--output", help="JSON output file (default stdout)")
+    discover_parser.add_argument("-w", "--workers", type=int, default=DEFAULT_MAX_WORKERS,
+                                 help="Maximum pages fetched in parallel")
+    discover_parser.add_argument("--capabilities", action="store_true",
+                                 help="Also fetch device/capacity for online devices")
+    add_store_arguments(discover_parser)
+    discover_parser.set_defaults(func=cmd_discover)
+
+    serve = subparsers.add_parser("serve", help="Run the stream URL broker HTTP service")
+    add_client_arguments(serve)
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8090)
+    serve.add_argument("-w", "--workers", type=int, default=DEFAULT_RENEW_WORKERS,
+                       help="Parallel URL renewals")
+    serve.add_argument("--renew-before", type=float, default=DEFAULT_RENEW_BEFORE,
+                       help="Renew URLs this many seconds before they expire")
+    serve.add_argument("--idle-ttl", type=float, default=DEFAULT_IDLE_TTL,
+                       help="Stop renewing URLs not requested for this many seconds")
+    serve.add_argument("--store", default=os.environ.get("EZVIZ_STORE"),
+                       help="SQLite snapshot to keep issued URLs in across restarts")
+    serve.set_defaults(func=cmd_serve)
+
+    record_parser = subparsers.add_parser("record", help="Record a live or playback HLS stream")
+    add_client_arguments(record_parser)
+    record_parser.add_argument("target", metavar="SERIAL[:CHANNEL]")
+    record_parser.add_argument("-o", "--output", help="Output file (default stdout, for piping)")
+    record_parser.add_argument("--start", help="Playback start, YYYY-MM-DD HH:MM:SS")
+    record_parser.add_argument("--stop", help="Playback stop, YYYY-MM-DD HH:MM:SS")
+    record_parser.add_argument("--duration", type=float,
+                               help="Stop a live recording after this many seconds of media")
+    record_parser.add_argument("--prefetch", type=int, default=DEFAULT_PREFETCH,
+                               help="Segments downloaded ahead in parallel")
+    record_parser.add_argument("--quality", help="1 (HD) or 2 (fluent)")
+    record_parser.add_argument("--expire-time", type=int, help="URL lifetime in seconds")
+    record_parser.add_argument("--resume-after", type=int, metavar="SEQUENCE",
+                               help="Append to --output, skipping segments up to this sequence")
+    record_parser.set_defaults(func=cmd_record)
+
+    export = subparsers.add_parser("export", help="Export a playback window for many cameras")
+    add_client_arguments(export)
+    export.add_argument("input", nargs="?", help="CSV of device_serial,channel_no ('-' for stdin)")
+    export.add_argument("--serial", action="append", default=[], metavar="SERIAL[:CHANNEL]",
+                        help="Add a single camera (repeatable)")
+    export.add_argument("--start", required=True, help="Window start, YYYY-MM-DD HH:MM:SS")
+    export.add_argument("--stop", required=True, help="Window stop, YYYY-MM-DD HH:MM:SS")
+    export.add_argument("-d", "--out-dir", default=".", help="Directory for the exported files")
+    export.add_argument("-w", "--workers", type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                        help="Chunks recorded in parallel")
+    export.add_argument("--max-chunk", type=float, default=DEFAULT_MAX_CHUNK,
+                        help="Longest stretch per playback request (seconds)")
+    export.add_argument("--merge-gap", type=float, default=DEFAULT_MERGE_GAP,
+                        help="Join recording files at most this many seconds apart")
+    export.add_argument("--prefetch", type=int, default=DEFAULT_CHUNK_PREFETCH,
+                        help="Segments prefetched per chunk")
+    export.add_argument("--no-recordings", action="store_true",
+                        help="Cut fixed-size chunks instead of following the recording list")
+    export.set_defaults(func=cmd_export)
+
+    alarms = subparsers.add_parser("alarms", help="Fetch new alarms as JSON lines")
+    add_client_arguments(alarms)
+    alarms.add_argument("--serial", action="append", default=[],
+                        help="Poll this device (repeatable); default is the whole account")
+    alarms.add_argument("-o", "--output", help="JSONL output file (default stdout)")
+    alarms.add_argument("-w", "--workers", type=int, default=DEFAULT_MAX_WORKERS,
+                        help="Devices or pages fetched in parallel")
+    alarms.add_argument("-f", "--follow", action="store_true", help="Keep polling")
+    alarms.add_argument("--interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="Seconds between polls with --follow")
+    alarms.add_argument("--lookback", type=float, default=DEFAULT_LOOKBACK,
+                        help="How far back the first poll of a device looks (seconds)")
+    alarms.add_argument("--alarm-type", type=int, help="Only this alarm type")
+    alarms.add_argument("--store", default=os.environ.get("EZVIZ_STORE"),
+                        help="SQLite snapshot to keep per-device high-water marks in")
+    alarms.add_argument("--urls", metavar="PROTOCOL",
+                        help="Attach a stream URL of this protocol to every alarm")
+    alarms.add_argument("--playback", action="store_true",
+                        help="Attach playback URLs around the alarm instead of live ones")
+    alarms.add_argument("--before", type=float, default=10, help="Playback seconds before the alarm")
+    alarms.add_argument("--after", type=float, default=30, help="Playback seconds after the alarm")
+    alarms.set_defaults(func=cmd_alarms)
+
+    ptz = subparsers.add_parser("ptz", help="Move many PTZ cameras or send them to presets")
+    add_client_arguments(ptz)
+    ptz.add_argument("input", nargs="?",
+                     help="JSONL of commands: deviceSerial, channelNo, action "
+                          "(start/stop/preset/wait), direction, speed, index, seconds")
+    ptz.add_argument("--serial", action="append", default=[], metavar="SERIAL[:CHANNEL]",
+                     help="Camera to send --preset/--move to (repeatable)")
+    ptz.add_argument("--preset", type=int, metavar="INDEX", help="Move to this preset")
+    ptz.add_argument("--move", metavar="DIRECTION", help="up, down, left, right, zoom_in, ...")
+    ptz.add_argument("--duration", type=float, default=1.0, help="Seconds to --move for")
+    ptz.add_argument("--speed", default="medium", help="slow, medium or fast")
+    ptz.add_argument("-o", "--output", help="JSONL output file (default stdout)")
+    ptz.add_argument("-w", "--workers", type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                     help="Cameras driven in parallel")
+    ptz.add_argument("--no-coalesce", action="store_true",
+                     help="Send every command even when it cannot change the outcome")
+    ptz.set_defaults(func=cmd_ptz)
+
+    settings = subparsers.add_parser(
+        "settings", help="Diff and apply defence, PIR, infrared and sound settings")
+    add_client_arguments(settings)
+    settings.add_argument("input", help="Desired state as JSON or JSON lines ('-' for stdin): "
+                                        "deviceSerial ('*' for all), channelNo and any of "
+                                        + ", ".join(SETTINGS))
+    settings.add_argument("-o", "--output", help="JSONL output file (default stdout)")
+    settings.add_argument("-w", "--workers", type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                          help="Devices configured in parallel")
+    settings.add_argument("-n", "--dry-run", action="store_true",
+                          help="Only report what would change")
+    settings.add_argument("--discover", action="store_true",
+                          help="Walk the fleet first: expands '*', skips offline devices and "
+                               "takes defence from the device list")
+    add_store_arguments(settings)
+    settings.set_defaults(func=cmd_settings)
+
+    bench_parser = subparsers.add_parser(
+        "bench", help="Benchmark the client against a mock server or a test endpoint")
+    add_mock_arguments(bench_parser)
+    bench_parser.add_argument("--modes", default=",".join(bench.MODES),
+                              help=f"Comma-separated subset of {','.join(bench.MODES)}")
+    bench_parser.add_argument("-n", "--requests", type=int, default=bench.DEFAULT_REQUESTS,
+                              help="Calls per mode")
+    bench_parser.add_argument("-c", "--concurrency", type=int, default=bench.DEFAULT_CONCURRENCY)
+    bench_parser.add_argument("--rate", type=float,
+                              help="Client-side limit in requests per second")
+    bench_parser.add_argument("--retries", type=int, default=RetryPolicy.max_attempts - 1)
+    bench_parser.add_argument("--no-memory", action="store_true",
+                              help="Skip tracemalloc allocation statistics")
+    bench_parser.add_argument("--json", action="store_true", help="Print one JSON line per mode")
+    target = bench_parser.add_argument_group("external target")
+    target.add_argument("--target", metavar="URL",
+                        help="Benchmark this Open API base URL instead of an in-process mock")
+    target.add_argument("--serial", action="append", default=[],
+                        help="Device serial to request with --target (repeatable)")
+    target.add_argument("--config")
+    target.add_argument("--app-key", default=os.environ.get("EZVIZ_APP_KEY"))
+    target.add_argument("--app-secret", default=os.environ.get("EZVIZ_APP_SECRET"))
+    bench_parser.set_defaults(func=cmd_bench)
+
+    mock = subparsers.add_parser("mock-server", help="Run the mock Open API in the foreground")
+    add_mock_arguments(mock)
+    mock.add_argument("--host", default="127.0.0.1")
+    mock.add_argument("--port", type=int, default=8080)
+    mock.set_defaults(func=cmd_mock_server)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except EzvizError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        write_metrics(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
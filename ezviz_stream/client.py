@@ -0,0 +1,429 @@
+"""
+Headless EZVIZ Open API client
+Owns a keep-alive requests.Session so repeated calls reuse TCP/TLS connections
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .errorcodes import THROTTLED, classify_code
+from .exceptions import EzvizApiError, EzvizAuthError, EzvizRateLimitError
+from .metrics import NO_INSTRUMENTATION
+from .retry import RetryPolicy
+from .singleflight import SingleFlight
+from .tokens import Token, TokenManager
+
+DEFAULT_BASE_URL = "https://open.ezvizlife.com"
+DEFAULT_TIMEOUT = 10
+# Number of host pools kept alive (token host plus area domains)
+DEFAULT_POOL_CONNECTIONS = 4
+# Connections kept alive per host; size this to the number of concurrent callers
+DEFAULT_POOL_MAXSIZE = 16
+
+TOKEN_PATH = "/api/lapp/token/get"
+LIVE_ADDRESS_PATH = "/api/lapp/live/address/get"
+DEVICE_LIST_PATH = "/api/lapp/device/list"
+CAMERA_LIST_PATH = "/api/lapp/camera/list"
+DEVICE_INFO_PATH = "/api/lapp/device/info"
+DEVICE_CAMERA_LIST_PATH = "/api/lapp/device/camera/list"
+DEVICE_CAPACITY_PATH = "/api/lapp/device/capacity"
+VIDEO_BY_TIME_PATH = "/api/lapp/video/by/time"
+ALARM_LIST_PATH = "/api/lapp/alarm/list"
+PTZ_START_PATH = "/api/lapp/device/ptz/start"
+PTZ_STOP_PATH = "/api/lapp/device/ptz/stop"
+PRESET_MOVE_PATH = "/api/lapp/device/preset/move"
+DEFENCE_SET_PATH = "/api/lapp/device/defence/set"
+PIR_GET_PATH = "/api/lapp/device/pir/get"
+PIR_SET_PATH = "/api/lapp/device/pir/set"
+INFRARED_GET_PATH = "/api/lapp/device/infrared/switch/get"
+INFRARED_SET_PATH = "/api/lapp/device/infrared/switch/set"
+SOUND_GET_PATH = "/api/lapp/device/sound/switch/status"
+SOUND_SET_PATH = "/api/lapp/device/sound/switch/set"
+
+SUCCESS_CODE = "200"
+TOKEN_EXPIRED_CODE = "10002"
+
+FORM_HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
+
+# live/address/get protocol and quality values, by the names used in the GUI
+PROTOCOLS = {"ezopen": 1, "hls": 2, "rtmp": 3, "flv": 4}
+QUALITIES = {"hd": 1, "fluent": 2}
+
+
+def _parse_choice(value, choices, label):
+    if isinstance(value, int):
+        return value
+    text = str(value).strip()
+    # Accept GUI combobox values such as "2 - HLS"
+    head = text.split(" ")[0]
+    if head.isdigit():
+        return int(head)
+    try:
+        return choices[text.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown {label}: {value!r}") from None
+
+
+def parse_protocol(value):
+    """Parse a protocol given as a number, a GUI label (2 - HLS) or a name (hls)"""
+    return _parse_choice(value, PROTOCOLS, "protocol")
+
+
+def parse_quality(value):
+    """Parse a quality given as a number, a GUI label (1 - HD (Main)) or a name (hd)"""
+    return _parse_choice(value, QUALITIES, "quality")
+
+
+@dataclass(frozen=True)
+class StreamRequest:
+    """Parameters of a single live/address/get call, hashable so it can be used as a key"""
+
+    device_serial: str
+    channel_no: int = 1
+    protocol: int = 2
+    quality: int = 1
+    expire_time: Optional[int] = None
+    type: Optional[str] = None
+    start_time: Optional[str] = None
+    stop_time: Optional[str] = None
+
+    def to_params(self):
+        """Form parameters for /api/lapp/live/address/get (without accessToken)"""
+        params = {
+            "deviceSerial": self.device_serial,
+            "channelNo": self.channel_no,
+            "protocol": self.protocol,
+            "quality": self.quality,
+        }
+        if self.expire_time is not None:
+            params["expireTime"] = self.expire_time
+        if self.type is not None:
+            params["type"] = self.type
+        if self.start_time is not None:
+            params["startTime"] = self.start_time
+        if self.stop_time is not None:
+            params["stopTime"] = self.stop_time
+        return params
+
+
+def create_session(pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE):
+    """Create a keep-alive session with a tuned connection pool"""
+    session = requests.Session()
+    session.headers.update(FORM_HEADERS)
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def check_response(url, status_code, result):
+    """Validate a decoded Open API response, raising EzvizApiError on failure"""
+    if not isinstance(result, dict):
+        raise EzvizApiError(f"API request to {url} failed with status: {status_code}")
+    code = str(result.get("code", ""))
+    if code != SUCCESS_CODE:
+        error = EzvizRateLimitError if classify_code(code) == THROTTLED else EzvizApiError
+        raise error(f"API Error: {result.get('msg', 'Unknown error')}",
+                    code=code, response=result)
+    return result
+
+
+class EzvizClient:
+    """Synchronous EZVIZ Open API client
+
+    Either pass an access_token (and area_domain), or app_key and app_secret so
+    the client can fetch and renew tokens itself. Tokens obtained with app
+    credentials go through a TokenManager; pass token_manager to share one
+    between clients, or token_cache to back this client's manager with a
+    shared or on-disk TokenCache. With an address_cache, still-valid stream
+    URLs are served locally instead of calling live/address/get again.
+    Identical concurrent address lookups always share one in-flight call.
+
+    Failed calls are retried according to retry_policy (see retry.RetryPolicy),
+    and an optional rate_limiter paces calls per appKey and area domain.
+    Every call, token fetches included, is reported to instrumentation (see
+    metrics.Metrics); the default does nothing.
+    """
+
+    def __init__(self, app_key=None, app_secret=None, access_token=None, area_domain=None,
+                 base_url=DEFAULT_BASE_URL, timeout=DEFAULT_TIMEOUT,
+                 pool_connections=DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE, session=None, token_manager=None,
+                 token_cache=None, address_cache=None, retry_policy=None, rate_limiter=None,
+                 instrumentation=None):
+        self.app_key = app_key
+        self.app_secret = app_secret
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+        self.session = session or create_session(pool_connections, pool_maxsize)
+        self._owns_session = session is None
+        self._mounted_domains = set()
+        self.token_manager = token_manager or TokenManager(self.fetch_token, token_cache)
+        self.address_cache = address_cache
+        self._address_flight = SingleFlight()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limiter = rate_limiter
+        self.instrumentation = instrumentation or NO_INSTRUMENTATION
+
+        self.access_token = access_token
+        self.area_domain = None
+        self.token_expire_time = None
+        if area_domain:
+            self._set_area_domain(area_domain)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Release pooled connections"""
+        if self._owns_session:
+            self.session.close()
+
+    @property
+    def can_authenticate(self):
+        return bool(self.app_key and self.app_secret)
+
+    def _set_area_domain(self, area_domain):
+        """Remember the area domain and give it a dedicated connection pool"""
+        area_domain = area_domain.rstrip("/")
+        if self._owns_session and area_domain not in self._mounted_domains:
+            self.session.mount(area_domain, HTTPAdapter(pool_connections=1,
+                                                        pool_maxsize=self.pool_maxsize))
+            self._mounted_domains.add(area_domain)
+        self.area_domain = area_domain
+
+    def _post(self, url, data):
+        try:
+            response = self.session.post(url, data=data, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise EzvizApiError(f"Request to {url} failed: {e}") from e
+        try:
+            result = response.json()
+        except ValueError:
+            result = None
+        return check_response(url, response.status_code, result)
+
+    def fetch_token(self, app_key, app_secret):
+        """Request a new Token from /api/lapp/token/get"""
+        url = self.base_url + TOKEN_PATH
+        record = self.instrumentation.start(TOKEN_PATH)
+        sent = time.perf_counter()
+        try:
+            result = self._post(url, {"appKey": app_key, "appSecret": app_secret})
+        except EzvizApiError as e:
+            record.attempt(self.base_url, time.perf_counter() - sent, e.code)
+            self.instrumentation.on_call(record.finish(e))
+            raise EzvizAuthError(f"Authentication failed: {e.message}",
+                                 code=e.code, response=e.response) from e
+        record.attempt(self.base_url, time.perf_counter() - sent, SUCCESS_CODE)
+        self.instrumentation.on_call(record.finish())
+        return Token.from_response(result["data"], self.base_url)
+
+    def _apply_token(self, token):
+        self.access_token = token.access_token
+        self._set_area_domain(token.area_domain)
+        self.token_expire_time = token.expire_time
+
+    def authenticate(self):
+        """Fetch a new access token and area domain using the app credentials"""
+        if not self.can_authenticate:
+            raise EzvizAuthError("Cannot authenticate: no app_key/app_secret provided")
+        token = self.token_manager.refresh(self.app_key, self.app_secret)
+        self._apply_token(token)
+        return token
+
+    def token_expired(self):
+        """Whether the current token is missing or past its expireTime (milliseconds)"""
+        if not self.access_token:
+            return True
+        if self.token_expire_time is None:
+            return False
+        return time.time() * 1000 >= self.token_expire_time
+
+    def ensure_token(self):
+        """Make sure a usable token is loaded, renewing it through the token manager"""
+        if self.can_authenticate:
+            self._apply_token(self.token_manager.get_token(self.app_key, self.app_secret))
+        elif self.token_expired():
+            if self.access_token:
+                raise EzvizAuthError("Access token expired and no app credentials to renew it")
+            raise EzvizAuthError("Cannot authenticate: no app_key/app_secret provided")
+
+    def post(self, path, data=None):
+        """POST to an authenticated endpoint on the area domain and return the full response"""
+        record = self.instrumentation.start(path)
+        attempt = 0
+        renewed = False
+        while True:
+            self.ensure_token()
+            access_token, area_domain = self.access_token, self.area_domain
+            limiter_key = (self.app_key or access_token, area_domain)
+            if self.rate_limiter is not None:
+                waited = time.perf_counter()
+                self.rate_limiter.acquire(limiter_key)
+                record.waited(time.perf_counter() - waited)
+            sent = time.perf_counter()
+            try:
+                result = self._post_with_token(path, data, access_token, area_domain)
+            except EzvizApiError as e:
+                record.attempt(area_domain, time.perf_counter() - sent, e.code)
+                if e.code == TOKEN_EXPIRED_CODE and self.can_authenticate and not renewed:
+                    # Another caller may already have replaced the rejected token
+                    self.token_manager.invalidate(self.app_key, access_token)
+                    renewed = True
+                    continue
+                attempt += 1
+                kind = self.retry_policy.classify(e)
+                if kind == THROTTLED and self.rate_limiter is not None:
+                    self.rate_limiter.on_throttled(limiter_key)
+                if not self.retry_policy.should_retry(kind, attempt):
+                    self.instrumentation.on_call(record.finish(e))
+                    raise
+                delay = self.retry_policy.delay(kind, attempt)
+                record.retry(delay)
+                time.sleep(delay)
+                continue
+            record.attempt(area_domain, time.perf_counter() - sent, SUCCESS_CODE)
+            self.instrumentation.on_call(record.finish())
+            if self.rate_limiter is not None:
+                self.rate_limiter.on_success(limiter_key)
+            return result
+
+    def _post_with_token(self, path, data, access_token, area_domain):
+        payload = {"accessToken": access_token}
+        if data:
+            payload.update(data)
+        return self._post((area_domain or self.base_url) + path, payload)
+
+    def get_live_address(self, request, use_cache=True):
+        """Get a live or playback address for a StreamRequest"""
+        cache = self.address_cache if use_cache else None
+        if cache is not None:
+            cached = cache.get(request)
+            self.instrumentation.on_cache(LIVE_ADDRESS_PATH, cached is not None)
+            if cached is not None:
+                return cached
+        key = (self.app_key or self.access_token, request)
+        return self._address_flight.do(key, self._fetch_live_address, request)
+
+    def _fetch_live_address(self, request):
+        fetched_at = time.time()
+        result = self.post(LIVE_ADDRESS_PATH, request.to_params())
+        if self.address_cache is not None:
+            self.address_cache.put(request, result, fetched_at)
+        return result
+
+    def get_device_list(self, page_start=0, page_size=10):
+        """List devices on the account, one page at a time"""
+        return self.post(DEVICE_LIST_PATH, {"pageStart": page_start, "pageSize": page_size})
+
+    def get_camera_list(self, page_start=0, page_size=10):
+        """List cameras (channels) on the account, one page at a time"""
+        return self.post(CAMERA_LIST_PATH, {"pageStart": page_start, "pageSize": page_size})
+
+    def get_device_info(self, device_serial):
+        """Get details of a single device"""
+        return self.post(DEVICE_INFO_PATH, {"deviceSerial": device_serial})
+
+    def get_device_camera_list(self, device_serial):
+        """List the channels of a single device"""
+        return self.post(DEVICE_CAMERA_LIST_PATH, {"deviceSerial": device_serial})
+
+    def get_device_capacity(self, device_serial):
+        """Get the capability set of a single device"""
+        return self.post(DEVICE_CAPACITY_PATH, {"deviceSerial": device_serial})
+
+    def get_video_by_time(self, device_serial, channel_no, start_time, end_time, rec_type=0):
+        """List recordings of a channel between two epoch-millisecond times
+
+        rec_type selects where to search: 0 cloud then local, 1 cloud, 2 local.
+        """
+        return self.post(VIDEO_BY_TIME_PATH, {
+            "deviceSerial": device_serial,
+            "channelNo": channel_no,
+            "startTime": start_time,
+            "endTime": end_time,
+            "recType": rec_type,
+        })
+
+    def get_alarm_list(self, device_serial=None, start_time=None, end_time=None, alarm_type=None,
+                       status=2, page_start=0, page_size=10):
+        """List alarms of one device, or of the whole account without device_serial
+
+        start_time and end_time are epoch milliseconds; status is 0 unread,
+        1 read or 2 all.
+        """
+        data = {"status": status, "pageStart": page_start, "pageSize": page_size}
+        if device_serial is not None:
+            data["deviceSerial"] = device_serial
+        if start_time is not None:
+            data["startTime"] = start_time
+        if end_time is not None:
+            data["endTime"] = end_time
+        if alarm_type is not None:
+            data["alarmType"] = alarm_type
+        return self.post(ALARM_LIST_PATH, data)
+
+    def ptz_start(self, device_serial, channel_no, direction, speed=1):
+        """Start moving a PTZ camera; direction and speed are API indexes (see ptz.DIRECTIONS)"""
+        return self.post(PTZ_START_PATH, {"deviceSerial": device_serial, "channelNo": channel_no,
+                                          "direction": direction, "speed": speed})
+
+    def ptz_stop(self, device_serial, channel_no, direction=None):
+        """Stop PTZ movement, optionally only in one direction"""
+        data = {"deviceSerial": device_serial, "channelNo": channel_no}
+        if direction is not None:
+            data["direction"] = direction
+        return self.post(PTZ_STOP_PATH, data)
+
+    def preset_move(self, device_serial, channel_no, index):
+        """Move a PTZ camera to a stored preset"""
+        return self.post(PRESET_MOVE_PATH, {"deviceSerial": device_serial,
+                                            "channelNo": channel_no, "index": index})
+
+    def set_defence(self, device_serial, is_defence):
+        """Arm (1) or disarm (0) a device; A1 hubs take 0 (sleep), 8 (home) or 16 (away)"""
+        return self.post(DEFENCE_SET_PATH, {"deviceSerial": device_serial,
+                                            "isDefence": is_defence})
+
+    def _device_channel(self, device_serial, channel_no=None, **data):
+        """Form data for the per-device settings, where no channelNo means the device itself"""
+        data["deviceSerial"] = device_serial
+        if channel_no is not None:
+            data["channelNo"] = channel_no
+        return data
+
+    def get_pir_area(self, device_serial, channel_no=None):
+        """Get the PIR detection grid (rows, columns and one bitmask per row in area)"""
+        return self.post(PIR_GET_PATH, self._device_channel(device_serial, channel_no))
+
+    def set_pir_area(self, device_serial, area, channel_no=None):
+        """Set the PIR area; area is the list of row bitmasks pir/get returns"""
+        return self.post(PIR_SET_PATH, self._device_channel(
+            device_serial, channel_no, area=",".join(str(row) for row in area)))
+
+    def get_infrared_switch(self, device_serial, channel_no=None):
+        """Get whether infrared night vision is enabled"""
+        return self.post(INFRARED_GET_PATH, self._device_channel(device_serial, channel_no))
+
+    def set_infrared_switch(self, device_serial, enable, channel_no=None):
+        """Enable or disable infrared night vision"""
+        return self.post(INFRARED_SET_PATH, self._device_channel(device_serial, channel_no,
+                                                                 enable=int(bool(enable))))
+
+    def get_sound_switch(self, device_serial, channel_no=None):
+        """Get whether the device's audio prompts are enabled"""
+        return self.post(SOUND_GET_PATH, self._device_channel(device_serial, channel_no))
+
+    def set_sound_switch(self, device_serial, enable, channel_no=None):
+        """Enable or disable the device's audio prompts"""
+        return self.post(SOUND_SET_PATH, self._device_channel(device_serial, channel_no,
+                                                              enable=int(bool(enable))))
@@ -0,0 +1,206 @@
+"""
+Fleet discovery
+Walks the paginated device and camera lists concurrently and builds an
+in-memory index of serial -> channels, capabilities and online status
+"""
+
+import math
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+from .client import StreamRequest
+from .exceptions import EzvizError
+
+# Largest page size accepted by the list endpoints
+MAX_PAGE_SIZE = 50
+DEFAULT_MAX_WORKERS = 8
+
+ONLINE = 1
+
+
+@dataclass
+class ChannelRecord:
+    """One camera channel of a device"""
+
+    channel_no: int
+    name: Optional[str] = None
+    online: bool = True
+    encrypted: bool = False
+    video_level: Optional[int] = None
+
+    @classmethod
+    def from_api(cls, entry):
+        return cls(
+            channel_no=int(entry.get("channelNo", 1)),
+            name=entry.get("channelName"),
+            online=entry.get("status", ONLINE) == ONLINE,
+            encrypted=bool(entry.get("isEncrypt")),
+            video_level=entry.get("videoLevel"),
+        )
+
+
+@dataclass
+class DeviceRecord:
+    """A device with its channels, as known from the list endpoints"""
+
+    serial: str
+    name: Optional[str] = None
+    device_type: Optional[str] = None
+    version: Optional[str] = None
+    online: bool = False
+    defence: Optional[int] = None
+    channels: dict = field(default_factory=dict)
+    capabilities: Optional[dict] = None
+
+    @classmethod
+    def from_api(cls, entry):
+        return cls(
+            serial=entry["deviceSerial"],
+            name=entry.get("deviceName"),
+            device_type=entry.get("deviceType"),
+            version=entry.get("deviceVersion"),
+            online=entry.get("status") == ONLINE,
+            defence=entry.get("defence"),
+        )
+
+    def to_json(self):
+        record = asdict(self)
+        record["channels"] = [asdict(c) for c in self.channels.values()]
+        return record
+
+    @classmethod
+    def from_json(cls, record):
+        record = dict(record)
+        channels = record.pop("channels", [])
+        device = cls(**record)
+        for channel in channels:
+            device.channels[channel["channel_no"]] = ChannelRecord(**channel)
+        return device
+
+
+class DeviceIndex:
+    """Devices keyed by serial"""
+
+    def __init__(self, devices=None):
+        self.devices = {}
+        for device in devices or ():
+            self.devices[device.serial] = device
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __iter__(self):
+        return iter(self.devices.values())
+
+    def __contains__(self, serial):
+        return serial in self.devices
+
+    def get(self, serial):
+        return self.devices.get(serial)
+
+    def add_device(self, entry):
+        """Add or update a device from a device/list entry"""
+        device = DeviceRecord.from_api(entry)
+        existing = self.devices.get(device.serial)
+        if existing is not None:
+            device.channels = existing.channels
+            device.capabilities = existing.capabilities
+        self.devices[device.serial] = device
+        return device
+
+    def add_camera(self, entry):
+        """Add or update a channel from a camera/list or device/camera/list entry"""
+        serial = entry["deviceSerial"]
+        device = self.devices.get(serial)
+        if device is None:
+            # Shared cameras can appear without their device in device/list
+            device = self.devices[serial] = DeviceRecord(serial, online=True)
+        channel = ChannelRecord.from_api(entry)
+        device.channels[channel.channel_no] = channel
+        return channel
+
+    def online(self):
+        return [device for device in self if device.online]
+
+    def offline(self):
+        return [device for device in self if not device.online]
+
+    def stream_requests(self, protocol=2, quality=1, expire_time=None, online_only=True):
+        """StreamRequests for every known channel, skipping offline devices and channels"""
+        for device in self:
+            if online_only and not device.online:
+                continue
+            channels = device.channels.values() or [ChannelRecord(1)]
+            for channel in channels:
+                if online_only and not channel.online:
+                    continue
+                yield StreamRequest(device.serial, channel.channel_no, protocol, quality,
+                                    expire_time)
+
+    def to_json(self):
+        return {"devices": [device.to_json() for device in self]}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(DeviceRecord.from_json(record) for record in data.get("devices", []))
+
+
+def fetch_all_pages(list_page, page_size=MAX_PAGE_SIZE, executor=None):
+    """Return every entry of a paginated list endpoint
+
+    list_page(page_start, page_size) is called for page 0 to learn the total,
+    then the remaining pages are fetched concurrently on executor.
+    """
+    first = list_page(page_start=0, page_size=page_size)
+    entries = list(first.get("data") or [])
+    total = (first.get("page") or {}).get("total", len(entries))
+    pages = math.ceil(total / page_size) if page_size else 1
+    if pages <= 1:
+        return entries
+
+    def fetch(page_start):
+        return list_page(page_start=page_start, page_size=page_size).get("data") or []
+
+    if executor is None:
+        for page_start in range(1, pages):
+            entries.extend(fetch(page_start))
+    else:
+        for page in executor.map(fetch, range(1, pages)):
+            entries.extend(page)
+    return entries
+
+
+def discover(client, page_size=MAX_PAGE_SIZE, max_workers=DEFAULT_MAX_WORKERS,
+             with_capabilities=False, index=None):
+    """Build a DeviceIndex from device/list and camera/list
+
+    Both lists are paged concurrently. With with_capabilities, device/capacity
+    is also fetched for every online device; failures there leave the
+    device's capabilities unset rather than failing discovery.
+    """
+    index = index if index is not None else DeviceIndex()
+    client.ensure_token()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ezviz-discover") as pages:
+        # Separate executors so the two walks cannot starve each other of workers
+        with ThreadPoolExecutor(max_workers=2) as walks:
+            devices = walks.submit(fetch_all_pages, client.get_device_list, page_size, pages)
+            cameras = walks.submit(fetch_all_pages, client.get_camera_list, page_size, pages)
+            for entry in devices.result():
+                index.add_device(entry)
+            for entry in cameras.result():
+                index.add_camera(entry)
+
+        if with_capabilities:
+            online = index.online()
+            for device, capabilities in zip(online, pages.map(
+                    lambda d: _fetch_capabilities(client, d.serial), online)):
+                device.capabilities = capabilities
+    return index
+
+
+def _fetch_capabilities(client, serial):
+    try:
+        return client.get_device_capacity(serial).get("data")
+    except EzvizError:
+        return None
@@ -0,0 +1,83 @@
+"""
+EZVIZ Open API error codes and how callers should react to them
+Follows the catalog in lib/ezviz_errorcode.dart, whose SDK codes are the
+Open API codes offset by 100000 (110002 on the SDK side is 10002 here)
+"""
+
+SDK_CODE_OFFSET = 100000
+
+ERROR_CODES = {
+    10001: "Parameter error",
+    10002: "AccessToken abnormal or expired",
+    10004: "User does not exist",
+    10005: "AppKey abnormal",
+    10006: "IP restricted",
+    10007: "API call limit reached, please upgrade to enterprise version",
+    10008: "Signature error",
+    10011: "Cloud service not enabled",
+    10013: "Application has no permission to call this interface",
+    10017: "AppKey does not exist",
+    10018: "AccessToken and AppKey do not match",
+    10026: "Device limit exceeded for personal version, please upgrade to enterprise version",
+    10027: "AppKey limit exceeded, upgrade to enterprise version to remove restriction",
+    10028: "Personal version account daily screenshot limit exceeded, please upgrade to enterprise version",
+    10029: "Call frequency exceeded personal version limit of 20 times/min, upgrade to enterprise version",
+    10030: "AppKey and AppSecret do not match, check AppKey and AppSecret",
+    20001: "Channel does not exist",
+    20002: "Device does not exist",
+    20006: "Network error",
+    20007: "Device offline",
+    20008: "Device response timeout",
+    20014: "Incorrect device serial number",
+    20015: "Device does not support this function",
+    20018: "User does not own this device",
+    49999: "Data abnormality",
+    50000: "Server error",
+    60000: "Device does not support PTZ control",
+    60001: "User does not have PTZ control permission",
+    60020: "Command not supported",
+}
+
+# Call again after a backoff
+RETRYABLE = "retryable"
+# Call again after slowing down for this appKey
+THROTTLED = "throttled"
+# Calling again will not help
+FATAL = "fatal"
+
+# Not retryable as such: clients holding app credentials renew the token and
+# call again once, and with only an access token nothing can fix it
+TOKEN_EXPIRED = 10002
+RETRYABLE_CODES = frozenset({20006, 20008, 49999, 50000})
+THROTTLED_CODES = frozenset({10007, 10029})
+OFFLINE_CODES = frozenset({20007})
+
+
+def normalize_code(code):
+    """Convert an API or SDK error code (string or int) to an Open API int code, or None"""
+    try:
+        code = int(code)
+    except (TypeError, ValueError):
+        return None
+    if code >= SDK_CODE_OFFSET:
+        code -= SDK_CODE_OFFSET
+    return code
+
+
+def classify_code(code):
+    """Classify an error code as RETRYABLE, THROTTLED or FATAL
+
+    A missing code means the call failed before the API answered (connection
+    error, timeout, non-JSON reply) and is treated as retryable.
+    """
+    code = normalize_code(code)
+    if code is None or code in RETRYABLE_CODES:
+        return RETRYABLE
+    if code in THROTTLED_CODES:
+        return THROTTLED
+    return FATAL
+
+
+def describe_code(code):
+    """Human readable message for an error code"""
+    return ERROR_CODES.get(normalize_code(code), "Unknown error")
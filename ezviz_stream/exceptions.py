@@ -0,0 +1,32 @@
+"""
+Exceptions raised by the EZVIZ Open API client
+"""
+
+
+class EzvizError(Exception):
+    """Base exception for all EZVIZ API errors"""
+
+    def __init__(self, message, code=None, response=None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.response = response
+
+    def __str__(self):
+        return f"{self.message} (code: {self.code})"
+
+
+class EzvizAuthError(EzvizError):
+    """Raised when an access token cannot be obtained or is rejected"""
+
+
+class EzvizApiError(EzvizError):
+    """Raised when an API call returns a non-200 code or fails at the HTTP level"""
+
+
+class EzvizRateLimitError(EzvizApiError):
+    """Raised when the platform rejects a call because the appKey is over its rate or quota"""
+
+
+class EzvizPoolError(EzvizError):
+    """Raised when a ClientPool cannot route a call to a single account"""
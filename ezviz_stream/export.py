@@ -0,0 +1,280 @@
+"""
+Parallel playback export
+Splits a long playback window into chunks that follow the device's recording
+files, records the chunks of many cameras concurrently and reassembles each
+camera's chunks in order into one file
+"""
+
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+from .batch import DEFAULT_MAX_IN_FLIGHT, bounded_map
+from .cache import EXPIRE_TIME_FORMAT, parse_expire_time
+from .client import StreamRequest
+from .errorcodes import FATAL, classify_code
+from .exceptions import EzvizError
+from .recorder import RecordingError, record
+
+logger = logging.getLogger(__name__)
+
+# Longest stretch fetched through one playback URL
+DEFAULT_MAX_CHUNK = 3600
+# Recording files at most this many seconds apart are fetched through one URL
+DEFAULT_MERGE_GAP = 5
+# Segments prefetched per chunk; chunks themselves already run in parallel
+DEFAULT_CHUNK_PREFETCH = 2
+PLAYBACK_TYPE = "2"
+# ExportResult.error of a camera that recorded nothing in the window
+NO_RECORDINGS = "No recordings in the export window"
+
+
+def format_time(epoch):
+    """Format epoch seconds as the local "YYYY-MM-DD HH:MM:SS" the playback API expects"""
+    return time.strftime(EXPIRE_TIME_FORMAT, time.localtime(epoch))
+
+
+def parse_time(value):
+    """Parse "YYYY-MM-DD HH:MM:SS" (local), epoch seconds or epoch milliseconds"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    epoch = parse_expire_time(value)
+    if epoch is None:
+        raise ValueError(f"Unrecognised time: {value!r}")
+    return epoch
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """One playback request of an export, index-ordered within its camera"""
+
+    device_serial: str
+    channel_no: int
+    index: int
+    start: float
+    stop: float
+
+    def stream_request(self, quality=1):
+        return StreamRequest(self.device_serial, self.channel_no, protocol=2, quality=quality,
+                             type=PLAYBACK_TYPE, start_time=format_time(self.start),
+                             stop_time=format_time(self.stop))
+
+
+def merge_spans(spans, gap=DEFAULT_MERGE_GAP):
+    """Sort (start, stop) spans and join those overlapping or at most gap seconds apart"""
+    merged = []
+    for span_start, span_stop in sorted(spans):
+        if merged and span_start - merged[-1][1] <= gap:
+            merged[-1][1] = max(merged[-1][1], span_stop)
+        else:
+            merged.append([span_start, span_stop])
+    return [tuple(span) for span in merged]
+
+
+def plan_chunks(device_serial, channel_no, start, stop, recordings=None,
+                max_chunk=DEFAULT_MAX_CHUNK, merge_gap=DEFAULT_MERGE_GAP):
+    """Split start..stop (epoch seconds) into Chunks
+
+    recordings are (start, stop) epoch-second spans of the camera's recording
+    files. Chunks only cover footage that actually exists: contiguous files
+    (and files at most merge_gap seconds apart) are joined, and the joined
+    spans are cut into pieces of at most max_chunk, so devices that record
+    many short files still need few playback URLs. Without recordings the
+    window is cut into max_chunk pieces.
+    """
+    spans = merge_spans(recordings, merge_gap) if recordings is not None else [(start, stop)]
+    chunks = []
+    for span_start, span_stop in spans:
+        position, end = max(span_start, start), min(span_stop, stop)
+        while position < end:
+            piece_stop = min(end, position + max_chunk)
+            chunks.append(Chunk(device_serial, channel_no, len(chunks), position, piece_stop))
+            position = piece_stop
+    return chunks
+
+
+def list_recordings(client, device_serial, channel_no, start, stop):
+    """(start, stop) epoch-second spans of the recordings overlapping the window"""
+    response = client.get_video_by_time(device_serial, channel_no, int(start * 1000),
+                                        int(stop * 1000))
+    return [(entry["startTime"] / 1000, entry["endTime"] / 1000)
+            for entry in response.get("data") or []]
+
+
+@dataclass
+class ExportResult:
+    """Outcome of exporting one camera's window"""
+
+    device_serial: str
+    channel_no: int
+    path: Optional[str] = None
+    chunks: int = 0
+    failed: list = field(default_factory=list)
+    bytes: int = 0
+    duration: float = 0.0
+    elapsed: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def ok(self):
+        return not self.failed and self.error is None
+
+    def to_json(self):
+        record = {
+            "deviceSerial": self.device_serial,
+            "channelNo": self.channel_no,
+            "ok": self.ok,
+            "path": self.path,
+            "chunks": self.chunks,
+            "bytes": self.bytes,
+            "durationS": round(self.duration, 3),
+            "elapsedS": round(self.elapsed, 3),
+        }
+        if self.failed:
+            record["failedChunks"] = sorted(self.failed)
+        if self.error is not None:
+            record["error"] = self.error
+        return record
+
+
+class PlaybackExport:
+    """Exports one playback window for many cameras into out_dir
+
+    Each chunk is recorded to its own part file and renamed into place only
+    once complete, so re-running an interrupted export only fetches the
+    chunks that are missing. A camera's parts are concatenated into
+    {serial}_{channel}_{start}.ts as soon as all of them are present. A
+    camera with no recordings in the window, or whose parts cannot be
+    assembled, is reported with an error and does not stop the others.
+    """
+
+    def __init__(self, client, start, stop, out_dir, max_workers=DEFAULT_MAX_IN_FLIGHT,
+                 max_chunk=DEFAULT_MAX_CHUNK, prefetch=DEFAULT_CHUNK_PREFETCH, quality=1,
+                 use_recordings=True, merge_gap=DEFAULT_MERGE_GAP):
+        self.client = client
+        self.start = parse_time(start)
+        self.stop = parse_time(stop)
+        if self.stop <= self.start:
+            raise ValueError("Export window must end after it starts")
+        self.out_dir = out_dir
+        self.max_workers = max_workers
+        self.max_chunk = max_chunk
+        self.prefetch = prefetch
+        self.quality = quality
+        self.use_recordings = use_recordings
+        self.merge_gap = merge_gap
+        self._rejected = {}
+
+    def output_path(self, device_serial, channel_no):
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.start))
+        return os.path.join(self.out_dir, f"{device_serial}_{channel_no}_{stamp}.ts")
+
+    def part_path(self, chunk):
+        return f"{self.output_path(chunk.device_serial, chunk.channel_no)}.part{chunk.index:04d}"
+
+    def plan(self, device_serial, channel_no):
+        recordings = None
+        if self.use_recordings:
+            try:
+                recordings = list_recordings(self.client, device_serial, channel_no,
+                                             self.start, self.stop)
+            except EzvizError as e:
+                logger.warning("No recording list for %s/%s (%s); using fixed chunks",
+                               device_serial, channel_no, e)
+        return plan_chunks(device_serial, channel_no, self.start, self.stop, recordings,
+                           self.max_chunk, self.merge_gap)
+
+    def _record_chunk(self, chunk):
+        """Record one chunk into its part file; returns (chunk, RecordingResult or error text)"""
+        target = (chunk.device_serial, chunk.channel_no)
+        if target in self._rejected:
+            return chunk, self._rejected[target]
+        path = self.part_path(chunk)
+        if os.path.exists(path):
+            return chunk, None
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "wb") as out:
+                result = record(self.client, chunk.stream_request(self.quality), out,
+                                prefetch=self.prefetch)
+        except (EzvizError, RecordingError, OSError) as e:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            if isinstance(e, EzvizError) and classify_code(e.code) == FATAL:
+                # Unknown device, no permission...: the other chunks would fail the same way
+                self._rejected[target] = str(e)
+            logger.warning("Chunk %d of %s/%s failed: %s", chunk.index, chunk.device_serial,
+                           chunk.channel_no, e)
+            return chunk, str(e)
+        os.replace(tmp, path)
+        return chunk, result
+
+    def _assemble(self, result, chunks):
+        path = self.output_path(result.device_serial, result.channel_no)
+        try:
+            with open(path + ".tmp", "wb") as out:
+                for chunk in chunks:
+                    with open(self.part_path(chunk), "rb") as part:
+                        shutil.copyfileobj(part, out)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            # Keep the parts so a re-run only has to assemble them
+            if os.path.exists(path + ".tmp"):
+                os.remove(path + ".tmp")
+            raise
+        for chunk in chunks:
+            os.remove(self.part_path(chunk))
+        result.path = path
+        result.bytes = os.path.getsize(path)
+
+    def run(self, targets):
+        """Export every (serial, channel) target, yielding ExportResults as cameras finish"""
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.client.ensure_token()
+        targets = list(targets)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers,
+                                thread_name_prefix="ezviz-export-plan") as planner:
+            plans = dict(zip(targets, planner.map(lambda t: self.plan(*t), targets)))
+
+        results = {target: ExportResult(*target, chunks=len(chunks))
+                   for target, chunks in plans.items()}
+        remaining = {target: len(chunks) for target, chunks in plans.items()}
+        for target, count in remaining.items():
+            if not count:
+                results[target].error = NO_RECORDINGS
+                results[target].elapsed = time.perf_counter() - started
+                yield results[target]
+
+        # Interleave cameras so every camera progresses instead of one finishing first
+        ordered = sorted((chunk for chunks in plans.values() for chunk in chunks),
+                         key=lambda c: c.index)
+        for chunk, outcome in bounded_map(self._record_chunk, ordered, self.max_workers,
+                                          thread_name_prefix="ezviz-export"):
+            target = (chunk.device_serial, chunk.channel_no)
+            result = results[target]
+            if isinstance(outcome, str):
+                result.failed.append(chunk.index)
+            else:
+                result.duration += chunk.stop - chunk.start
+            remaining[target] -= 1
+            if remaining[target]:
+                continue
+            if result.ok:
+                try:
+                    self._assemble(result, plans[target])
+                except OSError as e:
+                    logger.warning("Could not assemble %s/%s: %s", result.device_serial,
+                                   result.channel_no, e)
+                    result.error = f"Could not assemble parts: {e}"
+            result.elapsed = time.perf_counter() - started
+            yield result
+
+
+def export_playback(client, targets, start, stop, out_dir, **options):
+    """Export start..stop for every (serial, channel) target; see PlaybackExport"""
+    return PlaybackExport(client, start, stop, out_dir, **options).run(targets)
@@ -0,0 +1,69 @@
+"""
+Minimal HLS playlist parsing
+Covers what live/address/get HLS URLs serve: master playlists pointing at
+variants and live or VOD media playlists of MPEG-TS segments
+"""
+
+from dataclasses import dataclass, field
+from typing import Optional
+from urllib.parse import urljoin
+
+
+@dataclass
+class Segment:
+    uri: str
+    duration: float
+    sequence: int
+
+
+@dataclass
+class Playlist:
+    """A parsed master or media playlist; URIs are absolute"""
+
+    url: str
+    segments: list = field(default_factory=list)
+    variants: list = field(default_factory=list)
+    media_sequence: int = 0
+    target_duration: Optional[float] = None
+    ended: bool = False
+
+    @property
+    def is_master(self):
+        return bool(self.variants) and not self.segments
+
+    @property
+    def duration(self):
+        return sum(segment.duration for segment in self.segments)
+
+
+def parse_playlist(text, url):
+    """Parse playlist text fetched from url"""
+    lines = [line.strip() for line in text.splitlines()]
+    if not lines or lines[0] != "#EXTM3U":
+        raise ValueError(f"Not an HLS playlist: {url}")
+    playlist = Playlist(url)
+    duration = None
+    expect_variant = False
+    for line in lines[1:]:
+        if not line:
+            continue
+        if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            playlist.media_sequence = int(line.partition(":")[2])
+        elif line.startswith("#EXT-X-TARGETDURATION:"):
+            playlist.target_duration = float(line.partition(":")[2])
+        elif line.startswith("#EXTINF:"):
+            duration = float(line.partition(":")[2].split(",")[0])
+        elif line.startswith("#EXT-X-STREAM-INF"):
+            expect_variant = True
+        elif line == "#EXT-X-ENDLIST":
+            playlist.ended = True
+        elif line.startswith("#"):
+            continue
+        elif expect_variant:
+            playlist.variants.append(urljoin(url, line))
+            expect_variant = False
+        else:
+            sequence = playlist.media_sequence + len(playlist.segments)
+            playlist.segments.append(Segment(urljoin(url, line), duration or 0.0, sequence))
+            duration = None
+    return playlist
@@ -0,0 +1,268 @@
+"""
+API call instrumentation
+Records endpoint, area domain, latency, response code, retries, client-side
+throttling and address-cache hits of every Open API call, as Prometheus
+counters/histograms and optional JSON lines
+"""
+
+import json
+import math
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Optional
+
+# Histogram upper bounds in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+@dataclass
+class CallRecord:
+    """What one client call cost, filled in by the client as it goes
+
+    latency is the whole call; requests holds the duration of each HTTP
+    request (network plus EZVIZ cloud), throttle_wait the time spent in the
+    client's own rate limiter and backoff the sleeps between retries. code
+    is "200", the API error code, or None when no API answer arrived.
+    """
+
+    endpoint: str
+    area_domain: Optional[str] = None
+    started: float = field(default_factory=time.time)
+    latency: float = 0.0
+    requests: list = field(default_factory=list)
+    throttle_wait: float = 0.0
+    backoff: float = 0.0
+    retries: int = 0
+    code: Optional[str] = None
+    error: Optional[str] = None
+    _clock_start: float = field(default_factory=time.perf_counter, repr=False)
+
+    def attempt(self, area_domain, elapsed, code):
+        """One HTTP request was answered (or failed) after elapsed seconds"""
+        self.area_domain = area_domain
+        self.requests.append(elapsed)
+        self.code = code
+
+    def waited(self, seconds):
+        self.throttle_wait += seconds
+
+    def retry(self, delay):
+        self.retries += 1
+        self.backoff += delay
+
+    def finish(self, error=None):
+        self.latency = time.perf_counter() - self._clock_start
+        if error is not None:
+            self.error = str(error)
+        return self
+
+    def to_json(self):
+        record = {
+            "ts": round(self.started, 3),
+            "endpoint": self.endpoint,
+            "areaDomain": self.area_domain,
+            "code": self.code,
+            "latencyMs": round(self.latency * 1000, 2),
+            "requestMs": [round(elapsed * 1000, 2) for elapsed in self.requests],
+            "throttleWaitMs": round(self.throttle_wait * 1000, 2),
+            "backoffMs": round(self.backoff * 1000, 2),
+            "retries": self.retries,
+        }
+        if self.error is not None:
+            record["error"] = self.error
+        return record
+
+
+class _NullRecord:
+    """CallRecord stand-in that ignores everything"""
+
+    __slots__ = ()
+
+    def attempt(self, area_domain, elapsed, code):
+        pass
+
+    def waited(self, seconds):
+        pass
+
+    def retry(self, delay):
+        pass
+
+    def finish(self, error=None):
+        return self
+
+
+_NULL_RECORD = _NullRecord()
+
+
+class Instrumentation:
+    """No-op instrumentation and the interface clients call
+
+    Clients call start() when a call begins, update the returned record and
+    pass it to on_call() when the call is over. The no-op version hands out
+    a shared record that ignores all updates.
+    """
+
+    def start(self, endpoint):
+        return _NULL_RECORD
+
+    def on_call(self, record):
+        """A call finished, successfully or not"""
+
+    def on_cache(self, endpoint, hit):
+        """An address-cache lookup was answered locally (hit) or went to the API"""
+
+
+# Shared default for clients without instrumentation
+NO_INSTRUMENTATION = Instrumentation()
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, buckets, value):
+        self.counts[bisect_left(buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(names, values):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _escape(value):
+    return str("" if value is None else value).replace("\\", r"\\").replace('"', r"\"") \
+        .replace("\n", r"\n")
+
+
+class Metrics(Instrumentation):
+    """In-process Prometheus-style metrics, optionally mirrored as JSON lines
+
+    Thread-safe; render() returns the text exposition format for a /metrics
+    endpoint or a file. With json_log (a text file), every call is also
+    written there as one JSON object per line.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, json_log=None):
+        self.buckets = tuple(sorted(buckets))
+        self.json_log = json_log
+        self._lock = threading.Lock()
+        self._calls = defaultdict(int)  # (endpoint, area_domain, code) -> count
+        self._retries = defaultdict(int)  # (endpoint, area_domain) -> count
+        self._latency = {}  # (endpoint, area_domain) -> _Histogram
+        self._request = {}
+        self._throttle_wait = defaultdict(float)  # (area_domain,) -> seconds
+        self._backoff = defaultdict(float)  # (endpoint, area_domain) -> seconds
+        self._cache = defaultdict(int)  # (endpoint, result) -> count
+
+    def _histogram(self, histograms, key):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = _Histogram(self.buckets)
+        return histogram
+
+    def start(self, endpoint):
+        return CallRecord(endpoint)
+
+    def on_call(self, record):
+        key = (record.endpoint, record.area_domain)
+        with self._lock:
+            self._calls[key + (record.code or "none",)] += 1
+            self._histogram(self._latency, key).observe(self.buckets, record.latency)
+            for elapsed in record.requests:
+                self._histogram(self._request, key).observe(self.buckets, elapsed)
+            if record.retries:
+                self._retries[key] += record.retries
+            if record.throttle_wait:
+                self._throttle_wait[(record.area_domain,)] += record.throttle_wait
+            if record.backoff:
+                self._backoff[key] += record.backoff
+            if self.json_log is not None:
+                self.json_log.write(json.dumps(record.to_json()) + "\n")
+                self.json_log.flush()
+
+    def on_cache(self, endpoint, hit):
+        with self._lock:
+            self._cache[(endpoint, "hit" if hit else "miss")] += 1
+
+    def summary(self):
+        """Per-endpoint calls, response codes, mean latency, retries and cache results"""
+        with self._lock:
+            endpoints = defaultdict(lambda: {"calls": 0, "codes": {}, "retries": 0})
+            for (endpoint, _, code), count in self._calls.items():
+                entry = endpoints[endpoint]
+                entry["calls"] += count
+                entry["codes"][code] = entry["codes"].get(code, 0) + count
+            latency = defaultdict(float)
+            for (endpoint, _), histogram in self._latency.items():
+                latency[endpoint] += histogram.sum
+            for endpoint, entry in endpoints.items():
+                entry["meanLatencyMs"] = round(latency[endpoint] / entry["calls"] * 1000, 2)
+            for (endpoint, _), retries in self._retries.items():
+                endpoints[endpoint]["retries"] += retries
+            for (endpoint, result), count in self._cache.items():
+                endpoints[endpoint]["cacheHits" if result == "hit" else "cacheMisses"] = count
+            return {
+                "endpoints": dict(endpoints),
+                "rateLimitWaitS": round(sum(self._throttle_wait.values()), 6),
+                "backoffS": round(sum(self._backoff.values()), 6),
+            }
+
+    def render(self):
+        """Prometheus text exposition of every metric"""
+        lines = []
+        with self._lock:
+            self._render_counter(lines, "ezviz_api_calls_total", "Open API calls by response code",
+                                 ("endpoint", "area_domain", "code"), self._calls)
+            self._render_histogram(lines, "ezviz_api_call_duration_seconds",
+                                   "Whole calls including retries, backoff and throttling",
+                                   self._latency)
+            self._render_histogram(lines, "ezviz_api_request_duration_seconds",
+                                   "Single HTTP requests (network plus EZVIZ cloud)",
+                                   self._request)
+            self._render_counter(lines, "ezviz_api_retries_total", "Retried requests",
+                                 ("endpoint", "area_domain"), self._retries)
+            self._render_counter(lines, "ezviz_api_backoff_seconds_total",
+                                 "Time slept between retries", ("endpoint", "area_domain"),
+                                 self._backoff)
+            self._render_counter(lines, "ezviz_rate_limit_wait_seconds_total",
+                                 "Time spent waiting for the client-side rate limiter",
+                                 ("area_domain",), self._throttle_wait)
+            self._render_counter(lines, "ezviz_address_cache_lookups_total",
+                                 "Address cache lookups by result", ("endpoint", "result"),
+                                 self._cache)
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_counter(lines, name, help_text, label_names, values):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for key, value in sorted(values.items(), key=lambda item: tuple(map(str, item[0]))):
+            lines.append(f"{name}{{{_labels(label_names, key)}}} {value:g}")
+
+    def _render_histogram(self, lines, name, help_text, histograms):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for key, histogram in sorted(histograms.items(), key=lambda item: tuple(map(str, item[0]))):
+            labels = _labels(("endpoint", "area_domain"), key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {histogram.count}")
@@ -0,0 +1,257 @@
+"""
+Multi-account credential pool
+Routes each call to an appKey that owns the device, spreads work over the
+accounts able to serve it and fails over when one of them is throttled
+"""
+
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
+from .client import (ALARM_LIST_PATH, CAMERA_LIST_PATH, DEFAULT_BASE_URL, DEVICE_LIST_PATH,
+                     EzvizClient)
+from .discovery import DEFAULT_MAX_WORKERS, MAX_PAGE_SIZE, DeviceIndex, discover
+from .errorcodes import THROTTLED, classify_code, normalize_code
+from .exceptions import EzvizApiError, EzvizPoolError
+from .retry import RateLimiter, RetryPolicy
+from .tokens import TokenManager
+
+logger = logging.getLogger(__name__)
+
+# Seconds an account is avoided after it was throttled
+DEFAULT_COOLDOWN = 60
+# Codes meaning the account cannot see the device, so another account may
+NOT_OWNER_CODES = frozenset({20002, 20018})
+# Paged lists of a whole account, which cannot be spread over several accounts page by page
+ACCOUNT_LIST_PATHS = frozenset({DEVICE_LIST_PATH, CAMERA_LIST_PATH, ALARM_LIST_PATH})
+
+
+class Account:
+    """One appKey of the pool and its load"""
+
+    def __init__(self, client, name=None):
+        self.client = client
+        self.name = name or client.app_key or client.access_token
+        self.in_flight = 0
+        self.calls = 0
+        self.throttled = 0
+        self.cool_until = 0.0
+
+    def cooling(self, now):
+        return now < self.cool_until
+
+    def to_json(self, now):
+        return {
+            "name": self.name,
+            "areaDomain": self.client.area_domain,
+            "inFlight": self.in_flight,
+            "calls": self.calls,
+            "throttled": self.throttled,
+            "coolingS": round(max(0.0, self.cool_until - now), 3),
+        }
+
+
+class ClientPool(EzvizClient):
+    """An EzvizClient spread over several accounts, possibly in different regions
+
+    Calls naming a deviceSerial go to an account that owns the device:
+    owners are learned from discover(), from devices listed per account in
+    the configuration, or by trying the accounts in turn until one does not
+    answer 20002/20018. Among the accounts that can serve a call the one
+    with the fewest calls in flight is used, so bulk jobs spread over every
+    appKey's quota. An account answering with a throttling code is avoided
+    for cooldown seconds and the call moves to the next one; only when every
+    candidate is throttled does the pool back off and retry like a single
+    client would. Calls without a deviceSerial go to the least loaded
+    account, except account-wide lists (device/list, camera/list and
+    alarm/list without a serial): their pages would come from different
+    accounts, so they raise EzvizPoolError and must be walked on each member
+    of accounts, as discover() does.
+
+    Every other EzvizClient method works unchanged, so the pool can be
+    passed to the bulk tools that address devices; AlarmPoller polls each
+    account's alarm list separately. Member clients should not retry
+    throttled errors themselves (see from_accounts), or failover waits for
+    their backoff first.
+    """
+
+    def __init__(self, clients, names=None, address_cache=None, retry_policy=None,
+                 cooldown=DEFAULT_COOLDOWN, instrumentation=None, token_manager=None,
+                 clock=time.monotonic):
+        if not clients:
+            raise ValueError("A client pool needs at least one account")
+        # The pool sends nothing itself, so it borrows a member's session rather than opening one
+        super().__init__(session=clients[0].session, address_cache=address_cache,
+                         retry_policy=retry_policy, instrumentation=instrumentation,
+                         token_manager=token_manager)
+        names = names or [None] * len(clients)
+        self.accounts = [Account(client, name) for client, name in zip(clients, names)]
+        self.cooldown = cooldown
+        self.clock = clock
+        self._owners = {}
+        self._lock = threading.Lock()
+        self._turn = itertools.count()
+
+    @classmethod
+    def from_accounts(cls, accounts, token_cache=None, retry_policy=None, rate=None,
+                      pool_maxsize=None, instrumentation=None, **options):
+        """Build a pool from account dicts
+
+        Each account has app_key and app_secret (or access_token and
+        area_domain), and optionally name, base_url (the region's token
+        host), rate (requests per second for this appKey) and devices (serials
+        it is known to own). All accounts share one TokenManager, which is
+        also the pool's, so its background renewal covers every appKey.
+        """
+        retry_policy = retry_policy or RetryPolicy()
+        member_policy = replace(retry_policy, retry_throttled=len(accounts) == 1)
+        by_key = {}
+        token_manager = TokenManager(
+            lambda app_key, app_secret: by_key[app_key].fetch_token(app_key, app_secret),
+            token_cache)
+        clients, names, owned = [], [], []
+        for account in accounts:
+            account_rate = account.get("rate", rate)
+            kwargs = {"pool_maxsize": pool_maxsize} if pool_maxsize else {}
+            clients.append(EzvizClient(
+                account.get("app_key"), account.get("app_secret"),
+                access_token=account.get("access_token"), area_domain=account.get("area_domain"),
+                base_url=account.get("base_url", DEFAULT_BASE_URL), token_manager=token_manager,
+                retry_policy=member_policy,
+                rate_limiter=RateLimiter(account_rate) if account_rate else None,
+                instrumentation=instrumentation, **kwargs))
+            names.append(account.get("name"))
+            owned.append(account.get("devices") or ())
+            if clients[-1].app_key:
+                by_key[clients[-1].app_key] = clients[-1]
+        pool = cls(clients, names, retry_policy=retry_policy, instrumentation=instrumentation,
+                   token_manager=token_manager, **options)
+        for account, serials in zip(pool.accounts, owned):
+            for serial in serials:
+                pool.add_owner(serial, account)
+        return pool
+
+    def close(self):
+        for account in self.accounts:
+            account.client.close()
+        super().close()
+
+    @property
+    def can_authenticate(self):
+        return all(account.client.can_authenticate for account in self.accounts)
+
+    def ensure_token(self):
+        """Make sure every account has a usable token"""
+        for account in self.accounts:
+            account.client.ensure_token()
+
+    def add_owner(self, serial, account):
+        with self._lock:
+            owners = self._owners.setdefault(serial, [])
+            if account not in owners:
+                owners.append(account)
+
+    def owners(self, serial):
+        with self._lock:
+            return list(self._owners.get(serial, ()))
+
+    def _forget_owner(self, serial, account):
+        with self._lock:
+            owners = self._owners.get(serial)
+            if owners and account in owners:
+                owners.remove(account)
+
+    def _choose(self, candidates):
+        """The candidate to call next: not cooling down, fewest calls in flight"""
+        now = self.clock()
+        turn = next(self._turn)
+        with self._lock:
+            ready = [a for a in candidates if not a.cooling(now)]
+            if not ready:
+                return min(candidates, key=lambda a: a.cool_until)
+            # Rotate the starting point so ties do not always land on the first account
+            start = turn % len(ready)
+            ready = ready[start:] + ready[:start]
+            return min(ready, key=lambda a: a.in_flight)
+
+    def _call(self, account, path, data):
+        with self._lock:
+            account.in_flight += 1
+            account.calls += 1
+        try:
+            return account.client.post(path, data)
+        finally:
+            with self._lock:
+                account.in_flight -= 1
+
+    def post(self, path, data=None):
+        """POST through an account able to serve the call, failing over as needed"""
+        serial = (data or {}).get("deviceSerial")
+        if not serial and path in ACCOUNT_LIST_PATHS:
+            raise EzvizPoolError(f"{path} lists one account; call it on each member of "
+                                 "ClientPool.accounts instead")
+        owners = self.owners(serial) if serial else []
+        candidates = owners or self.accounts
+        attempt = 0
+        while True:
+            error = throttled = None
+            remaining = list(candidates)
+            while remaining:
+                account = self._choose(remaining)
+                remaining.remove(account)
+                try:
+                    result = self._call(account, path, data)
+                except EzvizApiError as e:
+                    error = e
+                    code = normalize_code(e.code)
+                    if serial and code in NOT_OWNER_CODES:
+                        if owners:
+                            # Device moved or was removed: look for it everywhere next time
+                            self._forget_owner(serial, account)
+                        if len(candidates) > 1:
+                            continue
+                    elif classify_code(e.code) == THROTTLED:
+                        throttled = e
+                        with self._lock:
+                            account.throttled += 1
+                            account.cool_until = self.clock() + self.cooldown
+                        logger.info("Account %s throttled (%s); failing over", account.name,
+                                    e.code)
+                        continue
+                    raise
+                if serial and not owners:
+                    self.add_owner(serial, account)
+                return result
+            # Every candidate refused; only worth another round if one was merely throttled
+            attempt += 1
+            if throttled is None or not self.retry_policy.should_retry(THROTTLED, attempt):
+                raise throttled or error
+            time.sleep(self.retry_policy.delay(THROTTLED, attempt))
+
+    def discover(self, page_size=MAX_PAGE_SIZE, max_workers=DEFAULT_MAX_WORKERS,
+                 with_capabilities=False):
+        """Discover every account's fleet concurrently into one DeviceIndex
+
+        Devices seen by several accounts (shared devices) get all of them as
+        owners, and calls for them are spread over those accounts.
+        """
+        def walk(account):
+            return account, discover(account.client, page_size, max_workers, with_capabilities)
+
+        merged = DeviceIndex()
+        with ThreadPoolExecutor(max_workers=len(self.accounts),
+                                thread_name_prefix="ezviz-pool") as executor:
+            for account, index in executor.map(walk, self.accounts):
+                for device in index:
+                    self.add_owner(device.serial, account)
+                    merged.devices.setdefault(device.serial, device)
+        return merged
+
+    def stats(self):
+        with self._lock:
+            now = self.clock()
+            return {"accounts": [account.to_json(now) for account in self.accounts],
+                    "knownDevices": len(self._owners)}
@@ -0,0 +1,214 @@
+"""
+Stream health probing
+Checks that generated HLS, FLV and RTMP URLs actually serve media by
+fetching the playlist and a segment, the first FLV bytes, or completing
+the RTMP handshake, and measures time to first byte
+"""
+
+import os
+import socket
+import struct
+import time
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from .batch import DEFAULT_MAX_IN_FLIGHT, bounded_map, generate_urls
+from .client import StreamRequest, create_session
+from .hls import parse_playlist
+
+DEFAULT_PROBE_TIMEOUT = 5
+# Bytes read from a segment or FLV stream to prove it is flowing
+DEFAULT_READ_BYTES = 4096
+RTMP_PORT = 1935
+RTMP_VERSION = 3
+RTMP_HANDSHAKE_SIZE = 1536
+FLV_SIGNATURE = b"FLV"
+
+
+class ProbeError(Exception):
+    pass
+
+
+@dataclass
+class ProbeResult:
+    """Outcome of probing one stream URL"""
+
+    url: Optional[str]
+    request: Optional[StreamRequest] = None
+    kind: Optional[str] = None
+    error: Optional[str] = None
+    ttfb: Optional[float] = None
+    elapsed: float = 0.0
+    segments: Optional[int] = None
+    segment_ttfb: Optional[float] = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def to_json(self):
+        """Flat record for JSONL output"""
+        record = {}
+        if self.request is not None:
+            record["deviceSerial"] = self.request.device_serial
+            record["channelNo"] = self.request.channel_no
+        record.update({
+            "url": self.url,
+            "kind": self.kind,
+            "ok": self.ok,
+            "ttfbMs": _ms(self.ttfb),
+            "elapsedMs": _ms(self.elapsed),
+        })
+        if self.segments is not None:
+            record["segments"] = self.segments
+            record["segmentTtfbMs"] = _ms(self.segment_ttfb)
+        if not self.ok:
+            record["error"] = self.error
+        return record
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def stream_kind(url):
+    """hls, flv, rtmp or None for URLs that cannot be probed (ezopen)"""
+    parts = urlsplit(url)
+    if parts.scheme in ("rtmp", "rtmps"):
+        return "rtmp"
+    if parts.scheme in ("http", "https"):
+        if parts.path.endswith(".flv"):
+            return "flv"
+        return "hls"
+    return None
+
+
+class StreamProber:
+    """Probes stream URLs over one pooled HTTP session"""
+
+    def __init__(self, session=None, timeout=DEFAULT_PROBE_TIMEOUT, read_bytes=DEFAULT_READ_BYTES,
+                 pool_maxsize=DEFAULT_MAX_IN_FLIGHT):
+        self.session = session or create_session(pool_maxsize=pool_maxsize)
+        self._owns_session = session is None
+        self.timeout = timeout
+        self.read_bytes = read_bytes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._owns_session:
+            self.session.close()
+
+    def probe(self, url, request=None):
+        """Probe one URL and return a ProbeResult; never raises for stream failures"""
+        result = ProbeResult(url, request, stream_kind(url))
+        start = time.perf_counter()
+        try:
+            if result.kind == "hls":
+                self._probe_hls(result, start)
+            elif result.kind == "flv":
+                result.ttfb, head = self._first_bytes(url, start)
+                if not head.startswith(FLV_SIGNATURE):
+                    raise ProbeError("Response is not an FLV stream")
+            elif result.kind == "rtmp":
+                self._probe_rtmp(result, start)
+            else:
+                raise ProbeError("URL scheme cannot be probed")
+        except (ProbeError, ValueError, OSError, requests.RequestException) as e:
+            result.error = str(e) or type(e).__name__
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    def _first_bytes(self, url, start):
+        """(seconds from start to the first body bytes, those bytes)"""
+        with self.session.get(url, stream=True, timeout=self.timeout) as response:
+            if response.status_code != 200:
+                raise ProbeError(f"HTTP {response.status_code}")
+            for chunk in response.iter_content(self.read_bytes):
+                if chunk:
+                    return time.perf_counter() - start, chunk
+        raise ProbeError("Empty response")
+
+    def _get_playlist(self, url):
+        response = self.session.get(url, timeout=self.timeout)
+        if response.status_code != 200:
+            raise ProbeError(f"Playlist HTTP {response.status_code}")
+        return parse_playlist(response.text, response.url)
+
+    def _probe_hls(self, result, start):
+        playlist = self._get_playlist(result.url)
+        result.ttfb = time.perf_counter() - start
+        if playlist.is_master:
+            playlist = self._get_playlist(playlist.variants[0])
+        result.segments = len(playlist.segments)
+        if not playlist.segments:
+            raise ProbeError("Playlist has no segments")
+        # The newest segment is the one a live player asks for first
+        segment_start = time.perf_counter()
+        result.segment_ttfb, _ = self._first_bytes(playlist.segments[-1].uri, segment_start)
+
+    def _probe_rtmp(self, result, start):
+        parts = urlsplit(result.url)
+        with socket.create_connection((parts.hostname, parts.port or RTMP_PORT),
+                                      timeout=self.timeout) as sock:
+            # C0 + C1: version, timestamp, zero, random filler
+            sock.sendall(bytes([RTMP_VERSION]) + struct.pack(">II", 0, 0)
+                         + os.urandom(RTMP_HANDSHAKE_SIZE - 8))
+            s0 = sock.recv(1)
+            result.ttfb = time.perf_counter() - start
+            if not s0:
+                raise ProbeError("RTMP server closed the connection")
+            if s0[0] != RTMP_VERSION:
+                raise ProbeError(f"Unexpected RTMP version {s0[0]}")
+            remaining = RTMP_HANDSHAKE_SIZE
+            while remaining:
+                chunk = sock.recv(remaining)
+                if not chunk:
+                    raise ProbeError("RTMP handshake truncated")
+                remaining -= len(chunk)
+
+    def probe_many(self, targets, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        """Probe (url, request) pairs concurrently, yielding ProbeResults as they complete"""
+        return bounded_map(lambda target: self.probe(*target), targets, max_in_flight,
+                           thread_name_prefix="ezviz-probe")
+
+
+def probe_streams(client, requests, prober=None, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """Generate URLs for requests and probe each one, yielding ProbeResults as they complete
+
+    URL generation and probing overlap: a camera is probed as soon as its
+    address arrives. Cameras whose address could not be generated are
+    reported with the API error and no URL.
+    """
+    own_prober = prober is None
+    if own_prober:
+        prober = StreamProber(pool_maxsize=max_in_flight)
+    failed = []
+
+    def targets():
+        for result in generate_urls(client, requests, max_in_flight=max_in_flight):
+            url = (result.response.get("data") or {}).get("url") if result.ok else None
+            if url:
+                yield url, result.request
+            else:
+                failed.append(ProbeResult(None, result.request,
+                                          error=result.error or "No URL in response",
+                                          elapsed=result.elapsed))
+
+    try:
+        for result in prober.probe_many(targets(), max_in_flight):
+            yield result
+            while failed:
+                yield failed.pop()
+        while failed:
+            yield failed.pop()
+    finally:
+        if own_prober:
+            prober.close()
@@ -0,0 +1,258 @@
+"""
+Bulk PTZ and preset dispatch
+Runs PTZ start/stop and preset commands for many cameras at once: cameras
+are driven concurrently, each camera's commands in submission order, with
+redundant commands coalesced away before anything is sent
+"""
+
+import json
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from .batch import DEFAULT_MAX_IN_FLIGHT, bounded_map
+from .exceptions import EzvizError
+from .metrics import percentile
+
+# API direction indexes, as in the Open API documentation
+DIRECTIONS = ("up", "down", "left", "right", "up_left", "down_left", "up_right", "down_right",
+              "zoom_in", "zoom_out", "focus_near", "focus_far")
+SPEEDS = ("slow", "medium", "fast")
+
+START = "start"
+STOP = "stop"
+PRESET = "preset"
+WAIT = "wait"
+ACTIONS = (START, STOP, PRESET, WAIT)
+
+
+def parse_direction(value):
+    """Parse a direction given as an index or a name (up, zoom_in, ...)"""
+    if value is None or isinstance(value, int):
+        return value
+    text = str(value).strip().lower().replace("-", "_")
+    if text.isdigit():
+        return int(text)
+    try:
+        return DIRECTIONS.index(text)
+    except ValueError:
+        raise ValueError(f"Unknown direction: {value!r}") from None
+
+
+def parse_speed(value):
+    """Parse a speed given as an index or a name (slow, medium, fast)"""
+    if isinstance(value, int):
+        return value
+    text = str(value).strip().lower()
+    if text.isdigit():
+        return int(text)
+    try:
+        return SPEEDS.index(text)
+    except ValueError:
+        raise ValueError(f"Unknown speed: {value!r}") from None
+
+
+@dataclass(frozen=True)
+class PtzCommand:
+    """One step for one camera
+
+    action is start (direction, speed), stop (optional direction), preset
+    (index) or wait (seconds, paused between steps of the same camera).
+    """
+
+    device_serial: str
+    channel_no: int = 1
+    action: str = PRESET
+    direction: Optional[int] = None
+    speed: int = 1
+    index: Optional[int] = None
+    seconds: float = 0.0
+
+    @classmethod
+    def from_json(cls, record):
+        action = record.get("action", PRESET)
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown PTZ action: {action!r}")
+        return cls(
+            device_serial=record["deviceSerial"],
+            channel_no=int(record.get("channelNo", 1)),
+            action=action,
+            direction=parse_direction(record.get("direction")),
+            speed=parse_speed(record.get("speed", 1)),
+            index=int(record["index"]) if record.get("index") is not None else None,
+            seconds=float(record.get("seconds", 0)),
+        )
+
+    def to_json(self):
+        record = {"deviceSerial": self.device_serial, "channelNo": self.channel_no,
+                  "action": self.action}
+        if self.action in (START, STOP) and self.direction is not None:
+            record["direction"] = DIRECTIONS[self.direction] \
+                if 0 <= self.direction < len(DIRECTIONS) else self.direction
+        if self.action == START:
+            record["speed"] = self.speed
+        if self.action == PRESET:
+            record["index"] = self.index
+        if self.action == WAIT:
+            record["seconds"] = self.seconds
+        return record
+
+
+def move(device_serial, channel_no, direction, seconds, speed=1):
+    """start / wait / stop commands moving a camera in one direction for a while"""
+    direction = parse_direction(direction)
+    return [PtzCommand(device_serial, channel_no, START, direction, parse_speed(speed)),
+            PtzCommand(device_serial, channel_no, WAIT, seconds=seconds),
+            PtzCommand(device_serial, channel_no, STOP, direction)]
+
+
+def coalesce(commands):
+    """Drop commands of one camera that cannot change where it ends up
+
+    - a start repeating the movement this run already started
+    - a start immediately cancelled by a stop with no wait in between; the
+      stop goes too if the camera was idle before the start (stopped earlier
+      in this run), otherwise it is still sent, as the camera may have been
+      moving already
+    - a preset move immediately superseded by another preset move
+    Every other stop is sent. Returns (kept, dropped) lists, kept in the
+    original order.
+    """
+    commands = list(commands)
+    dropped = _redundant(commands)
+    return ([c for i, c in enumerate(commands) if i not in dropped],
+            [c for i, c in enumerate(commands) if i in dropped])
+
+
+# Movement of a camera this run has not started or stopped itself
+_UNKNOWN = object()
+
+
+def _redundant(commands):
+    """Positions of the commands coalesce() drops"""
+    kept, dropped = [], set()
+    # None when idle, (direction, speed) when moving
+    moving = _UNKNOWN
+    moving_before = {}  # position of a kept start -> movement before it
+    for position, command in enumerate(commands):
+        if command.action == START:
+            if moving == (command.direction, command.speed):
+                dropped.add(position)
+                continue
+            moving_before[position] = moving
+            moving = (command.direction, command.speed)
+        elif command.action == STOP:
+            last = kept[-1] if kept else None
+            if last is not None and commands[last].action == START \
+                    and command.direction in (None, commands[last].direction):
+                before = moving_before[last]
+                if before is None:
+                    dropped |= {kept.pop(), position}
+                    moving = None
+                    continue
+                if command.direction is None:
+                    # The stop alone leaves the camera idle, whatever it was doing
+                    dropped.add(kept.pop())
+            if command.direction is None or \
+                    moving not in (None, _UNKNOWN) and command.direction == moving[0]:
+                moving = None
+            elif moving is not None:
+                # Stopped one direction of an unknown movement: it may still be moving
+                moving = _UNKNOWN
+        elif command.action == PRESET:
+            if kept and commands[kept[-1]].action == PRESET:
+                dropped.add(kept.pop())
+            moving = _UNKNOWN
+        kept.append(position)
+    return dropped
+
+
+@dataclass
+class PtzResult:
+    """Outcome of one dispatched (or coalesced) command"""
+
+    command: PtzCommand
+    error: Optional[str] = None
+    code: Optional[str] = None
+    elapsed: float = 0.0
+    coalesced: bool = False
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def to_json(self):
+        record = self.command.to_json()
+        record["ok"] = self.ok
+        if self.coalesced:
+            record["coalesced"] = True
+        else:
+            record["elapsedMs"] = round(self.elapsed * 1000, 1)
+        if not self.ok:
+            record["code"] = self.code
+            record["error"] = self.error
+        return record
+
+
+def _execute(client, command):
+    start = time.perf_counter()
+    try:
+        if command.action == START:
+            client.ptz_start(command.device_serial, command.channel_no, command.direction,
+                             command.speed)
+        elif command.action == STOP:
+            client.ptz_stop(command.device_serial, command.channel_no, command.direction)
+        elif command.action == PRESET:
+            client.preset_move(command.device_serial, command.channel_no, command.index)
+        else:
+            time.sleep(command.seconds)
+    except EzvizError as e:
+        return PtzResult(command, e.message, e.code, time.perf_counter() - start)
+    return PtzResult(command, elapsed=time.perf_counter() - start)
+
+
+def _run_camera(client, commands, should_coalesce):
+    dropped = _redundant(commands) if should_coalesce else set()
+    return [PtzResult(command, coalesced=True) if position in dropped
+            else _execute(client, command)
+            for position, command in enumerate(commands)]
+
+
+def dispatch_ptz(client, commands, max_in_flight=DEFAULT_MAX_IN_FLIGHT, coalesce_commands=True):
+    """Run commands concurrently across cameras and in order within each camera
+
+    Yields PtzResults camera by camera as each camera's sequence finishes;
+    coalesced commands are reported with coalesced=True and never sent. A
+    failed command does not stop the rest of its camera's sequence, so a
+    trailing stop still goes out after a failed start.
+    """
+    client.ensure_token()
+    cameras = {}
+    for command in commands:
+        cameras.setdefault((command.device_serial, command.channel_no), []).append(command)
+    for results in bounded_map(lambda c: _run_camera(client, c, coalesce_commands),
+                               cameras.values(), max_in_flight, thread_name_prefix="ezviz-ptz"):
+        yield from results
+
+
+def read_commands(lines):
+    """Read PtzCommands from JSON lines, skipping blank lines and # comments"""
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield PtzCommand.from_json(json.loads(line))
+
+
+def summarize(results):
+    """Counts and latency percentiles (ms) of sent commands"""
+    sent = sorted(r.elapsed for r in results if not r.coalesced and r.command.action != WAIT)
+    summary = {
+        "sent": len(sent),
+        "coalesced": sum(r.coalesced for r in results),
+        "failed": sum(not r.ok for r in results),
+    }
+    if sent:
+        for pct in (50, 95, 99):
+            summary[f"p{pct}Ms"] = round(percentile(sent, pct) * 1000, 1)
+        summary["maxMs"] = round(sent[-1] * 1000, 1)
+    return summary
@@ -0,0 +1,241 @@
+"""
+HLS recording
+Follows the HLS playlist of a live or playback StreamRequest and streams its
+segments, in order, to a file or pipe with a bounded number prefetched in
+parallel; expired URLs are renewed and recording resumes where it stopped
+"""
+
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+import requests
+
+from .client import create_session
+from .hls import parse_playlist
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREFETCH = 4
+DEFAULT_SEGMENT_RETRIES = 3
+DEFAULT_TIMEOUT = 10
+# Consecutive URL renewals without progress before giving up
+MAX_RENEWALS = 3
+# Consecutive segments skipped as gaps, after their own retries, before giving up
+MAX_SEGMENT_FAILURES = 3
+# Statuses with which stream servers reject a lapsed URL
+EXPIRED_STATUSES = {401, 403, 404, 410}
+
+
+class RecordingError(Exception):
+    pass
+
+
+class UrlExpired(RecordingError):
+    pass
+
+
+@dataclass
+class RecordingResult:
+    """What a recording wrote"""
+
+    segments: int = 0
+    bytes: int = 0
+    duration: float = 0.0
+    renewals: int = 0
+    gaps: int = 0
+    last_sequence: Optional[int] = None
+    elapsed: float = 0.0
+
+    def to_json(self):
+        return {
+            "segments": self.segments,
+            "bytes": self.bytes,
+            "durationS": round(self.duration, 3),
+            "renewals": self.renewals,
+            "gaps": self.gaps,
+            "lastSequence": self.last_sequence,
+            "elapsedS": round(self.elapsed, 3),
+        }
+
+
+class HlsRecorder:
+    """Records the HLS stream of one StreamRequest (protocol 2) into out
+
+    out is any binary file-like object; it is flushed after every segment so
+    pipes see data immediately. At most prefetch segments are downloaded or
+    held in memory at a time. Live streams are followed until stop_event is
+    set or max_duration seconds of media were written; playback (VOD)
+    playlists end by themselves. resume_after skips segments up to and
+    including that media sequence, e.g. RecordingResult.last_sequence of
+    an interrupted playback recording. A segment that still fails after
+    segment_retries is skipped and counted as a gap; the recording only
+    fails once MAX_SEGMENT_FAILURES segments in a row were skipped.
+    """
+
+    def __init__(self, client, request, out, prefetch=DEFAULT_PREFETCH, session=None,
+                 timeout=DEFAULT_TIMEOUT, segment_retries=DEFAULT_SEGMENT_RETRIES,
+                 poll_interval=None, resume_after=None):
+        self.client = client
+        self.request = request
+        self.out = out
+        self.prefetch = max(1, prefetch)
+        self.session = session or create_session(pool_maxsize=self.prefetch)
+        self._owns_session = session is None
+        self.timeout = timeout
+        self.segment_retries = segment_retries
+        self.poll_interval = poll_interval
+        self.resume_after = resume_after
+        self.url = None
+
+    def close(self):
+        if self._owns_session:
+            self.session.close()
+
+    def _renew(self, result=None):
+        """Get a stream URL, bypassing the address cache when the current one was rejected"""
+        renew = self.url is not None
+        response = self.client.get_live_address(self.request, use_cache=not renew)
+        url = (response.get("data") or {}).get("url")
+        if not url:
+            raise RecordingError("live/address/get returned no URL")
+        if renew and result is not None:
+            result.renewals += 1
+            logger.info("Renewed stream URL for %s/%s", self.request.device_serial,
+                        self.request.channel_no)
+        self.url = url
+
+    def _get(self, url):
+        """GET with retries for transient failures; raises UrlExpired when the URL was rejected"""
+        for attempt in range(1, self.segment_retries + 2):
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+            except requests.RequestException as e:
+                error = e
+            else:
+                if response.status_code == 200:
+                    return response
+                if response.status_code in EXPIRED_STATUSES:
+                    raise UrlExpired(f"HTTP {response.status_code} for {url}")
+                error = RecordingError(f"HTTP {response.status_code} for {url}")
+            if attempt <= self.segment_retries:
+                time.sleep(min(2.0, 0.2 * 2 ** (attempt - 1)))
+        raise RecordingError(f"Giving up on {url}: {error}")
+
+    def _playlist(self):
+        response = self._get(self.url)
+        playlist = parse_playlist(response.text, response.url)
+        if playlist.is_master:
+            response = self._get(playlist.variants[0])
+            playlist = parse_playlist(response.text, response.url)
+        return playlist
+
+    def _download(self, segment):
+        return self._get(segment.uri).content
+
+    def run(self, stop_event=None, max_duration=None):
+        """Record until the stream ends, stop_event is set or max_duration is reached"""
+        result = RecordingResult(last_sequence=self.resume_after)
+        start = time.perf_counter()
+        pending = deque()
+        queued = self.resume_after
+        failed_renewals = 0
+        failed_segments = 0
+        if self.url is None:
+            self._renew()
+
+        def done():
+            return ((stop_event is not None and stop_event.is_set())
+                    or (max_duration is not None and result.duration >= max_duration))
+
+        def write_head():
+            nonlocal failed_segments
+            segment, future = pending.popleft()
+            try:
+                data = future.result()
+            except UrlExpired:
+                raise
+            except RecordingError as e:
+                failed_segments += 1
+                if failed_segments >= MAX_SEGMENT_FAILURES:
+                    raise RecordingError(f"{failed_segments} segments in a row failed, "
+                                         f"last: {e}") from e
+                result.gaps += 1
+                result.last_sequence = segment.sequence
+                logger.warning("Skipping segment %d of %s: %s", segment.sequence,
+                               self.request.device_serial, e)
+                return
+            failed_segments = 0
+            self.out.write(data)
+            self.out.flush()
+            result.segments += 1
+            result.bytes += len(data)
+            result.duration += segment.duration
+            result.last_sequence = segment.sequence
+
+        with ThreadPoolExecutor(max_workers=self.prefetch,
+                                thread_name_prefix="ezviz-record") as executor:
+            try:
+                while not done():
+                    try:
+                        playlist = self._playlist()
+                        if queued is not None and playlist.segments and not playlist.ended \
+                                and playlist.segments[-1].sequence < queued:
+                            # A renewed live URL restarted its numbering
+                            queued = playlist.segments[0].sequence - 1
+                        fresh = [s for s in playlist.segments if queued is None or s.sequence > queued]
+                        if queued is not None and fresh and fresh[0].sequence > queued + 1:
+                            result.gaps += 1
+                            logger.warning("Missed segments %d-%d of %s", queued + 1,
+                                           fresh[0].sequence - 1, self.request.device_serial)
+                        for segment in fresh:
+                            while len(pending) >= self.prefetch and not done():
+                                write_head()
+                            if done():
+                                break
+                            pending.append((segment, executor.submit(self._download, segment)))
+                            queued = segment.sequence
+                        if playlist.ended:
+                            while pending and not done():
+                                write_head()
+                            break
+                        while pending and pending[0][1].done() and not done():
+                            write_head()
+                        failed_renewals = 0
+                    except UrlExpired:
+                        # Drop prefetched segments of the dead URL and re-read the playlist
+                        for _, future in pending:
+                            future.cancel()
+                        queued = result.last_sequence
+                        pending.clear()
+                        failed_renewals += 1
+                        if failed_renewals > MAX_RENEWALS:
+                            raise RecordingError("Stream URL keeps being rejected after renewal")
+                        self._renew(result)
+                        continue
+                    if stop_event is not None:
+                        stop_event.wait(self._poll_delay(playlist))
+                    else:
+                        time.sleep(self._poll_delay(playlist))
+            finally:
+                for _, future in pending:
+                    future.cancel()
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    def _poll_delay(self, playlist):
+        if self.poll_interval is not None:
+            return self.poll_interval
+        return (playlist.target_duration or 2) / 2
+
+
+def record(client, request, out, stop_event=None, max_duration=None, **options):
+    """Record request into out with an HlsRecorder and return the RecordingResult"""
+    recorder = HlsRecorder(client, request, out, **options)
+    try:
+        return recorder.run(stop_event, max_duration)
+    finally:
+        recorder.close()
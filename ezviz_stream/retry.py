@@ -0,0 +1,151 @@
+"""
+Client-side rate limiting and retry scheduling
+Token buckets per appKey/area domain adapt to throttling responses, and
+RetryPolicy decides whether and when to call again based on the error code
+"""
+
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+from .errorcodes import FATAL, THROTTLED, classify_code
+
+
+class TokenBucket:
+    """Token bucket whose rate backs off on throttling and recovers on success (AIMD)"""
+
+    def __init__(self, rate, burst=None, min_rate=None, recovery_step=None,
+                 backoff_factor=0.5, clock=time.monotonic):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.min_rate = min_rate if min_rate is not None else rate / 20
+        self.recovery_step = recovery_step if recovery_step is not None else rate / 50
+        self.backoff_factor = backoff_factor
+        self.clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, tokens=1):
+        """Take tokens and return how long the caller must wait before using them"""
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def try_acquire(self, tokens=1):
+        """Take tokens only if they are available right now"""
+        with self._lock:
+            self._refill(self.clock())
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+    def acquire(self, tokens=1):
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens=1):
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def on_throttled(self):
+        """Cut the rate and empty the bucket after the server pushed back"""
+        with self._lock:
+            self._refill(self.clock())
+            self.rate = max(self.min_rate, self.rate * self.backoff_factor)
+            self._tokens = min(self._tokens, 0)
+
+    def on_success(self):
+        """Creep the rate back towards its configured maximum"""
+        if self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self.recovery_step)
+
+
+class RateLimiter:
+    """One adaptive TokenBucket per key, typically (appKey, area domain)
+
+    rate is in requests per second. Keys are created on first use.
+    """
+
+    def __init__(self, rate, burst=None, **bucket_options):
+        self.rate = rate
+        self.burst = burst
+        self.bucket_options = bucket_options
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, key):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst, **self.bucket_options)
+                self._buckets[key] = bucket
+            return bucket
+
+    def acquire(self, key):
+        self.bucket(key).acquire()
+
+    async def acquire_async(self, key):
+        await self.bucket(key).acquire_async()
+
+    def on_throttled(self, key):
+        self.bucket(key).on_throttled()
+
+    def on_success(self, key):
+        self.bucket(key).on_success()
+
+    def rates(self):
+        """Current rate per key"""
+        with self._lock:
+            return {key: bucket.rate for key, bucket in self._buckets.items()}
+
+
+@dataclass
+class RetryPolicy:
+    """Jittered exponential backoff driven by the error classification
+
+    Fatal errors are never retried. Throttled errors wait at least
+    throttle_delay so the appKey has a chance to recover, or are raised at
+    once without retry_throttled, e.g. when another appKey can take over.
+    """
+
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+    throttle_delay: float = 5.0
+    retry_throttled: bool = True
+
+    def classify(self, error):
+        return classify_code(error.code)
+
+    def should_retry(self, kind, attempt):
+        """Whether a call that failed on attempt (1-based) with this kind of error should run again"""
+        if kind == THROTTLED and not self.retry_throttled:
+            return False
+        return kind != FATAL and attempt < self.max_attempts
+
+    def delay(self, kind, attempt):
+        """Seconds to wait before the next attempt (full jitter)"""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        delay = random.uniform(0, ceiling)
+        if kind == THROTTLED:
+            delay = max(delay, self.throttle_delay)
+        return delay
+
+
+NO_RETRY = RetryPolicy(max_attempts=1)
@@ -0,0 +1,258 @@
+"""
+Bulk device configuration
+Diffs a desired state for the defence, PIR, infrared and sound settings of a
+fleet against what the devices report and writes only what differs
+"""
+
+import json
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from .batch import DEFAULT_MAX_IN_FLIGHT, bounded_map
+from .errorcodes import OFFLINE_CODES, normalize_code
+from .exceptions import EzvizAuthError, EzvizError
+
+# Desired-state entry applied to every device of the discovered fleet
+ALL_DEVICES = "*"
+
+UNCHANGED = "unchanged"
+CHANGED = "changed"
+PLANNED = "planned"
+FAILED = "failed"
+
+# Errors after which every other call to the same device fails too: offline,
+# unknown or foreign device, and appKey/token problems
+DEVICE_FAILURE_CODES = OFFLINE_CODES | frozenset({20002, 20014, 20018})
+AUTH_FAILURE_CODES = frozenset({10002, 10005, 10017, 10018, 10030})
+
+
+def _switch(value):
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in ("1", "on", "true", "enable", "enabled"):
+            return 1
+        if text in ("0", "off", "false", "disable", "disabled"):
+            return 0
+        raise ValueError(f"Not a switch value: {value!r}")
+    return int(bool(value))
+
+
+def _defence(value):
+    if isinstance(value, str) and not value.strip().isdigit():
+        return _switch(value)
+    return int(value)
+
+
+def _pir_area(value):
+    if isinstance(value, str):
+        value = value.split(",")
+    return [int(row) for row in value]
+
+
+@dataclass(frozen=True)
+class Setting:
+    """How to read, write and compare one configurable setting"""
+
+    name: str
+    parse: Callable
+    read: Callable  # (client, serial, channel_no) -> value
+    write: Callable  # (client, serial, channel_no, value)
+    # Device-wide settings ignore channelNo
+    per_channel: bool = True
+
+
+def _read_defence(client, serial, channel_no):
+    return (client.get_device_info(serial).get("data") or {}).get("defence")
+
+
+def _read_data(method, field):
+    def read(client, serial, channel_no):
+        return (getattr(client, method)(serial, channel_no).get("data") or {}).get(field)
+    return read
+
+
+SETTINGS = {setting.name: setting for setting in (
+    Setting("defence", _defence, _read_defence,
+            lambda client, serial, channel_no, value: client.set_defence(serial, value),
+            per_channel=False),
+    Setting("pir", _pir_area, _read_data("get_pir_area", "area"),
+            lambda client, serial, channel_no, value: client.set_pir_area(serial, value,
+                                                                         channel_no)),
+    Setting("infrared", _switch, _read_data("get_infrared_switch", "enable"),
+            lambda client, serial, channel_no, value: client.set_infrared_switch(serial, value,
+                                                                                channel_no)),
+    Setting("sound", _switch, _read_data("get_sound_switch", "enable"),
+            lambda client, serial, channel_no, value: client.set_sound_switch(serial, value,
+                                                                             channel_no)),
+)}
+
+
+@dataclass
+class SettingResult:
+    """Outcome of reconciling one setting of one device or channel"""
+
+    device_serial: str
+    channel_no: Optional[int]
+    setting: str
+    desired: object
+    current: object = None
+    status: str = UNCHANGED
+    error: Optional[str] = None
+    code: Optional[str] = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self):
+        return self.status != FAILED
+
+    def to_json(self):
+        record = {
+            "deviceSerial": self.device_serial,
+            "channelNo": self.channel_no,
+            "setting": self.setting,
+            "desired": self.desired,
+            "current": self.current,
+            "status": self.status,
+            "elapsedMs": round(self.elapsed * 1000, 1),
+        }
+        if not self.ok:
+            record["code"] = self.code
+            record["error"] = self.error
+        return record
+
+
+def read_desired_state(fp):
+    """Read desired-state entries from a JSON list or JSON lines
+
+    Each entry has deviceSerial (or "*" for every discovered device), an
+    optional channelNo and any of the SETTINGS names as keys, e.g.
+    {"deviceSerial": "*", "sound": "off"}.
+    """
+    text = fp.read()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines()
+            if line.strip() and not line.lstrip().startswith("#")]
+
+
+def resolve_desired_state(entries, index=None):
+    """{(serial, channel_no): {setting: parsed value}} from desired-state entries
+
+    "*" entries apply to every device of index (a DeviceIndex); entries
+    naming a device override them. Unknown setting names raise ValueError.
+    """
+    desired = {}
+    for entry in sorted(entries, key=lambda e: e.get("deviceSerial") != ALL_DEVICES):
+        entry = dict(entry)
+        serial = entry.pop("deviceSerial")
+        channel_no = entry.pop("channelNo", None)
+        values = {}
+        for name, value in entry.items():
+            if name not in SETTINGS:
+                raise ValueError(f"Unknown setting {name!r}; choose from {', '.join(SETTINGS)}")
+            values[name] = SETTINGS[name].parse(value)
+        if serial == ALL_DEVICES:
+            if index is None:
+                raise ValueError('"*" entries need the fleet to be discovered')
+            serials = [device.serial for device in index]
+        else:
+            serials = [serial]
+        for serial in serials:
+            desired.setdefault((serial, channel_no), {}).update(values)
+    return desired
+
+
+def _device_failure(error):
+    """True when an error means every other call to the same device would fail too"""
+    if isinstance(error, EzvizAuthError):
+        return True
+    code = normalize_code(error.code)
+    return code in DEVICE_FAILURE_CODES or code in AUTH_FAILURE_CODES
+
+
+class ConfigSync:
+    """Reconciles devices with a desired state
+
+    Devices are handled concurrently, at most max_workers at a time, but the
+    calls for one device are made one after another: devices answer 20008
+    when hit by several operations at once. Current values are read first,
+    and only the differing ones are written (or, with dry_run, reported as
+    planned). With a discovery index, defence comes from the device list
+    and known-offline devices are skipped without calling them at all.
+    """
+
+    def __init__(self, client, max_workers=DEFAULT_MAX_IN_FLIGHT, index=None, dry_run=False):
+        self.client = client
+        self.max_workers = max_workers
+        self.index = index
+        self.dry_run = dry_run
+
+    def _known(self, serial, name):
+        """(True, value) when the discovery index already holds the current value"""
+        device = self.index.get(serial) if self.index is not None else None
+        if device is not None and name == "defence" and device.defence is not None:
+            return True, device.defence
+        return False, None
+
+    def _sync_device(self, serial, targets):
+        """Reconcile every (channel_no, {setting: value}) of one device"""
+        results = [SettingResult(serial, channel_no if SETTINGS[name].per_channel else None,
+                                 name, value)
+                   for channel_no, values in targets for name, value in values.items()]
+        device = self.index.get(serial) if self.index is not None else None
+        if device is not None and not device.online:
+            for result in results:
+                result.status, result.error, result.code = FAILED, "Device offline", "20007"
+            return results
+
+        # Device-wide settings requested through several channels are read and written once
+        unique = {}
+        for result in results:
+            unique.setdefault((result.channel_no, result.setting), []).append(result)
+        broken = None
+        for (channel_no, name), group in unique.items():
+            setting, head = SETTINGS[name], group[0]
+            started = time.perf_counter()
+            try:
+                if broken is not None:
+                    raise broken
+                known, current = self._known(serial, name)
+                if not known:
+                    current = setting.read(self.client, serial, channel_no)
+                current = setting.parse(current) if current is not None else None
+                head.current = current
+                if current != head.desired:
+                    head.status = PLANNED if self.dry_run else CHANGED
+                    if not self.dry_run:
+                        setting.write(self.client, serial, channel_no, head.desired)
+            except EzvizError as e:
+                head.status, head.error, head.code = FAILED, e.message, e.code
+                if _device_failure(e):
+                    broken = e
+            except (TypeError, ValueError) as e:
+                head.status, head.error = FAILED, f"Unexpected {name} value: {e}"
+            head.elapsed = time.perf_counter() - started
+            for result in group[1:]:
+                result.current, result.status = head.current, head.status
+                result.error, result.code = head.error, head.code
+        return results
+
+    def run(self, desired):
+        """Reconcile {(serial, channel_no): {setting: value}}, yielding SettingResults
+
+        Results come device by device as each device finishes.
+        """
+        self.client.ensure_token()
+        devices = {}
+        for (serial, channel_no), values in desired.items():
+            devices.setdefault(serial, []).append((channel_no, values))
+        for results in bounded_map(lambda item: self._sync_device(*item), devices.items(),
+                                   self.max_workers, thread_name_prefix="ezviz-settings"):
+            yield from results
+
+
+def apply_settings(client, desired, max_workers=DEFAULT_MAX_IN_FLIGHT, index=None,
+                   dry_run=False):
+    """Reconcile desired with a ConfigSync and yield SettingResults"""
+    return ConfigSync(client, max_workers, index, dry_run).run(desired)
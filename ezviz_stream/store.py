@@ -0,0 +1,251 @@
+"""
+Persistent SQLite snapshot of the fleet
+Holds device and channel metadata, last-known status, last issued stream
+URLs and alarm high-water marks so tooling can warm-start, and syncs
+incrementally against the API
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+
+from .cache import AddressCache, address_key
+from .client import StreamRequest
+from .discovery import (
+    DEFAULT_MAX_WORKERS,
+    MAX_PAGE_SIZE,
+    DeviceIndex,
+    DeviceRecord,
+    fetch_all_pages,
+)
+from .exceptions import EzvizError
+
+logger = logging.getLogger(__name__)
+
+# Refetch a device's channels at least this often even if it looks unchanged
+DEFAULT_MAX_AGE = 24 * 3600
+# Skip the device list entirely if the last sync is more recent than this
+DEFAULT_LIST_TTL = 300
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    serial TEXT PRIMARY KEY,
+    record TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    synced_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stream_urls (
+    key TEXT PRIMARY KEY,
+    request TEXT NOT NULL,
+    response TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS alarm_cursors (
+    source TEXT PRIMARY KEY,
+    alarm_time INTEGER NOT NULL,
+    alarm_ids TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def fingerprint(entry):
+    """Stable hash of a device/list entry, used to detect changed devices"""
+    return hashlib.sha1(json.dumps(entry, sort_keys=True).encode()).hexdigest()
+
+
+class SnapshotStore:
+    """SQLite-backed store shared safely between threads"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def get_meta(self, name, default=None):
+        rows = self._query("SELECT value FROM meta WHERE name = ?", (name,))
+        return json.loads(rows[0][0]) if rows else default
+
+    def set_meta(self, name, value):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                             (name, json.dumps(value)))
+
+    def last_sync(self):
+        return self.get_meta("last_sync", 0)
+
+    def load_index(self):
+        """DeviceIndex as of the last snapshot"""
+        rows = self._query("SELECT record FROM devices")
+        return DeviceIndex(DeviceRecord.from_json(json.loads(record)) for (record,) in rows)
+
+    def device_states(self):
+        """serial -> (fingerprint, synced_at) for every stored device"""
+        rows = self._query("SELECT serial, fingerprint, synced_at FROM devices")
+        return {serial: (fp, synced_at) for serial, fp, synced_at in rows}
+
+    def save_devices(self, devices):
+        """Upsert (DeviceRecord, fingerprint, synced_at) tuples in one transaction"""
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO devices (serial, record, fingerprint, synced_at) "
+                "VALUES (?, ?, ?, ?)",
+                [(device.serial, json.dumps(device.to_json()), fp, synced_at)
+                 for device, fp, synced_at in devices])
+
+    def delete_devices(self, serials):
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM devices WHERE serial = ?",
+                                 [(serial,) for serial in serials])
+
+    def save_address(self, request, response, expires_at):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO stream_urls (key, request, response, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                (json.dumps(address_key(request)), json.dumps(asdict(request)),
+                 json.dumps(response), expires_at))
+
+    def load_addresses(self, now=None):
+        """(StreamRequest, response, expires_at) for every stream URL not yet expired"""
+        now = time.time() if now is None else now
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM stream_urls WHERE expires_at <= ?", (now,))
+            rows = self._db.execute(
+                "SELECT request, response, expires_at FROM stream_urls").fetchall()
+        return [(StreamRequest(**json.loads(request)), json.loads(response), expires_at)
+                for request, response, expires_at in rows]
+
+    def load_alarm_cursors(self):
+        """source -> (alarm_time ms, alarm ids seen at that time)"""
+        rows = self._query("SELECT source, alarm_time, alarm_ids FROM alarm_cursors")
+        return {source: (alarm_time, set(json.loads(ids))) for source, alarm_time, ids in rows}
+
+    def save_alarm_cursors(self, cursors):
+        """Upsert source -> (alarm_time ms, alarm ids) high-water marks in one transaction"""
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO alarm_cursors (source, alarm_time, alarm_ids) "
+                "VALUES (?, ?, ?)",
+                [(source, alarm_time, json.dumps(sorted(ids)))
+                 for source, (alarm_time, ids) in cursors.items()])
+
+
+class StoredAddressCache(AddressCache):
+    """AddressCache that writes issued URLs through to a SnapshotStore and reloads them on start"""
+
+    def __init__(self, store, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+        for request, response, expires_at in store.load_addresses(self.clock()):
+            super().put(request, response, expires_at=expires_at)
+
+    def put(self, request, response, fetched_at=None, expires_at=None):
+        if expires_at is None:
+            expires_at = self.response_expires_at(request, response, fetched_at)
+        stored = super().put(request, response, expires_at=expires_at)
+        if stored:
+            self.store.save_address(request, response, expires_at)
+        return stored
+
+
+@dataclass
+class SyncResult:
+    """What an incremental sync changed"""
+
+    index: DeviceIndex
+    listed: bool = True
+    added: int = 0
+    refreshed: int = 0
+    unchanged: int = 0
+    removed: int = 0
+    failed: int = 0
+
+
+def sync(client, store, max_age=DEFAULT_MAX_AGE, list_ttl=DEFAULT_LIST_TTL,
+         max_workers=DEFAULT_MAX_WORKERS, force=False):
+    """Bring the stored snapshot up to date and return a SyncResult
+
+    If the last sync is younger than list_ttl the snapshot is returned without
+    touching the network. Otherwise device/list is walked and only devices
+    that are new, whose list entry changed, or whose channels are older than
+    max_age have their channel list refetched; devices no longer listed are
+    dropped from the store. A device whose channels cannot be fetched is
+    saved with its new list entry and its old fingerprint, and is counted
+    in failed.
+    """
+    index = store.load_index()
+    now = time.time()
+    if not force and index and now - store.last_sync() < list_ttl:
+        return SyncResult(index, listed=False, unchanged=len(index))
+
+    client.ensure_token()
+    states = store.device_states()
+    result = SyncResult(index)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ezviz-sync") as executor:
+        entries = fetch_all_pages(client.get_device_list, MAX_PAGE_SIZE, executor)
+        stale = []
+        for entry in entries:
+            serial = entry["deviceSerial"]
+            fp = fingerprint(entry)
+            known = states.get(serial)
+            device = index.add_device(entry)
+            if known is None:
+                result.added += 1
+            elif known[0] != fp or now - known[1] >= max_age:
+                result.refreshed += 1
+            else:
+                result.unchanged += 1
+                continue
+            stale.append((device, fp, known))
+
+        def refresh(item):
+            device, fp, known = item
+            try:
+                cameras = client.get_device_camera_list(device.serial).get("data") or []
+            except EzvizError as e:
+                # Keep the new list entry but the old fingerprint, so the channels are retried
+                logger.warning("Could not refresh channels of %s: %s", device.serial, e)
+                old_fp, synced_at = known or ("", 0)
+                return (device, old_fp, synced_at), False
+            device.channels.clear()
+            for camera in cameras:
+                index.add_camera(camera)
+            return (device, fp, time.time()), True
+
+        refreshed = list(executor.map(refresh, stale))
+        store.save_devices([saved for saved, ok in refreshed])
+        result.failed = sum(not ok for saved, ok in refreshed)
+
+    listed = {entry["deviceSerial"] for entry in entries}
+    removed = [serial for serial in states if serial not in listed]
+    for serial in removed:
+        index.devices.pop(serial, None)
+    store.delete_devices(removed)
+    result.removed = len(removed)
+    store.set_meta("last_sync", now)
+    return result
@@ -0,0 +1,242 @@
+"""
+Access token caching and renewal
+Tokens are cached per appKey, refreshed ahead of expiry and fetched at most once at a time
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Refresh tokens this many seconds before expireTime
+DEFAULT_REFRESH_MARGIN = 600
+# Delay before the scheduler retries a failed refresh
+RETRY_INTERVAL = 30
+# Shortest time between two scheduled renewals of the same appKey
+MIN_REFRESH_INTERVAL = 30
+
+
+@dataclass(frozen=True)
+class Token:
+    """An access token as returned by /api/lapp/token/get"""
+
+    access_token: str
+    area_domain: str
+    expire_time: int  # milliseconds since epoch
+
+    @classmethod
+    def from_response(cls, data, default_domain):
+        return cls(data["accessToken"], (data.get("areaDomain") or default_domain).rstrip("/"),
+                   int(data["expireTime"]))
+
+    def expires_in(self, now=None):
+        """Seconds until the token expires"""
+        if now is None:
+            now = time.time()
+        return self.expire_time / 1000 - now
+
+
+class TokenCache:
+    """Tokens keyed by appKey, held in memory and optionally mirrored to a JSON file
+
+    The file is created with 0600 permissions and replaced atomically, so a
+    restarted process can reuse a still-valid token without an auth round trip.
+    """
+
+    def __init__(self, path=None):
+        self.path = os.path.expanduser(path) if path else None
+        self._lock = threading.Lock()
+        self._tokens = {}
+        if self.path:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable token cache %s: %s", self.path, e)
+            return
+        now = time.time()
+        for app_key, entry in entries.items():
+            try:
+                token = Token(**entry)
+            except TypeError:
+                continue
+            if token.expires_in(now) > 0:
+                self._tokens[app_key] = token
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({key: asdict(token) for key, token in self._tokens.items()}, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, app_key):
+        with self._lock:
+            return self._tokens.get(app_key)
+
+    def put(self, app_key, token):
+        with self._lock:
+            self._tokens[app_key] = token
+            if self.path:
+                self._save()
+
+    def remove(self, app_key, access_token=None):
+        """Drop the cached token, optionally only if it is still the given one"""
+        with self._lock:
+            token = self._tokens.get(app_key)
+            if token is None or (access_token and token.access_token != access_token):
+                return
+            del self._tokens[app_key]
+            if self.path:
+                self._save()
+
+
+class RefreshSchedule:
+    """When each appKey's token is due for renewal
+
+    A token is renewed refresh_margin seconds before it expires, or half-way
+    through its remaining lifetime if that is later, and never sooner than
+    MIN_REFRESH_INTERVAL after this schedule last renewed it. Tokens issued
+    for less than the margin would otherwise be due again as soon as they
+    arrive.
+    """
+
+    def __init__(self, refresh_margin=DEFAULT_REFRESH_MARGIN):
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._renewals = {}
+
+    def renewed(self, app_key, token, now=None):
+        """Schedule the renewal of a token that was just fetched"""
+        if now is None:
+            now = time.time()
+        remaining = token.expires_in(now)
+        delay = max(MIN_REFRESH_INTERVAL, remaining - self.refresh_margin, remaining / 2)
+        with self._lock:
+            self._renewals[app_key] = (token, now + delay, now)
+
+    def due_in(self, app_key, token, now=None):
+        """Seconds until token should be renewed, <= 0 once it is due"""
+        if now is None:
+            now = time.time()
+        with self._lock:
+            renewal = self._renewals.get(app_key)
+        if renewal is not None and renewal[0] == token:
+            return renewal[1] - now
+        # Loaded from a cache file or renewed by another client sharing the cache
+        due_at = token.expire_time / 1000 - self.refresh_margin
+        if renewal is not None:
+            due_at = max(due_at, renewal[2] + MIN_REFRESH_INTERVAL)
+        return due_at - now
+
+
+class TokenManager:
+    """Hands out valid tokens, renewing them before they expire
+
+    fetch(app_key, app_secret) must return a fresh Token. Concurrent renewals
+    for the same appKey share a single fetch. Once a token is inside the
+    refresh margin callers keep getting it while one background refresh runs;
+    start() additionally renews known tokens on a timer even when idle. See
+    RefreshSchedule for when a token counts as due.
+    """
+
+    def __init__(self, fetch, cache=None, refresh_margin=DEFAULT_REFRESH_MARGIN):
+        self.fetch = fetch
+        self.cache = cache if cache is not None else TokenCache()
+        self.schedule = RefreshSchedule(refresh_margin)
+        self._flight = SingleFlight()
+        self._credentials = {}
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _refresh(self, app_key, app_secret):
+        token = self.fetch(app_key, app_secret)
+        self.cache.put(app_key, token)
+        self.schedule.renewed(app_key, token)
+        self._wakeup.set()
+        return token
+
+    def refresh(self, app_key, app_secret):
+        """Fetch a new token now, joining a refresh that is already running"""
+        self._credentials[app_key] = app_secret
+        return self._flight.do(app_key, self._refresh, app_key, app_secret)
+
+    def _refresh_in_background(self, app_key, app_secret):
+        if self._flight.in_flight(app_key):
+            return
+        threading.Thread(target=self._background_refresh, args=(app_key, app_secret),
+                         name="ezviz-token-refresh", daemon=True).start()
+
+    def _background_refresh(self, app_key, app_secret):
+        try:
+            self.refresh(app_key, app_secret)
+            return True
+        except Exception as e:
+            # The current token may still be valid; the next caller will retry
+            logger.warning("Background token refresh for %s failed: %s", app_key, e)
+            return False
+
+    def get_token(self, app_key, app_secret):
+        """Return a valid token for app_key, fetching one only when needed"""
+        self._credentials[app_key] = app_secret
+        token = self.cache.get(app_key)
+        if token is not None and token.expires_in() > 0:
+            if self.schedule.due_in(app_key, token) <= 0:
+                self._refresh_in_background(app_key, app_secret)
+            return token
+        return self.refresh(app_key, app_secret)
+
+    @property
+    def refresh_margin(self):
+        return self.schedule.refresh_margin
+
+    def invalidate(self, app_key, access_token):
+        """Forget a token the server rejected, unless it was already replaced"""
+        self.cache.remove(app_key, access_token)
+
+    def start(self):
+        """Start renewing every known token ahead of expiry from a daemon thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="ezviz-token-scheduler",
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def _next_due(self):
+        """Return (seconds until the next refresh is due, app_key) or (None, None)"""
+        due, due_key = None, None
+        for app_key in list(self._credentials):
+            token = self.cache.get(app_key)
+            wait = 0 if token is None else self.schedule.due_in(app_key, token)
+            if due is None or wait < due:
+                due, due_key = wait, app_key
+        return due, due_key
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            due, app_key = self._next_due()
+            if due is not None and due <= 0:
+                if not self._background_refresh(app_key, self._credentials[app_key]):
+                    self._stopped.wait(RETRY_INTERVAL)
+                continue
+            self._wakeup.wait(due)
@@ -6,25 +6,75 @@ A simple GUI application to get live streaming URLs from EZVIZ devices
 
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext, filedialog
-import requests
 import json
 import pyperclip
+import queue
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
 from datetime import datetime
-import threading
 import os
 
+from ezviz_stream import (AddressCache, BatchResult, EzvizClient, EzvizAuthError, StreamRequest,
+                          fetch_url, read_stream_requests)
+from ezviz_stream.batch import DEFAULT_MAX_IN_FLIGHT, write_jsonl
+
+# Upper bound on API calls the GUI runs at once, however many devices are queued
+MAX_WORKERS = DEFAULT_MAX_IN_FLIGHT
+# How often the Tk thread picks up work finished by the executor
+POLL_INTERVAL_MS = 50
+# Completions handled per poll, so a burst of results cannot stall the window
+MAX_EVENTS_PER_POLL = 200
+
+
+class BatchJob:
+    """Stream requests of one Generate click and their progress
+
+    Only the Tk thread touches a job: requests are handed to the executor a
+    few at a time and the rest wait in pending, so cancelling just drops
+    them and ignores the calls already running.
+    """
+
+    def __init__(self, requests):
+        self.pending = deque(requests)
+        self.total = len(self.pending)
+        self.running = {}  # future -> StreamRequest
+        self.done = 0
+        self.failed = 0
+        self.cancelled = False
+        self.started = time.monotonic()
+
+    @property
+    def finished(self):
+        return not self.pending and not self.running
+
+    def describe(self):
+        elapsed = time.monotonic() - self.started
+        text = f"{self.done}/{self.total} done, {self.failed} failed, {elapsed:.1f}s"
+        return text + " (cancelled)" if self.cancelled else text
+
+
 class EzvizStreamGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("EZVIZ Live Stream URL Generator")
-        self.root.geometry("700x800")
+        self.root.geometry("760x960")
         self.root.resizable(False, False)
         
         # Variables
+        self.client = EzvizClient(address_cache=AddressCache())
         self.access_token = None
         self.area_domain = None
         self.token_expire_time = None
         
+        # Workers never touch Tk: finished futures are queued and handled by _poll_events
+        self.executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="ezviz-gui")
+        self.events = queue.Queue()
+        self.job = None
+        self.device_list = []  # CSV rows; parsed with the Stream Settings of each job
+        self.results = {}  # table row id -> BatchResult
+        
         # Style
         style = ttk.Style()
         style.theme_use('clam')
@@ -35,10 +85,13 @@ class EzvizStreamGUI:
         self.root.bind('<Control-v>', lambda e: self.paste_to_focused_entry())
         self.root.bind('<Control-s>', lambda e: self.save_config())
         self.root.bind('<Control-o>', lambda e: self.load_config())
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # Make entry fields focusable
         self.app_key_entry.focus_set()
         
+        self.root.after(POLL_INTERVAL_MS, self._poll_events)
+    
     def create_widgets(self):
         # Main frame
         main_frame = ttk.Frame(self.root, padding="10")
@@ -96,15 +149,24 @@ class EzvizStreamGUI:
         device_frame = ttk.LabelFrame(main_frame, text="Device Settings", padding="10")
         device_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=10)
         
-        ttk.Label(device_frame, text="Device Serial:").grid(row=0, column=0, sticky=tk.W, pady=5)
-        self.device_serial_entry = ttk.Entry(device_frame, width=30)
-        self.device_serial_entry.grid(row=0, column=1, sticky=(tk.W, tk.E), pady=5)
-        self.device_serial_entry.insert(0, "FG3451360")  # Default value
+        ttk.Label(device_frame, text="Device Serial(s):").grid(row=0, column=0, sticky=tk.W, pady=5)
+        self.device_serial_entry = ttk.Entry(device_frame, width=50)
+        self.device_serial_entry.grid(row=0, column=1, columnspan=2, sticky=(tk.W, tk.E), pady=5)
+        ttk.Label(device_frame, text="Separate with commas or spaces; SERIAL:CHANNEL picks a channel",
+                  foreground="gray").grid(row=1, column=1, columnspan=2, sticky=tk.W)
         
-        ttk.Label(device_frame, text="Channel No:").grid(row=1, column=0, sticky=tk.W, pady=5)
+        ttk.Label(device_frame, text="Channel No:").grid(row=2, column=0, sticky=tk.W, pady=5)
         self.channel_var = tk.IntVar(value=1)
         self.channel_spinbox = ttk.Spinbox(device_frame, from_=1, to=16, textvariable=self.channel_var, width=10)
-        self.channel_spinbox.grid(row=1, column=1, sticky=tk.W, pady=5)
+        self.channel_spinbox.grid(row=2, column=1, sticky=tk.W, pady=5)
+        
+        # Device list loaded from a CSV file (device_serial, channel_no, protocol, quality, expire_time)
+        list_frame = ttk.Frame(device_frame)
+        list_frame.grid(row=3, column=0, columnspan=3, sticky=tk.W, pady=5)
+        ttk.Button(list_frame, text="Load Device List...", command=self.load_device_list).pack(side=tk.LEFT)
+        ttk.Button(list_frame, text="Clear List", command=self.clear_device_list).pack(side=tk.LEFT, padx=5)
+        self.device_list_label = ttk.Label(list_frame, text="No device list loaded")
+        self.device_list_label.pack(side=tk.LEFT, padx=5)
         
         # Stream Settings Section
         stream_frame = ttk.LabelFrame(main_frame, text="Stream Settings", padding="10")
@@ -152,27 +214,61 @@ class EzvizStreamGUI:
         self.stop_time_entry.grid(row=1, column=1, sticky=tk.W, pady=5)
         self.stop_time_entry.insert(0, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
         
-        # Generate Button
-        self.generate_button = ttk.Button(main_frame, text="Generate Stream URL", 
+        # Generate / Cancel buttons and progress
+        action_frame = ttk.Frame(main_frame)
+        action_frame.grid(row=4, column=0, columnspan=2, pady=10)
+        
+        self.generate_button = ttk.Button(action_frame, text="Generate Stream URLs",
                                          command=self.generate_url, state='disabled')
-        self.generate_button.grid(row=4, column=0, columnspan=2, pady=20)
+        self.generate_button.pack(side=tk.LEFT, padx=5)
+        
+        self.cancel_button = ttk.Button(action_frame, text="Cancel", command=self.cancel_job,
+                                        state='disabled')
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+        
+        self.progress = ttk.Progressbar(action_frame, length=250, mode='determinate')
+        self.progress.pack(side=tk.LEFT, padx=5)
+        
+        self.progress_label = ttk.Label(action_frame, text="")
+        self.progress_label.pack(side=tk.LEFT, padx=5)
         
         # Result Section
-        result_frame = ttk.LabelFrame(main_frame, text="Result", padding="10")
+        result_frame = ttk.LabelFrame(main_frame, text="Results", padding="10")
         result_frame.grid(row=5, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=10)
         
-        self.result_text = scrolledtext.ScrolledText(result_frame, height=10, width=80, wrap=tk.WORD)
-        self.result_text.grid(row=0, column=0, columnspan=2, pady=5)
+        columns = ("serial", "channel", "status", "url", "ms")
+        self.result_table = ttk.Treeview(result_frame, columns=columns, show="headings", height=10)
+        for column, heading, width, anchor in (("serial", "Device Serial", 110, tk.W),
+                                               ("channel", "Ch", 35, tk.CENTER),
+                                               ("status", "Status", 80, tk.W),
+                                               ("url", "URL / Error", 400, tk.W),
+                                               ("ms", "ms", 55, tk.E)):
+            self.result_table.heading(column, text=heading)
+            self.result_table.column(column, width=width, anchor=anchor, stretch=column == "url")
+        self.result_table.tag_configure("failed", foreground="red")
+        self.result_table.grid(row=0, column=0, sticky=(tk.W, tk.E), pady=5)
+        self.result_table.bind("<<TreeviewSelect>>", self.on_result_select)
+        
+        table_scroll = ttk.Scrollbar(result_frame, orient=tk.VERTICAL, command=self.result_table.yview)
+        table_scroll.grid(row=0, column=1, sticky=(tk.N, tk.S), pady=5)
+        self.result_table.configure(yscrollcommand=table_scroll.set)
+        
+        # Full response of the selected row
+        self.result_text = scrolledtext.ScrolledText(result_frame, height=6, width=80, wrap=tk.WORD)
+        self.result_text.grid(row=1, column=0, columnspan=2, pady=5)
         
         button_frame = ttk.Frame(result_frame)
-        button_frame.grid(row=1, column=0, columnspan=2, pady=5)
+        button_frame.grid(row=2, column=0, columnspan=2, pady=5)
         
-        self.copy_button = ttk.Button(button_frame, text="Copy URL", command=self.copy_url, state='disabled')
+        self.copy_button = ttk.Button(button_frame, text="Copy URLs", command=self.copy_url, state='disabled')
         self.copy_button.pack(side=tk.LEFT, padx=5)
         
         self.clear_button = ttk.Button(button_frame, text="Clear", command=self.clear_result)
         self.clear_button.pack(side=tk.LEFT, padx=5)
         
+        self.save_results_btn = ttk.Button(button_frame, text="Save Results", command=self.save_results)
+        self.save_results_btn.pack(side=tk.LEFT, padx=5)
+        
         # Add save/load config buttons
         self.save_config_btn = ttk.Button(button_frame, text="Save Config", command=self.save_config)
         self.save_config_btn.pack(side=tk.LEFT, padx=5)
@@ -285,7 +381,7 @@ class EzvizStreamGUI:
             
             if not filename:
                 return
-                
+            
             with open(filename, "r") as f:
                 config = json.load(f)
             
@@ -326,6 +422,47 @@ class EzvizStreamGUI:
         else:
             self.playback_frame.grid_forget()
     
+    def load_device_list(self):
+        """Load StreamRequests for many devices from a CSV file"""
+        filename = filedialog.askopenfilename(
+            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
+        )
+        if not filename:
+            return
+        try:
+            with open(filename, newline="") as f:
+                lines = f.read().splitlines()
+            # Parsed here only to report bad rows now; Stream Settings apply when generating
+            count = sum(1 for _ in read_stream_requests(lines))
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Load Error", f"Failed to load device list: {str(e)}")
+            return
+        self.device_list = lines
+        self.device_list_label.config(
+            text=f"{count} devices from {os.path.basename(filename)}")
+    
+    def clear_device_list(self):
+        self.device_list = []
+        self.device_list_label.config(text="No device list loaded")
+    
+    def _submit(self, callback, fn, *args):
+        """Run fn(*args) on the shared executor; callback(future) then runs on the Tk thread"""
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(lambda f: self.events.put((callback, f)))
+        return future
+    
+    def _poll_events(self):
+        """Handle work finished by the executor, then schedule the next poll"""
+        try:
+            for _ in range(MAX_EVENTS_PER_POLL):
+                callback, future = self.events.get_nowait()
+                callback(future)
+        except queue.Empty:
+            pass
+        if self.job is not None:
+            self.progress_label.config(text=self.job.describe())
+        self.root.after(POLL_INTERVAL_MS, self._poll_events)
+    
     def authenticate(self):
         app_key = self.app_key_entry.get().strip()
         app_secret = self.app_secret_entry.get().strip()
@@ -338,39 +475,35 @@ class EzvizStreamGUI:
         self.auth_button.config(state='disabled')
         self.auth_status.config(text="Authenticating...", foreground="orange")
         
-        # Run authentication in a separate thread
-        thread = threading.Thread(target=self._authenticate_thread, args=(app_key, app_secret))
-        thread.start()
+        self.client.app_key = app_key
+        self.client.app_secret = app_secret
+        self._submit(self._on_authenticated, self._authenticate_worker)
+    
+    def _authenticate_worker(self):
+        self.client.authenticate()
+        # Keep the token renewed ahead of expireTime from now on
+        self.client.token_manager.start()
     
-    def _authenticate_thread(self, app_key, app_secret):
+    def _on_authenticated(self, future):
         try:
-            url = "https://open.ezvizlife.com/api/lapp/token/get"
-            headers = {"Content-Type": "application/x-www-form-urlencoded"}
-            data = {
-                "appKey": app_key,
-                "appSecret": app_secret
-            }
-            
-            response = requests.post(url, headers=headers, data=data, timeout=10)
-            result = response.json()
-            
-            if result.get("code") == "200":
-                self.access_token = result["data"]["accessToken"]
-                self.area_domain = result["data"]["areaDomain"]
-                self.token_expire_time = result["data"]["expireTime"]
-                
-                self.root.after(0, self._update_auth_success)
-            else:
-                error_msg = result.get("msg", "Authentication failed")
-                self.root.after(0, self._update_auth_error, error_msg)
-                
+            future.result()
+        except EzvizAuthError as e:
+            error_msg = (e.response or {}).get("msg") or str(e)
+            self._update_auth_error(error_msg)
+            return
         except Exception as e:
-            self.root.after(0, self._update_auth_error, str(e))
+            self._update_auth_error(str(e))
+            return
+        self.access_token = self.client.access_token
+        self.area_domain = self.client.area_domain
+        self.token_expire_time = self.client.token_expire_time
+        self._update_auth_success()
     
     def _update_auth_success(self):
         self.auth_status.config(text="Authenticated successfully!", foreground="green")
         self.auth_button.config(state='normal')
-        self.generate_button.config(state='normal')
+        if self.job is None:
+            self.generate_button.config(state='normal')
         messagebox.showinfo("Success", f"Authentication successful!\nArea Domain: {self.area_domain}")
     
     def _update_auth_error(self, error_msg):
@@ -378,111 +511,178 @@ class EzvizStreamGUI:
         self.auth_button.config(state='normal')
         messagebox.showerror("Authentication Error", f"Failed to authenticate: {error_msg}")
     
+    def _stream_options(self):
+        """(protocol, quality, expire_time) from the Stream Settings fields"""
+        protocol = int(self.protocol_var.get().split(" ")[0])
+        quality = int(self.quality_var.get().split(" ")[0])
+        return protocol, quality, self.expire_var.get()
+    
+    def _read_requests(self):
+        """StreamRequests for every typed serial and the loaded device list
+        
+        Tk variables may only be read from the Tk thread, so everything the
+        workers need is collected here before anything is submitted.
+        """
+        protocol, quality, expire_time = self._stream_options()
+        channel_no = self.channel_var.get()
+        requests = []
+        for target in self.device_serial_entry.get().replace(",", " ").split():
+            serial, _, channel = target.partition(":")
+            requests.append(StreamRequest(serial, int(channel or channel_no), protocol, quality,
+                                          expire_time))
+        requests += read_stream_requests(self.device_list, protocol, quality, expire_time)
+        
+        # Add type and time parameters for playback
+        if self.stream_type_var.get() == "playback":
+            start_time = self.start_time_entry.get()
+            stop_time = self.stop_time_entry.get()
+            requests = [replace(request,
+                                type="2",  # Local recording playback
+                                start_time=start_time,
+                                stop_time=stop_time)
+                        for request in requests]
+        return requests
+    
     def generate_url(self):
         if not self.access_token or not self.area_domain:
             messagebox.showerror("Error", "Please authenticate first")
             return
         
-        device_serial = self.device_serial_entry.get().strip()
-        if not device_serial:
-            messagebox.showerror("Error", "Please enter device serial number")
+        try:
+            requests = self._read_requests()
+        except (ValueError, tk.TclError) as e:
+            messagebox.showerror("Error", f"Invalid settings: {str(e)}")
+            return
+        if not requests:
+            messagebox.showerror("Error", "Please enter a device serial or load a device list")
             return
         
+        self.clear_result()
+        self.job = BatchJob(requests)
+        self.progress.config(maximum=self.job.total, value=0)
+        self.progress_label.config(text=self.job.describe())
         self.generate_button.config(state='disabled')
-        self.result_text.delete(1.0, tk.END)
-        self.result_text.insert(tk.END, "Generating stream URL...")
-        
-        # Run URL generation in a separate thread
-        thread = threading.Thread(target=self._generate_url_thread)
-        thread.start()
+        self.auth_button.config(state='disabled')
+        self.cancel_button.config(state='normal')
+        self._fill_job(self.job)
     
-    def _generate_url_thread(self):
+    def _fill_job(self, job):
+        """Hand pending requests to the executor, keeping at most MAX_WORKERS running"""
+        while job.pending and len(job.running) < MAX_WORKERS:
+            request = job.pending.popleft()
+            future = self._submit(lambda f: self._on_result(job, f), fetch_url, self.client, request)
+            job.running[future] = request
+    
+    def _on_result(self, job, future):
+        request = job.running.pop(future)
+        # Results of a cancelled job (or of one replaced since) are dropped
+        if job is not self.job or future.cancelled():
+            return
         try:
-            device_serial = self.device_serial_entry.get().strip()
-            channel_no = self.channel_var.get()
-            protocol = self.protocol_var.get().split(" ")[0]
-            quality = self.quality_var.get().split(" ")[0]
-            expire_time = self.expire_var.get()
-            
-            url = f"{self.area_domain}/api/lapp/live/address/get"
-            headers = {"Content-Type": "application/x-www-form-urlencoded"}
-            
-            data = {
-                "accessToken": self.access_token,
-                "deviceSerial": device_serial,
-                "channelNo": channel_no,
-                "protocol": protocol,
-                "quality": quality,
-                "expireTime": expire_time
-            }
-            
-            # Add type and time parameters for playback
-            if self.stream_type_var.get() == "playback":
-                data["type"] = "2"  # Local recording playback
-                data["startTime"] = self.start_time_entry.get()
-                data["stopTime"] = self.stop_time_entry.get()
-            
-            response = requests.post(url, headers=headers, data=data, timeout=10)
-            result = response.json()
-            
-            self.root.after(0, self._update_result, result)
-            
+            result = future.result()
         except Exception as e:
-            self.root.after(0, self._update_error, str(e))
+            result = BatchResult(request, error=str(e))
+        job.done += 1
+        if not result.ok:
+            job.failed += 1
+        self._add_result(result)
+        self.progress.config(value=job.done)
+        self._fill_job(job)
+        if job.finished:
+            self._finish_job(job)
     
-    def _update_result(self, result):
-        self.result_text.delete(1.0, tk.END)
-        
-        if result.get("code") == "200":
-            data = result.get("data", {})
-            stream_url = data.get("url", "No URL in response")
-            expire_time = data.get("expireTime", "Unknown")
-            stream_id = data.get("id", "Unknown")
-            
-            result_text = f"Stream URL Generated Successfully!\n\n"
-            result_text += f"URL: {stream_url}\n\n"
-            result_text += f"Stream ID: {stream_id}\n"
-            result_text += f"Expires at: {expire_time}\n\n"
-            result_text += "=" * 50 + "\n"
-            result_text += f"Full Response:\n{json.dumps(result, indent=2)}"
-            
-            self.result_text.insert(tk.END, result_text)
-            self.copy_button.config(state='normal')
-            
-            # Highlight the URL
-            start_idx = self.result_text.search("URL:", "1.0")
-            if start_idx:
-                end_idx = self.result_text.search("\n", f"{start_idx}+5c")
-                self.result_text.tag_add("url", f"{start_idx}+5c", end_idx)
-                self.result_text.tag_config("url", foreground="blue", underline=True)
+    def _add_result(self, result):
+        record = result.to_json()
+        if result.ok:
+            values = (result.request.device_serial, result.request.channel_no, "OK",
+                      record.get("url") or "No URL in response", record["elapsedMs"])
+            tags = ()
         else:
-            error_msg = result.get("msg", "Unknown error")
-            error_code = result.get("code", "Unknown")
-            self.result_text.insert(tk.END, f"Error {error_code}: {error_msg}\n\n")
-            self.result_text.insert(tk.END, f"Full Response:\n{json.dumps(result, indent=2)}")
-            self.copy_button.config(state='disabled')
-        
+            values = (result.request.device_serial, result.request.channel_no,
+                      f"Error {result.code or ''}".strip(), result.error, record["elapsedMs"])
+            tags = ("failed",)
+        row = self.result_table.insert("", tk.END, values=values, tags=tags)
+        self.results[row] = result
+        if result.ok:
+            self.copy_button.config(state='normal')
+    
+    def cancel_job(self):
+        """Drop the requests not started yet; calls already running are left to finish"""
+        job = self.job
+        if job is None:
+            return
+        job.cancelled = True
+        job.pending.clear()
+        for future in job.running:
+            future.cancel()
+        self._finish_job(job)
+    
+    def _finish_job(self, job):
+        self.progress_label.config(text=job.describe())
+        self.job = None
         self.generate_button.config(state='normal')
+        self.auth_button.config(state='normal')
+        self.cancel_button.config(state='disabled')
     
-    def _update_error(self, error_msg):
+    def on_result_select(self, event=None):
+        """Show the full response of the selected row"""
+        selection = self.result_table.selection()
+        if not selection:
+            return
+        result = self.results[selection[0]]
         self.result_text.delete(1.0, tk.END)
-        self.result_text.insert(tk.END, f"Error: {error_msg}")
-        self.generate_button.config(state='normal')
-        self.copy_button.config(state='disabled')
+        if result.ok:
+            data = result.response.get("data", {})
+            self.result_text.insert(tk.END, f"URL: {data.get('url', 'No URL in response')}\n\n")
+            self.result_text.insert(tk.END, f"Stream ID: {data.get('id', 'Unknown')}\n")
+            self.result_text.insert(tk.END, f"Expires at: {data.get('expireTime', 'Unknown')}\n\n")
+        else:
+            self.result_text.insert(tk.END, f"Error {result.code}: {result.error}\n\n")
+        if result.response is not None:
+            self.result_text.insert(tk.END, f"Full Response:\n{json.dumps(result.response, indent=2)}")
     
     def copy_url(self):
-        # Extract just the URL from the result text
-        text = self.result_text.get(1.0, tk.END)
-        for line in text.split('\n'):
-            if line.startswith("URL:"):
-                url = line.replace("URL:", "").strip()
-                pyperclip.copy(url)
-                messagebox.showinfo("Success", "URL copied to clipboard!")
-                break
+        # URLs of the selected rows, or of every row when nothing is selected
+        rows = self.result_table.selection() or self.result_table.get_children()
+        urls = [self.results[row].to_json().get("url") for row in rows if self.results[row].ok]
+        urls = [url for url in urls if url]
+        if urls:
+            pyperclip.copy("\n".join(urls))
+            messagebox.showinfo("Success", f"{len(urls)} URL(s) copied to clipboard!")
+    
+    def save_results(self):
+        """Save every result row as JSON lines"""
+        if not self.results:
+            messagebox.showwarning("Save Error", "No results to save")
+            return
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".jsonl",
+            filetypes=[("JSON lines", "*.jsonl"), ("All files", "*.*")],
+            initialfile="ezviz_streams.jsonl"
+        )
+        if not filename:
+            return
+        try:
+            with open(filename, "w") as f:
+                count = write_jsonl((self.results[row] for row in self.result_table.get_children()), f)
+            messagebox.showinfo("Success", f"{count} results saved to {os.path.basename(filename)}")
+        except OSError as e:
+            messagebox.showerror("Save Error", f"Failed to save results: {str(e)}")
     
     def clear_result(self):
+        self.result_table.delete(*self.result_table.get_children())
+        self.results.clear()
         self.result_text.delete(1.0, tk.END)
         self.copy_button.config(state='disabled')
+        if self.job is None:
+            self.progress.config(value=0)
+            self.progress_label.config(text="")
+    
+    def on_close(self):
+        self.cancel_job()
+        self.client.token_manager.stop()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.root.destroy()
 
 def main():
     root = tk.Tk()
@@ -497,6 +697,7 @@ def main():
     # root.geometry(f"{width}x{height}+{x}+{y}")
     
     root.mainloop()
+    app.client.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
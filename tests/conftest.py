@@ -0,0 +1,16 @@
+import pytest
+
+from ezviz_stream import EzvizClient, MockEzvizServer
+
+
+@pytest.fixture
+def server():
+    with MockEzvizServer(devices=6, offline_every=3) as mock:
+        yield mock
+
+
+@pytest.fixture
+def client(server):
+    client = EzvizClient("key", "secret", base_url=server.url)
+    yield client
+    client.close()
@@ -0,0 +1,62 @@
+import asyncio
+import logging
+import time
+
+import pytest
+
+from ezviz_stream import StreamRequest, Token, TokenCache
+from ezviz_stream.cache import AddressCache
+from ezviz_stream.mockserver import error
+
+pytest.importorskip("aiohttp")
+from ezviz_stream.aio import AsyncEzvizClient  # noqa: E402
+
+TOKEN_PATH = "/api/lapp/token/get"
+LIVE_ADDRESS = "/api/lapp/live/address/get"
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_concurrent_lookups_share_one_token_and_one_call(server):
+    async def main():
+        async with AsyncEzvizClient("key", "secret", base_url=server.url) as client:
+            return await asyncio.gather(*(
+                client.get_live_address(StreamRequest("MOCK00000", 1)) for _ in range(10)))
+
+    responses = run(main())
+    assert {response["data"]["url"] for response in responses} == {responses[0]["data"]["url"]}
+    assert server.calls[TOKEN_PATH] == 1
+    assert server.calls[LIVE_ADDRESS] == 1
+
+
+def test_address_cache_serves_repeat_lookups(server):
+    async def main():
+        async with AsyncEzvizClient("key", "secret", base_url=server.url,
+                                    address_cache=AddressCache()) as client:
+            for _ in range(3):
+                await client.get_live_address(StreamRequest("MOCK00001", 1))
+
+    run(main())
+    assert server.calls[LIVE_ADDRESS] == 1
+
+
+def test_failed_background_refresh_keeps_current_token(server, caplog):
+    cache = TokenCache()
+    cache.put("key", Token("old", server.url, int((time.time() + 60) * 1000)))
+    server.routes[TOKEN_PATH] = lambda form: error(10017, "appKey does not exist")
+
+    async def main():
+        async with AsyncEzvizClient("key", "secret", base_url=server.url,
+                                    token_cache=cache) as client:
+            await client.ensure_token()
+            task = client._refresh_task
+            await task
+            return client.access_token, task
+
+    with caplog.at_level(logging.WARNING, logger="ezviz_stream.aio"):
+        access_token, task = run(main())
+    assert access_token == "old"
+    assert task.exception() is None
+    assert "Background token refresh" in caplog.text
@@ -0,0 +1,110 @@
+import time
+
+import pytest
+
+from ezviz_stream import AlarmPoller, EzvizClient, SnapshotStore
+from ezviz_stream.mockserver import ALARM_INTERVAL
+
+
+class Clock:
+    def __init__(self):
+        # Two hours back, between two alarms of MOCK00000 (whose alarms fall on multiples
+        # of ALARM_INTERVAL)
+        self.now = int(time.time()) // ALARM_INTERVAL * ALARM_INTERVAL - 7200 + 100.5
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def windows(client):
+    """(startTime, endTime) of every alarm/list call, in seconds"""
+    calls = []
+    get_alarm_list = client.get_alarm_list
+
+    def spy(serial, start_time, end_time, *args):
+        calls.append((start_time / 1000, end_time / 1000))
+        return get_alarm_list(serial, start_time, end_time, *args)
+    client.get_alarm_list = spy
+    return calls
+
+
+def test_first_poll_looks_back_and_repeats_nothing(client, windows):
+    clock = Clock()
+    poller = AlarmPoller(client, ["MOCK00000"], lookback=3600, clock=clock)
+    events = poller.poll()
+    assert len(events) == 3600 // ALARM_INTERVAL
+    assert windows[0] == pytest.approx((clock.now - 3600, clock.now), abs=0.001)
+    assert [e.alarm_time for e in events] == sorted(e.alarm_time for e in events)
+    assert poller.poll() == []
+
+
+def test_next_poll_starts_at_the_latest_alarm(client, windows):
+    clock = Clock()
+    poller = AlarmPoller(client, ["MOCK00000"], lookback=3600, clock=clock)
+    latest = poller.poll()[-1]
+    clock.now += 2 * ALARM_INTERVAL
+    events = poller.poll()
+    assert len(events) == 2
+    assert windows[-1][0] == latest.alarm_time / 1000
+    assert latest.alarm_id not in {e.alarm_id for e in events}
+
+
+def test_quiet_source_window_moves_forward_with_overlap(client, windows):
+    clock = Clock()
+    poller = AlarmPoller(client, ["MOCK00000"], lookback=60, overlap=30, clock=clock)
+    for _ in range(3):
+        assert poller.poll() == []
+        clock.now += 60
+    assert [round(end - start) for start, end in windows] == [60, 90, 90]
+    assert windows[1][0] == windows[0][1] - 30
+    assert windows[2][0] == windows[1][1] - 30
+
+
+def test_alarm_listed_late_is_still_reported(client):
+    clock = Clock()
+    clock.now -= 70  # 30 seconds after an alarm of MOCK00000
+    get_alarm_list = client.get_alarm_list
+    listed = []
+
+    def late(serial, *args):
+        # The alarm only shows up from the second call on
+        listed.append(serial)
+        if len(listed) == 1:
+            return {"data": [], "page": {"total": 0}}
+        return get_alarm_list(serial, *args)
+    client.get_alarm_list = late
+    poller = AlarmPoller(client, ["MOCK00000"], lookback=60, clock=clock)
+    assert poller.poll() == []
+    clock.now += 30
+    [event] = poller.poll()
+    assert event.alarm_time / 1000 == clock.now - 60.5
+    assert poller.poll() == []
+
+
+def test_account_source_covers_every_device(client, server):
+    clock = Clock()
+    events = AlarmPoller(client, lookback=3600, clock=clock).poll()
+    assert {e.device_serial for e in events} == set(server.devices)
+    assert len({e.alarm_id for e in events}) == len(events)
+
+
+def test_failed_source_keeps_its_cursor(client):
+    poller = AlarmPoller(client, ["MOCK00000", "NOPE"], lookback=3600, clock=Clock())
+    assert poller.poll()
+    assert "NOPE" not in poller.cursors
+    assert "MOCK00000" in poller.cursors
+
+
+def test_cursors_survive_restart(tmp_path, server):
+    clock = Clock()
+    path = str(tmp_path / "snapshot.db")
+    client = EzvizClient("key", "secret", base_url=server.url)
+    try:
+        with SnapshotStore(path) as store:
+            assert AlarmPoller(client, ["MOCK00000"], store=store, clock=clock).poll()
+        clock.now += ALARM_INTERVAL
+        with SnapshotStore(path) as store:
+            assert len(AlarmPoller(client, ["MOCK00000"], store=store, clock=clock).poll()) == 1
+    finally:
+        client.close()
@@ -0,0 +1,73 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+
+from ezviz_stream import StreamRequest, generate_urls, read_stream_requests
+from ezviz_stream.batch import bounded_map, parse_target, write_jsonl
+
+LIVE_ADDRESS = "/api/lapp/live/address/get"
+
+
+def test_bounded_map_limits_concurrency():
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def work(item):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        return item * 2
+
+    assert sorted(bounded_map(work, range(40), max_in_flight=4)) == [i * 2 for i in range(40)]
+    assert peak[0] <= 4
+
+
+def test_bounded_map_consumes_input_lazily():
+    consumed = []
+
+    def items():
+        for i in range(1000):
+            consumed.append(i)
+            yield i
+
+    results = bounded_map(lambda i: i, items(), max_in_flight=2)
+    next(results)
+    assert len(consumed) <= 3
+    results.close()
+
+
+def test_bounded_map_rejects_zero_in_flight():
+    with pytest.raises(ValueError):
+        list(bounded_map(lambda i: i, [1], max_in_flight=0))
+
+
+def test_parse_target_and_csv():
+    assert parse_target("CAM:3", protocol=3) == StreamRequest("CAM", 3, 3, 1)
+    lines = ["device_serial,channel_no,protocol,quality,expire_time", "# skipped", "",
+             "A", "B,2,flv,2,600"]
+    assert list(read_stream_requests(lines)) == [
+        StreamRequest("A", 1, 2, 1), StreamRequest("B", 2, 4, 2, 600)]
+
+
+def test_generate_urls_reports_each_request(server, client):
+    requests = [StreamRequest(f"MOCK0000{i}", 1) for i in range(6)] + [StreamRequest("NOPE", 1)]
+    results = {r.request.device_serial: r for r in generate_urls(client, requests, 3)}
+    assert len(results) == 7
+    assert results["MOCK00000"].ok and results["MOCK00000"].to_json()["url"]
+    assert results["MOCK00002"].code == "20007"
+    assert results["NOPE"].code == "20002" and not results["NOPE"].ok
+    assert server.calls[LIVE_ADDRESS] == 7
+
+
+def test_write_jsonl_flushes_records(client):
+    out = io.StringIO()
+    count = write_jsonl(generate_urls(client, [StreamRequest("MOCK00000", 1)]), out)
+    assert count == 1
+    record = json.loads(out.getvalue())
+    assert record["deviceSerial"] == "MOCK00000" and record["ok"]
@@ -0,0 +1,24 @@
+import pytest
+
+from ezviz_stream import MockEzvizServer
+from ezviz_stream.bench import bench_requests, run_benchmarks
+
+TOKEN_PATH = "/api/lapp/token/get"
+
+
+def test_bench_requests_are_distinct():
+    requests = bench_requests(50, ["A", "B", "C"])
+    assert len(set(requests)) == 50
+    assert [r.device_serial for r in requests[:4]] == ["A", "B", "C", "A"]
+
+
+@pytest.mark.parametrize("mode", ["single", "batch", "async"])
+def test_each_request_reaches_the_server(mode):
+    if mode == "async":
+        pytest.importorskip("aiohttp")
+    with MockEzvizServer(devices=3) as server:
+        [result] = run_benchmarks(server.url, modes=[mode], count=50, concurrency=8,
+                                  trace_memory=False, server=server)
+        assert server.calls[TOKEN_PATH] == 1
+    assert (result.requests, result.errors) == (50, 0)
+    assert result.server_calls == 51
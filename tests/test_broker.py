@@ -0,0 +1,98 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+from ezviz_stream import EzvizClient, StreamRequest
+from ezviz_stream.broker import StreamBroker, create_server, parse_stream_path
+from ezviz_stream.metrics import Metrics
+
+LIVE_ADDRESS = "/api/lapp/live/address/get"
+
+
+@pytest.fixture
+def serve(server):
+    started = []
+
+    def serve(client):
+        broker = StreamBroker(client)
+        http_server = create_server(broker, port=0)
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+        started.append((broker, http_server, client))
+        return broker, http_server.server_address[1]
+
+    yield serve
+    for broker, http_server, client in started:
+        http_server.shutdown()
+        http_server.server_close()
+        broker.stop()
+        client.close()
+
+
+def get(port, path):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        connection.request("GET", path)
+        response = connection.getresponse()
+        return response.status, response.getheaders(), response.read()
+    finally:
+        connection.close()
+
+
+def test_parse_stream_path():
+    request, redirect = parse_stream_path("/stream/ABC/2", "protocol=hls&quality=hd&redirect=1")
+    assert request == StreamRequest("ABC", 2, 2, 1)
+    assert redirect
+    request, redirect = parse_stream_path("/stream/ABC", "start_time=2024-01-01 00:00:00")
+    assert (request.channel_no, request.type, redirect) == (1, "2", False)
+    with pytest.raises(ValueError):
+        parse_stream_path("/streams/ABC/1", "")
+
+
+def test_stream_lookups_are_served_from_the_cache(server, serve):
+    broker, port = serve(EzvizClient("key", "secret", base_url=server.url))
+    for _ in range(3):
+        status, _, body = get(port, "/stream/MOCK00000/1?protocol=hls")
+        assert status == 200
+        assert json.loads(body)["url"].startswith(server.url)
+    assert server.calls[LIVE_ADDRESS] == 1
+    status, _, body = get(port, "/stats")
+    assert json.loads(body)["working"] == 1
+
+
+def test_redirect(server, serve):
+    _, port = serve(EzvizClient("key", "secret", base_url=server.url))
+    status, headers, _ = get(port, "/stream/MOCK00001/1?redirect=1")
+    assert status == 302
+    assert dict(headers)["Location"].startswith(server.url)
+
+
+@pytest.mark.parametrize("path, status", [
+    ("/stream/MOCK00002/1", 503),
+    ("/stream/NOPE/1", 404),
+    ("/stream/MOCK00000/x", 400),
+    ("/stream/MOCK00000/1?protocol=carrier-pigeon", 400),
+    ("/elsewhere", 400),
+])
+def test_error_statuses(server, serve, path, status):
+    _, port = serve(EzvizClient("key", "secret", base_url=server.url))
+    got, _, body = get(port, path)
+    assert got == status
+    if status == 400:
+        assert json.loads(body) == {"msg": "Expected /stream/{serial}/{channel}"}
+
+
+def test_metrics_without_collection_is_empty(server, serve):
+    _, port = serve(EzvizClient("key", "secret", base_url=server.url))
+    status, headers, body = get(port, "/metrics")
+    assert (status, body) == (200, b"")
+    assert dict(headers)["Content-Type"].startswith("text/plain")
+
+
+def test_metrics_are_exposed(server, serve):
+    _, port = serve(EzvizClient("key", "secret", base_url=server.url, instrumentation=Metrics()))
+    get(port, "/stream/MOCK00000/1")
+    status, _, body = get(port, "/metrics")
+    assert status == 200
+    assert LIVE_ADDRESS in body.decode()
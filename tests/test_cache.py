@@ -0,0 +1,92 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ezviz_stream import AddressCache, EzvizClient, StreamRequest
+from ezviz_stream.cache import parse_expire_time, response_expires_at
+
+LIVE_ADDRESS = "/api/lapp/live/address/get"
+
+
+class Clock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def response(expire_time=None):
+    return {"code": "200", "data": {"url": "https://example.com/live.m3u8",
+                                    "expireTime": expire_time}}
+
+
+def test_parse_expire_time():
+    assert parse_expire_time(1_700_000_000_000) == 1_700_000_000
+    assert parse_expire_time("1700000000000") == 1_700_000_000
+    local = time.mktime((2024, 1, 2, 3, 4, 5, 0, 0, -1))
+    assert parse_expire_time("2024-01-02 03:04:05") == local
+    assert parse_expire_time("soon") is None
+    assert parse_expire_time(None) is None
+
+
+def test_requested_lifetime_caps_expire_time():
+    request = StreamRequest("CAM", 1, expire_time=600)
+    assert response_expires_at(request, response((1000 + 3600) * 1000), 1000) == 1600
+
+
+def test_default_lifetime_caps_entries_without_requested_lifetime():
+    request = StreamRequest("CAM", 1)
+    # A server-local expireTime hours ahead of the client must not outlive the URL
+    assert response_expires_at(request, response((1000 + 5 * 3600) * 1000), 1000,
+                               default_lifetime=3600) == 1000 + 3600
+    cache = AddressCache(clock=Clock(1000), default_lifetime=1800)
+    cache.put(StreamRequest("CAM", 1), response((1000 + 5 * 3600) * 1000))
+    assert cache.expires_at(StreamRequest("CAM", 1)) == 1000 + 1800
+
+
+def test_entries_expire_with_safety_margin():
+    clock = Clock()
+    cache = AddressCache(safety_margin=60, clock=clock)
+    request = StreamRequest("CAM", 1, expire_time=600)
+    assert cache.put(request, response())
+    assert cache.get(request) is not None
+    clock.now += 600 - 60
+    assert cache.get(request) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_short_lived_responses_are_not_cached():
+    cache = AddressCache(safety_margin=60, clock=Clock())
+    assert not cache.put(StreamRequest("CAM", 1, expire_time=30), response())
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = AddressCache(max_entries=2, clock=Clock())
+    requests = [StreamRequest(f"CAM{i}", 1, expire_time=600) for i in range(3)]
+    cache.put(requests[0], response())
+    cache.put(requests[1], response())
+    cache.get(requests[0])
+    cache.put(requests[2], response())
+    assert cache.get(requests[1]) is None
+    assert cache.get(requests[0]) is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_requested_lifetime_does_not_split_entries():
+    cache = AddressCache(clock=Clock())
+    cache.put(StreamRequest("CAM", 1, expire_time=600), response())
+    assert cache.get(StreamRequest("CAM", 1, expire_time=900)) is not None
+
+
+def test_client_serves_repeated_and_concurrent_requests_from_one_call(server):
+    client = EzvizClient("key", "secret", base_url=server.url, address_cache=AddressCache())
+    request = StreamRequest("MOCK00000", 1, expire_time=600)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            urls = {r["data"]["url"] for r in executor.map(
+                lambda _: client.get_live_address(request), range(16))}
+        client.get_live_address(request)
+    finally:
+        client.close()
+    assert len(urls) == 1
+    assert server.calls[LIVE_ADDRESS] == 1
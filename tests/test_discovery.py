@@ -0,0 +1,63 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from ezviz_stream import EzvizClient, MockEzvizServer
+from ezviz_stream.discovery import DeviceIndex, discover, fetch_all_pages
+
+DEVICE_LIST = "/api/lapp/device/list"
+CAMERA_LIST = "/api/lapp/camera/list"
+CAPACITY = "/api/lapp/device/capacity"
+
+
+def pages_of(total):
+    requested = []
+
+    def list_page(page_start, page_size):
+        requested.append(page_start)
+        start = page_start * page_size
+        return {"data": list(range(start, min(start + page_size, total))),
+                "page": {"total": total, "page": page_start, "size": page_size}}
+    return list_page, requested
+
+
+def test_fetch_all_pages_walks_every_page_in_order():
+    list_page, requested = pages_of(23)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert fetch_all_pages(list_page, 5, executor) == list(range(23))
+    assert sorted(requested) == [0, 1, 2, 3, 4]
+
+
+def test_fetch_all_pages_stops_after_a_single_page():
+    list_page, requested = pages_of(3)
+    assert fetch_all_pages(list_page, 5) == [0, 1, 2]
+    assert requested == [0]
+
+
+def test_discover_pages_both_lists():
+    with MockEzvizServer(devices=23, channels=2, offline_every=5) as server:
+        client = EzvizClient("key", "secret", base_url=server.url)
+        try:
+            index = discover(client, page_size=5)
+        finally:
+            client.close()
+        assert server.calls[DEVICE_LIST] == 5
+        assert server.calls[CAMERA_LIST] == 10
+    assert len(index) == 23
+    assert all(len(device.channels) == 2 for device in index)
+    assert len(index.offline()) == 4
+    requests = list(index.stream_requests())
+    assert len(requests) == 2 * 19
+    assert all(index.get(request.device_serial).online for request in requests)
+
+
+def test_discover_with_capabilities_skips_offline_devices(server, client):
+    index = discover(client, with_capabilities=True)
+    assert server.calls[CAPACITY] == 4
+    assert index.get("MOCK00000").capabilities["support_ptz"] == "1"
+    assert index.get("MOCK00002").capabilities is None
+
+
+def test_index_round_trips_through_json(client):
+    index = discover(client)
+    restored = DeviceIndex.from_json(index.to_json())
+    assert restored.to_json() == index.to_json()
+    assert [device.serial for device in restored.offline()] == ["MOCK00002", "MOCK00005"]
@@ -0,0 +1,88 @@
+import os
+import shutil
+import time
+
+from ezviz_stream import plan_chunks
+from ezviz_stream.export import NO_RECORDINGS, export_playback, merge_spans
+from ezviz_stream.mockserver import RECORDING_GAP, RECORDING_LENGTH
+
+
+def spans(chunks):
+    return [(chunk.start, chunk.stop) for chunk in chunks]
+
+
+def test_window_without_recordings_is_cut_into_max_chunk_pieces():
+    chunks = plan_chunks("CAM", 1, 0, 2500, max_chunk=1000)
+    assert spans(chunks) == [(0, 1000), (1000, 2000), (2000, 2500)]
+    assert [chunk.index for chunk in chunks] == [0, 1, 2]
+
+
+def test_contiguous_files_are_merged_up_to_max_chunk():
+    recordings = [(i * 60, i * 60 + 60) for i in range(100)]
+    assert spans(plan_chunks("CAM", 1, 0, 6000, recordings, max_chunk=3600)) == \
+        [(0, 3600), (3600, 6000)]
+
+
+def test_overlapping_and_nearby_files_are_merged_but_gaps_are_skipped():
+    recordings = [(100, 130), (0, 10), (5, 30), (33, 40)]
+    assert spans(plan_chunks("CAM", 1, 0, 1000, recordings, merge_gap=5)) == \
+        [(0, 40), (100, 130)]
+    assert spans(plan_chunks("CAM", 1, 0, 1000, recordings, merge_gap=0)) == \
+        [(0, 30), (33, 40), (100, 130)]
+
+
+def test_chunks_are_clipped_to_the_window():
+    assert spans(plan_chunks("CAM", 1, 50, 120, [(0, 100), (110, 200)], merge_gap=0)) == \
+        [(50, 100), (110, 120)]
+
+
+def test_no_recordings_means_no_chunks():
+    assert plan_chunks("CAM", 1, 0, 1000, []) == []
+
+
+def test_merge_spans():
+    assert merge_spans([(10, 20), (0, 5), (22, 30)], gap=2) == [(0, 5), (10, 30)]
+
+
+def recorded_window(seconds, offset=100):
+    """A window starting offset seconds into yesterday's first recording file"""
+    start = (int(time.time()) - 86400) // RECORDING_LENGTH * RECORDING_LENGTH + offset
+    return start, start + seconds
+
+
+def test_export_writes_one_file_per_camera(server, client, tmp_path):
+    start, stop = recorded_window(60)
+    results = list(export_playback(client, [("MOCK00000", 1), ("MOCK00001", 1)], start, stop,
+                                   str(tmp_path)))
+    assert len(results) == 2
+    for result in results:
+        assert result.ok and result.chunks == 1
+        assert os.path.getsize(result.path) == result.bytes > 0
+    assert not [name for name in os.listdir(tmp_path) if ".part" in name]
+
+
+def test_camera_without_recordings_is_reported(server, client, tmp_path):
+    start, stop = recorded_window(40, offset=RECORDING_LENGTH - RECORDING_GAP + 10)
+    [result] = export_playback(client, [("MOCK00000", 1)], start, stop, str(tmp_path))
+    assert not result.ok
+    assert (result.path, result.chunks) == (None, 0)
+    assert result.to_json()["error"] == NO_RECORDINGS
+
+
+def test_assembly_failure_only_fails_that_camera(server, client, tmp_path, monkeypatch):
+    copyfileobj = shutil.copyfileobj
+
+    def failing_copy(source, target):
+        if "MOCK00000" in target.name:
+            raise OSError(28, "No space left on device")
+        copyfileobj(source, target)
+    monkeypatch.setattr(shutil, "copyfileobj", failing_copy)
+    start, stop = recorded_window(60)
+    results = {result.device_serial: result for result in export_playback(
+        client, [("MOCK00000", 1), ("MOCK00001", 1)], start, stop, str(tmp_path))}
+    assert results["MOCK00001"].ok
+    assert not results["MOCK00000"].ok
+    assert "No space left" in results["MOCK00000"].error
+    # The part survives for a re-run; the half-written file does not
+    assert [name.rpartition(".")[2] for name in os.listdir(tmp_path)
+            if name.startswith("MOCK00000")] == ["part0000"]
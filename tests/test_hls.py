@@ -0,0 +1,44 @@
+import pytest
+
+from ezviz_stream.hls import parse_playlist
+
+MASTER = """#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=1280000
+hd/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=256000
+sd/index.m3u8?token=1
+"""
+
+MEDIA = """#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-TARGETDURATION:2
+#EXT-X-MEDIA-SEQUENCE:41
+
+#EXTINF:2.000,
+41.ts?expire=9
+#EXTINF:1.5,
+https://cdn.example.com/42.ts
+#EXT-X-ENDLIST
+"""
+
+
+def test_master_playlist_variants_are_absolute():
+    playlist = parse_playlist(MASTER, "https://host/live/ABC/1/index.m3u8")
+    assert playlist.is_master
+    assert playlist.variants == ["https://host/live/ABC/1/hd/index.m3u8",
+                                 "https://host/live/ABC/1/sd/index.m3u8?token=1"]
+
+
+def test_media_playlist_segments():
+    playlist = parse_playlist(MEDIA, "https://host/playback/ABC/1/index.m3u8")
+    assert not playlist.is_master
+    assert (playlist.target_duration, playlist.ended, playlist.duration) == (2.0, True, 3.5)
+    assert [(s.uri, s.duration, s.sequence) for s in playlist.segments] == [
+        ("https://host/playback/ABC/1/41.ts?expire=9", 2.0, 41),
+        ("https://cdn.example.com/42.ts", 1.5, 42),
+    ]
+
+
+def test_rejects_non_playlists():
+    with pytest.raises(ValueError):
+        parse_playlist("<html></html>", "https://host/index.m3u8")
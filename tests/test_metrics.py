@@ -0,0 +1,80 @@
+import io
+import json
+
+import pytest
+
+from ezviz_stream import EzvizApiError, EzvizClient, MockEzvizServer, RetryPolicy, StreamRequest
+from ezviz_stream.cache import AddressCache
+from ezviz_stream.metrics import CallRecord, Metrics, percentile
+
+LIVE_ADDRESS = "/api/lapp/live/address/get"
+
+
+def call(metrics, endpoint, latency, code="200", area_domain="https://open.example.com"):
+    record = CallRecord(endpoint)
+    record.attempt(area_domain, latency, code)
+    record.latency = latency
+    metrics.on_call(record)
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert (percentile(values, 50), percentile(values, 99), percentile(values, 100)) == (50, 99, 100)
+    assert percentile([], 95) == 0.0
+
+
+def test_render_counts_calls_and_cumulative_buckets():
+    metrics = Metrics(buckets=(0.1, 1.0))
+    call(metrics, "/a", 0.05)
+    call(metrics, "/a", 0.5)
+    call(metrics, "/a", 5.0, code="50000")
+    lines = metrics.render().splitlines()
+    labels = 'endpoint="/a",area_domain="https://open.example.com"'
+    assert f'ezviz_api_calls_total{{{labels},code="200"}} 2' in lines
+    assert f'ezviz_api_calls_total{{{labels},code="50000"}} 1' in lines
+    assert [line.rpartition(" ")[2] for line in lines
+            if line.startswith(f"ezviz_api_call_duration_seconds_bucket{{{labels}")] == \
+        ["1", "2", "3"]
+    assert f"ezviz_api_call_duration_seconds_count{{{labels}}} 3" in lines
+
+
+def test_label_values_are_escaped():
+    metrics = Metrics()
+    call(metrics, '/odd"path\\', 0.01)
+    assert 'endpoint="/odd\\"path\\\\"' in metrics.render()
+
+
+def test_summary_counts_cache_results(server):
+    metrics = Metrics()
+    with EzvizClient("key", "secret", base_url=server.url, instrumentation=metrics,
+                     address_cache=AddressCache()) as client:
+        for _ in range(3):
+            client.get_live_address(StreamRequest("MOCK00000", 1))
+    live = metrics.summary()["endpoints"][LIVE_ADDRESS]
+    assert (live["calls"], live["codes"]) == (1, {"200": 1})
+    assert (live["cacheHits"], live["cacheMisses"]) == (2, 1)
+
+
+def test_summary_counts_retries_and_backoff():
+    metrics = Metrics()
+    with MockEzvizServer(devices=1, error_rate=1.0, error_code="50000") as server:
+        with EzvizClient("key", "secret", base_url=server.url, instrumentation=metrics,
+                         retry_policy=RetryPolicy(max_attempts=3, base_delay=0.001)) as client:
+            with pytest.raises(EzvizApiError):
+                client.get_live_address(StreamRequest("MOCK00000", 1))
+    summary = metrics.summary()
+    live = summary["endpoints"][LIVE_ADDRESS]
+    assert (live["calls"], live["codes"], live["retries"]) == (1, {"50000": 1}, 2)
+    assert summary["backoffS"] >= 0
+    [retries] = [line for line in metrics.render().splitlines()
+                 if line.startswith(f'ezviz_api_retries_total{{endpoint="{LIVE_ADDRESS}"')]
+    assert retries.endswith(" 2")
+
+
+def test_json_log_has_one_line_per_call():
+    log = io.StringIO()
+    metrics = Metrics(json_log=log)
+    call(metrics, "/a", 0.01)
+    call(metrics, "/b", 0.02, code="20007")
+    records = [json.loads(line) for line in log.getvalue().splitlines()]
+    assert [record["endpoint"] for record in records] == ["/a", "/b"]
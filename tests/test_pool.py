@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+from ezviz_stream import (AlarmPoller, ClientPool, EzvizApiError, EzvizPoolError, MockEzvizServer,
+                          RetryPolicy, StreamRequest)
+from ezviz_stream.cli import main
+from ezviz_stream.discovery import fetch_all_pages
+
+LIVE_ADDRESS = "/api/lapp/live/address/get"
+
+
+@pytest.fixture
+def regions():
+    with MockEzvizServer(devices=30, serial_prefix="EU") as eu, \
+            MockEzvizServer(devices=30, serial_prefix="US") as us:
+        yield eu, us
+
+
+def make_pool(*servers, **options):
+    accounts = [{"name": f"acct{i}", "app_key": f"key{i}", "app_secret": "secret",
+                 "base_url": server.url} for i, server in enumerate(servers)]
+    return ClientPool.from_accounts(accounts, **options)
+
+
+def test_calls_are_routed_to_the_owning_account(regions):
+    eu, us = regions
+    pool = make_pool(eu, us)
+    try:
+        for _ in range(3):
+            assert pool.get_live_address(StreamRequest("US00003", 1))["code"] == "200"
+        assert pool.owners("US00003") == [pool.accounts[1]]
+        # Only the first lookup may have asked the wrong region
+        assert eu.calls[LIVE_ADDRESS] <= 1
+    finally:
+        pool.close()
+
+
+def test_discover_merges_every_account(regions):
+    pool = make_pool(*regions)
+    try:
+        index = pool.discover()
+        assert len(index) == 60
+        assert pool.owners("EU00000") == [pool.accounts[0]]
+    finally:
+        pool.close()
+
+
+def test_account_wide_lists_are_refused(regions):
+    pool = make_pool(*regions)
+    try:
+        with pytest.raises(EzvizPoolError):
+            fetch_all_pages(pool.get_device_list, 10)
+    finally:
+        pool.close()
+
+
+def test_pool_borrows_a_member_session(regions):
+    pool = make_pool(*regions)
+    try:
+        assert pool.session is pool.accounts[0].client.session
+    finally:
+        pool.close()
+
+
+def test_cli_refuses_to_sync_a_pool_into_a_snapshot(regions, tmp_path):
+    accounts = tmp_path / "accounts.json"
+    accounts.write_text(json.dumps([{"app_key": f"key{i}", "app_secret": "secret",
+                                     "base_url": server.url}
+                                    for i, server in enumerate(regions)]))
+    with pytest.raises(SystemExit, match="--store"):
+        main(["discover", "--accounts", str(accounts), "--store", str(tmp_path / "fleet.db")])
+
+
+def test_alarm_poller_keeps_one_cursor_per_account(regions):
+    pool = make_pool(*regions)
+    try:
+        expected = sum(len(AlarmPoller(account.client, lookback=3600).poll())
+                       for account in pool.accounts)
+        poller = AlarmPoller(pool, lookback=3600)
+        assert len(poller.poll()) == expected > 0
+        assert sorted(poller.cursors) == ["*:acct0", "*:acct1"]
+    finally:
+        pool.close()
+
+
+def test_throttled_account_fails_over():
+    with MockEzvizServer(devices=5, error_rate=1.0, error_code=10029) as throttled, \
+            MockEzvizServer(devices=5) as healthy:
+        pool = make_pool(throttled, healthy, cooldown=60)
+        try:
+            for i in range(5):
+                response = pool.get_live_address(StreamRequest(f"MOCK0000{i}", 1))
+                assert response["code"] == "200"
+            stats = {account["name"]: account for account in pool.stats()["accounts"]}
+            assert stats["acct0"]["throttled"] == 1
+            assert stats["acct0"]["coolingS"] > 0
+            assert healthy.calls[LIVE_ADDRESS] == 5
+        finally:
+            pool.close()
+
+
+def test_pool_backs_off_when_every_account_is_throttled():
+    with MockEzvizServer(devices=1, error_rate=1.0, error_code=10029) as first, \
+            MockEzvizServer(devices=1, error_rate=1.0, error_code=10029) as second:
+        policy = RetryPolicy(max_attempts=2, throttle_delay=0.01)
+        pool = make_pool(first, second, retry_policy=policy, cooldown=0)
+        try:
+            with pytest.raises(EzvizApiError) as excinfo:
+                pool.get_live_address(StreamRequest("MOCK00000", 1))
+            assert excinfo.value.code == "10029"
+            assert first.calls[LIVE_ADDRESS] + second.calls[LIVE_ADDRESS] >= 4
+        finally:
+            pool.close()
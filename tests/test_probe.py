@@ -0,0 +1,46 @@
+import time
+
+from ezviz_stream import StreamRequest
+from ezviz_stream.probe import StreamProber, probe_streams, stream_kind
+
+LIVE_ADDRESS = "/api/lapp/live/address/get"
+
+
+def test_stream_kind():
+    assert stream_kind("https://host/live/ABC/1/index.m3u8?expire=1") == "hls"
+    assert stream_kind("https://host/live/ABC/1.flv") == "flv"
+    assert stream_kind("rtmp://host:1935/live/ABC_1") == "rtmp"
+    assert stream_kind("ezopen://open.ezviz.com/ABC/1.hd.live") is None
+
+
+def test_probe_streams_covers_every_protocol(server, client):
+    requests = [StreamRequest("MOCK00000", 1, protocol) for protocol in (1, 2, 3, 4)]
+    requests.append(StreamRequest("MOCK00002", 1, 2))
+    results = {(r.request.device_serial, r.request.protocol): r
+               for r in probe_streams(client, requests)}
+    assert len(results) == 5
+    assert server.calls[LIVE_ADDRESS] == 5
+    hls = results["MOCK00000", 2]
+    assert (hls.ok, hls.kind) == (True, "hls")
+    assert hls.segments > 0 and hls.segment_ttfb is not None
+    assert results["MOCK00000", 3].ok and results["MOCK00000", 3].kind == "rtmp"
+    assert results["MOCK00000", 4].ok and results["MOCK00000", 4].kind == "flv"
+    assert results["MOCK00000", 1].error == "URL scheme cannot be probed"
+    offline = results["MOCK00002", 2]
+    assert offline.url is None and not offline.ok
+    assert offline.to_json()["deviceSerial"] == "MOCK00002"
+
+
+def test_expired_url_fails_the_probe(server):
+    url = server.stream_url("MOCK00000", 1, "2", time.time() - 1)
+    with StreamProber() as prober:
+        result = prober.probe(url)
+    assert not result.ok
+    assert result.error == "Playlist HTTP 403"
+
+
+def test_unreachable_host_is_reported(server):
+    with StreamProber(timeout=1) as prober:
+        result = prober.probe("http://127.0.0.1:9/live/MOCK00000/1/index.m3u8")
+    assert not result.ok
+    assert result.to_json()["error"]
@@ -0,0 +1,77 @@
+from ezviz_stream import EzvizClient, MockEzvizServer
+from ezviz_stream.ptz import PRESET, START, STOP, WAIT, PtzCommand, coalesce, dispatch_ptz, move
+
+
+def start(direction, speed=1):
+    return PtzCommand("CAM", action=START, direction=direction, speed=speed)
+
+
+def stop(direction=None):
+    return PtzCommand("CAM", action=STOP, direction=direction)
+
+
+def preset(index):
+    return PtzCommand("CAM", action=PRESET, index=index)
+
+
+def wait(seconds=1):
+    return PtzCommand("CAM", action=WAIT, seconds=seconds)
+
+
+def kept(commands):
+    return coalesce(commands)[0]
+
+
+def test_lone_stop_is_sent():
+    # The camera may already be moving when the run begins
+    assert kept([stop()]) == [stop()]
+    assert kept([stop(), stop()]) == [stop(), stop()]
+
+
+def test_start_changed_before_stop_still_stops():
+    commands = [start(0), start(1), stop()]
+    assert kept(commands) == [start(0), stop()]
+
+
+def test_start_then_stop_keeps_stop_when_camera_state_unknown():
+    assert kept([start(0), stop()]) == [stop()]
+    # A directed stop might not halt a movement started elsewhere, so nothing is dropped
+    assert kept([start(0), stop(0)]) == [start(0), stop(0)]
+
+
+def test_start_then_stop_dropped_when_camera_known_idle():
+    assert kept([stop(), start(0), stop()]) == [stop()]
+
+
+def test_repeated_start_dropped():
+    assert kept([start(0), wait(), start(0), wait(), stop()]) == \
+        [start(0), wait(), wait(), stop()]
+    # A different speed changes the movement
+    assert kept([start(0), start(0, 2)]) == [start(0), start(0, 2)]
+
+
+def test_timed_moves_are_kept():
+    commands = move("CAM", 1, "up", 1) + move("CAM", 1, "left", 1)
+    assert kept(commands) == commands
+
+
+def test_superseded_preset_dropped():
+    assert kept([preset(1), preset(2)]) == [preset(2)]
+    assert kept([preset(1), wait(), preset(2)]) == [preset(1), wait(), preset(2)]
+
+
+def test_kept_commands_preserve_order():
+    commands = [preset(1), preset(2), start(3), wait(), stop(3), stop()]
+    kept_commands, dropped = coalesce(commands)
+    assert kept_commands == [preset(2), start(3), wait(), stop(3), stop()]
+    assert dropped == [preset(1)]
+
+
+def test_dispatch_sends_stop_only_file():
+    with MockEzvizServer(devices=3) as server:
+        client = EzvizClient("key", "secret", base_url=server.url)
+        commands = [PtzCommand(serial, action=STOP) for serial in server.devices]
+        results = list(dispatch_ptz(client, commands))
+        client.close()
+    assert all(result.ok and not result.coalesced for result in results)
+    assert len(server.ptz_log) == 3
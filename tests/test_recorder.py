@@ -0,0 +1,59 @@
+import io
+import time
+
+import pytest
+
+from ezviz_stream import StreamRequest
+from ezviz_stream.export import PLAYBACK_TYPE, format_time
+from ezviz_stream.mockserver import segment_bytes
+from ezviz_stream.recorder import MAX_SEGMENT_FAILURES, RecordingError, record
+
+SEGMENT_SIZE = len(segment_bytes("MOCK00000", "1", 0))
+
+
+def playback(seconds):
+    start = int(time.time()) - 3600
+    return StreamRequest("MOCK00000", 1, 2, type=PLAYBACK_TYPE, start_time=format_time(start),
+                         stop_time=format_time(start + seconds))
+
+
+def fail_segments(server, failing):
+    dispatch_get = server.dispatch_get
+
+    def dispatch(url):
+        name = url.path.rsplit("/", 1)[-1]
+        if name.endswith(".ts") and int(name[:-3]) in failing:
+            return 500, "text/plain", b"Segment unavailable"
+        return dispatch_get(url)
+    server.dispatch_get = dispatch
+
+
+def test_playback_is_recorded_in_order(server, client):
+    out = io.BytesIO()
+    result = record(client, playback(60), out)
+    assert (result.segments, result.gaps, result.last_sequence) == (6, 0, 5)
+    assert result.duration == 60
+    assert result.bytes == len(out.getvalue()) == 6 * SEGMENT_SIZE
+
+
+def test_failed_segment_is_skipped_as_a_gap(server, client):
+    fail_segments(server, {2})
+    out = io.BytesIO()
+    result = record(client, playback(60), out, segment_retries=0)
+    assert (result.segments, result.gaps, result.last_sequence) == (5, 1, 5)
+    assert result.bytes == len(out.getvalue()) == 5 * SEGMENT_SIZE
+
+
+def test_consecutive_segment_failures_abort(server, client):
+    fail_segments(server, set(range(1, 1 + MAX_SEGMENT_FAILURES)))
+    out = io.BytesIO()
+    with pytest.raises(RecordingError):
+        record(client, playback(60), out, segment_retries=0)
+    assert len(out.getvalue()) == SEGMENT_SIZE
+
+
+def test_live_recording_stops_at_max_duration(server, client):
+    result = record(client, StreamRequest("MOCK00001", 1, 2), io.BytesIO(), max_duration=2,
+                    poll_interval=0.05)
+    assert result.segments >= 1
+    assert result.duration >= 2
@@ -0,0 +1,108 @@
+import pytest
+
+from ezviz_stream import (EzvizApiError, EzvizClient, MockEzvizServer, RetryPolicy, StreamRequest,
+                          TokenBucket)
+from ezviz_stream.errorcodes import FATAL, RETRYABLE, THROTTLED, classify_code
+
+LIVE_ADDRESS = "/api/lapp/live/address/get"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_classify_code():
+    assert classify_code("10029") == THROTTLED
+    assert classify_code(110029) == THROTTLED
+    assert classify_code("20008") == RETRYABLE
+    assert classify_code(None) == RETRYABLE
+    assert classify_code("20015") == FATAL
+
+
+def test_bucket_allows_burst_then_paces():
+    clock = Clock()
+    bucket = TokenBucket(10, burst=2, clock=clock)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1)
+    assert not bucket.try_acquire()
+    clock.now += 1
+    assert bucket.try_acquire()
+
+
+def test_bucket_backs_off_and_recovers():
+    bucket = TokenBucket(10, clock=Clock(), min_rate=2, recovery_step=1)
+    bucket.on_throttled()
+    assert bucket.rate == 5
+    for _ in range(3):
+        bucket.on_throttled()
+    assert bucket.rate == 2
+    for _ in range(20):
+        bucket.on_success()
+    assert bucket.rate == 10
+
+
+def test_throttling_empties_the_bucket():
+    bucket = TokenBucket(10, burst=5, clock=Clock())
+    bucket.on_throttled()
+    assert bucket.reserve() > 0
+
+
+def test_policy_decisions():
+    policy = RetryPolicy(max_attempts=3)
+    assert policy.should_retry(RETRYABLE, 1)
+    assert not policy.should_retry(RETRYABLE, 3)
+    assert not policy.should_retry(FATAL, 1)
+    assert policy.should_retry(THROTTLED, 1)
+    assert not RetryPolicy(retry_throttled=False).should_retry(THROTTLED, 1)
+
+
+def test_policy_delays():
+    policy = RetryPolicy(base_delay=1, max_delay=4, throttle_delay=5)
+    for attempt in range(1, 6):
+        assert 0 <= policy.delay(RETRYABLE, attempt) <= 4
+        assert policy.delay(THROTTLED, attempt) >= 5
+
+
+def test_client_retries_retryable_errors_only():
+    policy = RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.001)
+    for code, expected_calls in (("50000", 3), ("20015", 1)):
+        with MockEzvizServer(devices=1, error_rate=1.0, error_code=code) as server:
+            client = EzvizClient("key", "secret", base_url=server.url, retry_policy=policy)
+            try:
+                with pytest.raises(EzvizApiError) as excinfo:
+                    client.get_live_address(StreamRequest("MOCK00000", 1))
+            finally:
+                client.close()
+            assert excinfo.value.code == code
+            assert server.calls[LIVE_ADDRESS] == expected_calls
+
+
+def test_rejected_token_is_renewed_once_then_fatal():
+    policy = RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.001)
+    assert classify_code("10002") == FATAL
+    with MockEzvizServer(devices=1, error_rate=1.0, error_code="10002") as server:
+        client = EzvizClient("key", "secret", base_url=server.url, retry_policy=policy)
+        try:
+            with pytest.raises(EzvizApiError):
+                client.get_live_address(StreamRequest("MOCK00000", 1))
+        finally:
+            client.close()
+        assert server.calls[LIVE_ADDRESS] == 2
+        assert server.calls["/api/lapp/token/get"] == 2
+
+
+def test_token_only_client_does_not_retry_rejected_token(server):
+    policy = RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.001)
+    client = EzvizClient(access_token="unknown", area_domain=server.url, retry_policy=policy)
+    try:
+        with pytest.raises(EzvizApiError) as excinfo:
+            client.get_live_address(StreamRequest("MOCK00000", 1))
+    finally:
+        client.close()
+    assert excinfo.value.code == "10002"
+    assert server.calls[LIVE_ADDRESS] == 1
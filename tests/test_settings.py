@@ -0,0 +1,87 @@
+import io
+
+import pytest
+
+from ezviz_stream import ConfigSync, discover
+from ezviz_stream.mockserver import error
+from ezviz_stream.settings import (CHANGED, FAILED, PLANNED, UNCHANGED, read_desired_state,
+                                   resolve_desired_state)
+
+PIR_GET = "/api/lapp/device/pir/get"
+SOUND_GET = "/api/lapp/device/sound/switch/status"
+
+
+def by_setting(results):
+    return {(r.device_serial, r.setting): r for r in results}
+
+
+def test_read_desired_state_accepts_list_and_lines():
+    assert read_desired_state(io.StringIO('[{"deviceSerial": "A", "sound": 1}]')) == \
+        [{"deviceSerial": "A", "sound": 1}]
+    lines = '# comment\n{"deviceSerial": "A", "sound": 1}\n\n{"deviceSerial": "B"}\n'
+    assert len(read_desired_state(io.StringIO(lines))) == 2
+
+
+def test_resolve_expands_wildcard_and_lets_devices_override(client):
+    index = discover(client)
+    desired = resolve_desired_state([
+        {"deviceSerial": "MOCK00001", "sound": "on"},
+        {"deviceSerial": "*", "sound": "off", "infrared": "on"},
+    ], index)
+    assert len(desired) == len(index)
+    assert desired[("MOCK00001", None)] == {"sound": 1, "infrared": 1}
+    assert desired[("MOCK00000", None)] == {"sound": 0, "infrared": 1}
+
+
+def test_resolve_rejects_unknown_settings_and_wildcard_without_index():
+    with pytest.raises(ValueError):
+        resolve_desired_state([{"deviceSerial": "A", "volume": 3}])
+    with pytest.raises(ValueError):
+        resolve_desired_state([{"deviceSerial": "*", "sound": "off"}])
+
+
+def test_sync_writes_only_differences(client):
+    desired = resolve_desired_state([{"deviceSerial": "MOCK00000", "sound": "off",
+                                      "infrared": "off"}])
+    first = by_setting(ConfigSync(client).run(desired))
+    assert first[("MOCK00000", "sound")].status == CHANGED
+    assert first[("MOCK00000", "infrared")].status == UNCHANGED
+    second = list(ConfigSync(client).run(desired))
+    assert [r.status for r in second] == [UNCHANGED, UNCHANGED]
+
+
+def test_dry_run_writes_nothing(server, client):
+    desired = resolve_desired_state([{"deviceSerial": "MOCK00000", "sound": "off"}])
+    [result] = ConfigSync(client, dry_run=True).run(desired)
+    assert result.status == PLANNED
+    [result] = ConfigSync(client).run(desired)
+    assert result.status == CHANGED
+
+
+def test_unsupported_setting_does_not_block_the_others(server, client):
+    server.routes[PIR_GET] = lambda form: error(20015, "Device does not support this function")
+    desired = resolve_desired_state([{"deviceSerial": "MOCK00000", "pir": "0,0,0,0,0,0",
+                                      "sound": "off"}])
+    results = by_setting(ConfigSync(client).run(desired))
+    assert results[("MOCK00000", "pir")].status == FAILED
+    assert results[("MOCK00000", "sound")].status == CHANGED
+
+
+def test_unknown_device_fails_every_setting_after_one_call(server, client):
+    desired = resolve_desired_state([{"deviceSerial": "NOPE", "sound": "off",
+                                      "infrared": "on"}])
+    results = list(ConfigSync(client).run(desired))
+    assert [r.status for r in results] == [FAILED, FAILED]
+    assert {r.code for r in results} == {"20002"}
+    assert server.calls[SOUND_GET] + server.calls["/api/lapp/device/infrared/switch/get"] == 1
+
+
+def test_offline_devices_in_index_are_not_called(server, client):
+    index = discover(client)
+    offline = [device.serial for device in index if not device.online]
+    desired = resolve_desired_state([{"deviceSerial": serial, "sound": "off"}
+                                     for serial in offline], index)
+    calls = server.calls[SOUND_GET]
+    results = list(ConfigSync(client, index=index).run(desired))
+    assert results and all(r.code == "20007" for r in results)
+    assert server.calls[SOUND_GET] == calls
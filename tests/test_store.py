@@ -0,0 +1,67 @@
+from ezviz_stream.mockserver import error
+from ezviz_stream.store import SnapshotStore, fingerprint, sync
+
+CAMERA_LIST = "/api/lapp/device/camera/list"
+DEVICE_LIST = "/api/lapp/device/list"
+
+
+def open_store(tmp_path):
+    return SnapshotStore(str(tmp_path / "fleet.db"))
+
+
+def test_fingerprint_ignores_key_order():
+    assert fingerprint({"a": 1, "b": 2}) == fingerprint({"b": 2, "a": 1})
+    assert fingerprint({"a": 1}) != fingerprint({"a": 2})
+
+
+def test_first_sync_fetches_every_device(tmp_path, server, client):
+    with open_store(tmp_path) as store:
+        result = sync(client, store)
+        assert (result.added, result.refreshed, result.unchanged) == (6, 0, 0)
+        assert server.calls[CAMERA_LIST] == 6
+        assert len(store.load_index()) == 6
+
+
+def test_recent_snapshot_is_served_without_listing(tmp_path, server, client):
+    with open_store(tmp_path) as store:
+        sync(client, store)
+        result = sync(client, store)
+        assert not result.listed
+        assert result.unchanged == 6
+        assert server.calls[DEVICE_LIST] == 1
+
+
+def test_only_changed_or_old_devices_are_refetched(tmp_path, server, client):
+    with open_store(tmp_path) as store:
+        sync(client, store)
+        server.devices["MOCK00001"]["deviceName"] = "Renamed"
+        result = sync(client, store, force=True)
+        assert (result.refreshed, result.unchanged) == (1, 5)
+        assert server.calls[CAMERA_LIST] == 7
+        assert store.load_index().get("MOCK00001").name == "Renamed"
+        result = sync(client, store, force=True, max_age=0)
+        assert result.refreshed == 6
+
+
+def test_unlisted_devices_are_removed(tmp_path, server, client):
+    with open_store(tmp_path) as store:
+        sync(client, store)
+        del server.devices["MOCK00004"]
+        result = sync(client, store, force=True)
+        assert result.removed == 1
+        assert "MOCK00004" not in result.index
+        assert "MOCK00004" not in store.load_index()
+
+
+def test_failed_channel_fetch_keeps_list_entry_and_retries(tmp_path, server, client):
+    with open_store(tmp_path) as store:
+        sync(client, store)
+        server.devices["MOCK00001"]["status"] = 0
+        handle_camera_list = server.routes[CAMERA_LIST]
+        server.routes[CAMERA_LIST] = lambda form: error(20008, "Device response timeout")
+        result = sync(client, store, force=True)
+        assert (result.refreshed, result.failed) == (1, 1)
+        assert not store.load_index().get("MOCK00001").online
+        server.routes[CAMERA_LIST] = handle_camera_list
+        result = sync(client, store, force=True)
+        assert (result.refreshed, result.failed) == (1, 0)
@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ezviz_stream import EzvizClient, StreamRequest, Token, TokenCache, TokenManager
+from ezviz_stream.mockserver import MockEzvizServer
+from ezviz_stream.tokens import MIN_REFRESH_INTERVAL, RefreshSchedule
+
+TOKEN_PATH = "/api/lapp/token/get"
+
+
+def token(name, lifetime):
+    return Token(name, "https://open.example.com", int((time.time() + lifetime) * 1000))
+
+
+class Fetcher:
+    def __init__(self, lifetime=7 * 86400, delay=0.0):
+        self.lifetime = lifetime
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, app_key, app_secret):
+        with self._lock:
+            self.calls += 1
+            number = self.calls
+        time.sleep(self.delay)
+        return token(f"{app_key}-{number}", self.lifetime)
+
+
+def test_valid_token_is_reused():
+    fetch = Fetcher()
+    manager = TokenManager(fetch)
+    first = manager.get_token("key", "secret")
+    assert manager.get_token("key", "secret") == first
+    assert fetch.calls == 1
+
+
+def test_concurrent_callers_share_one_fetch():
+    fetch = Fetcher(delay=0.05)
+    manager = TokenManager(fetch)
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        tokens = list(executor.map(lambda _: manager.get_token("key", "secret"), range(16)))
+    assert fetch.calls == 1
+    assert len(set(tokens)) == 1
+
+
+def test_token_inside_margin_is_served_while_renewed_in_background():
+    fetch = Fetcher()
+    cache = TokenCache()
+    cache.put("key", token("old", 60))
+    manager = TokenManager(fetch, cache, refresh_margin=600)
+    assert manager.get_token("key", "secret").access_token == "old"
+    deadline = time.time() + 5
+    while cache.get("key").access_token == "old" and time.time() < deadline:
+        time.sleep(0.01)
+    assert cache.get("key").access_token == "key-1"
+
+
+def test_token_shorter_than_margin_is_renewed_half_way():
+    schedule = RefreshSchedule(refresh_margin=600)
+    short = token("short", 300)
+    schedule.renewed("key", short, now=time.time())
+    assert 140 < schedule.due_in("key", short) <= 150
+    tiny = token("tiny", 10)
+    schedule.renewed("key", tiny)
+    assert schedule.due_in("key", tiny) > MIN_REFRESH_INTERVAL - 1
+
+
+def test_short_lived_tokens_are_not_refetched_in_a_loop():
+    with MockEzvizServer(devices=1, token_ttl=300) as server:
+        client = EzvizClient("key", "secret", base_url=server.url)
+        client.token_manager.start()
+        try:
+            for _ in range(20):
+                client.get_live_address(StreamRequest("MOCK00000", 1))
+            time.sleep(0.3)
+        finally:
+            client.token_manager.stop()
+            client.close()
+        assert server.calls[TOKEN_PATH] == 1
+
+
+def test_expired_token_is_fetched_again():
+    fetch = Fetcher()
+    cache = TokenCache()
+    cache.put("key", token("old", -1))
+    assert TokenManager(fetch, cache).get_token("key", "secret").access_token == "key-1"
+
+
+def test_cache_file_survives_restart_and_is_private(tmp_path):
+    path = str(tmp_path / "tokens.json")
+    TokenCache(path).put("key", token("saved", 3600))
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    fetch = Fetcher()
+    assert TokenManager(fetch, TokenCache(path)).get_token("key", "secret").access_token == "saved"
+    assert fetch.calls == 0
+
+
+def test_remove_only_drops_the_given_token():
+    cache = TokenCache()
+    cache.put("key", token("current", 3600))
+    cache.remove("key", "stale")
+    assert cache.get("key").access_token == "current"
+    cache.remove("key", "current")
+    assert cache.get("key") is None
+
+
+def test_client_workers_authenticate_once(server):
+    client = EzvizClient("key", "secret", base_url=server.url)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(executor.map(
+                lambda i: client.get_live_address(StreamRequest(f"MOCK0000{i % 2}", 1)),
+                range(16)))
+    finally:
+        client.close()
+    assert all(response["code"] == "200" for response in responses)
+    assert server.calls[TOKEN_PATH] == 1